@@ -1,20 +1,37 @@
 # scrapyd_manager/admin.py
+import json
+import time
 from functools import wraps
 
 from django.contrib import admin, messages
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from datetime import datetime
+from django.template.response import TemplateResponse
+from datetime import datetime, timedelta
 from django.utils.html import format_html
+from django.utils import timezone
 from django.urls import path
 from django.shortcuts import redirect
+from django.db.models import Q
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.functional import lazy
 from . import models
 from . import scrapyd_api
+from . import dispatcher
+from . import background
+from . import deploy
+from . import eggs
+from . import feeds
+from . import logs
+from . import polling
+from . import retention
+from . import rollups
 from . import forms
+from . import pagination
+from . import samples
+from .utils import get_setting
 import logging
 
 
@@ -69,41 +86,27 @@ class ScrapydSyncAdminMixin:
         return urls
 
 
+# 以下副作用都在事务提交后放入后台线程池并发执行, 不阻塞保存/删除请求
+
 @receiver(post_delete, sender=models.Project)
 def on_project_deleted(sender, instance: models.Project, **kwargs):
     if instance.sync_mode in (models.SyncMode.AUTO, models.SyncMode.SYNC):
         if instance.sync_status == models.SyncStatus.SUCCESS:
-            try:
-                scrapyd_api.delete_project(instance)
-            except Exception as e:
-                logger.exception(e)
-                instance.sync_status = models.SyncStatus.FAILED
-                instance.save()
+            background.submit_on_commit(deploy.undeploy_project, instance)
 
 
 @receiver(post_delete, sender=models.ProjectVersion)
 def on_project_version_deleted(sender, instance: models.ProjectVersion, **kwargs):
     if instance.sync_mode in (models.SyncMode.AUTO, models.SyncMode.SYNC):
         if instance.sync_status == models.SyncStatus.SUCCESS:
-            try:
-                scrapyd_api.delete_version(instance)
-            except Exception as e:
-                logger.exception(e)
-                instance.sync_status = models.SyncStatus.FAILED
-                instance.save()
+            background.submit_on_commit(deploy.undeploy_version, instance)
 
 
 @receiver(post_save, sender=models.ProjectVersion)
 def on_project_version_save(sender, instance: models.ProjectVersion, created, **kwargs):
     if instance.sync_mode != models.SyncMode.NONE:
         if instance.sync_status == models.SyncStatus.PENDING:
-            try:
-                scrapyd_api.add_version(instance)
-                instance.sync_status = models.SyncStatus.SUCCESS
-            except Exception as e:
-                instance.sync_status = models.SyncStatus.FAILED
-                logger.exception(e)
-            instance.save(update_fields=["sync_status"])
+            deploy.submit_deploy(instance)
     else:
         logger.info(f"{instance.sync_mode} is {instance.sync_status}, ignored.")
 
@@ -136,16 +139,38 @@ class CustomFilter(admin.SimpleListFilter):
 
 @admin.register(models.Node)
 class NodeAdmin(admin.ModelAdmin):
-    list_display = ("name", "linked_url", "description", "related_projects", "auth", "daemon_status", "create_time")
+    list_display = ("name", "linked_url", "description", "related_projects", "auth", "max_slots", "dispatch_queue", "poll_interval", "daemon_status", "create_time")
     readonly_fields = ("create_time", "update_time")
 
+    def changelist_view(self, request, extra_context=None):
+        self._queue_stats = dispatcher.queue_stats()
+        return super().changelist_view(request, extra_context)
+
+    def dispatch_queue(self, obj: models.Node):
+        stats = getattr(self, "_queue_stats", {}).get(obj.id)
+        if not stats:
+            return "-"
+        wait = int((timezone.now() - stats["oldest"]).total_seconds())
+        href = f"{app_index_url}/{models.DispatchRequest._meta.model_name}/?node_id={obj.id}&status={models.DispatchStatus.QUEUED}"
+        return format_html('<a href="{}">{}个排队, 最长等待{}秒</a>', href, stats["depth"], wait)
+    dispatch_queue.short_description = "调度队列"
+
+    def poll_interval(self, obj: models.Node):
+        if not polling.adaptive_polling_enabled():
+            return "-"
+        state = polling.NodePollState.load(obj)
+        if state.is_due():
+            return f"{state.interval:g}秒, 待刷新"
+        return f"{state.interval:g}秒, {int(state.next_time - time.time())}秒后刷新"
+    poll_interval.short_description = "轮询间隔"
+
     def linked_url(self, obj: models.Node) -> str:
         return format_html(f"<a href='{obj.url}'>{obj.url}</a>")
     linked_url.short_description = "Scrapyd地址"
 
     def daemon_status(self, obj: models.Node):
         try:
-            return scrapyd_api.daemon_status(obj, timeout=0.5).get("status") == "ok"
+            return scrapyd_api.daemon_status(obj, timeout=0.5, record=False).get("status") == "ok"
         except Exception as e:
             logger.error(f"[scrapyd sync error]: {e}")
             return False
@@ -204,8 +229,9 @@ class ProjectAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
         return False
 
     def delete_queryset(self, request, queryset):
-        for obj in queryset:
-            obj.delete()
+        # 一次删除, Scrapyd 上的删除由 post_delete 在事务提交后并发执行
+        queryset.delete()
+        self.message_user(request, "Scrapyd 上的项目在后台删除, 删除失败的项目记录在 Scrapyd Remote Deletion 中定期重试", level=messages.INFO)
 
     def latest_version(self, obj: models.Project):
         version = obj.latest_version
@@ -238,21 +264,32 @@ class VersionProjectFilter(ProjectFilter):
 @admin.register(models.ProjectVersion)
 class ProjectVersionAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
     list_display = ("id", "linked_version", "project", "spider_count", "has_egg_file", "description", "scrapyd_exists", "sync_mode", "sync_status", "is_spider_synced", "create_time")
-    readonly_fields = ("is_spider_synced", "create_time", "update_time")
+    readonly_fields = ("is_spider_synced", "egg_sha256", "egg_size", "egg_stored_at", "egg_present", "create_time", "update_time")
     list_filter = (VersionNodeFilter, VersionProjectFilter)
     form = forms.ProjectVersionForm
+    actions = ["deploy_to_project_nodes", "preview_version_gc", "run_version_gc"]
     fields = (
         ("node", "sync_mode", "sync_status"),
         "project",
         "version",
         "description",
         "egg_file",
+        ("egg_present", "egg_size", "egg_stored_at"),
+        "egg_sha256",
     )
 
+    def delete_queryset(self, request, queryset):
+        queryset.delete()
+        self.message_user(request, "Scrapyd 上的版本在后台删除, 删除失败的版本记录在 Scrapyd Remote Deletion 中定期重试", level=messages.INFO)
+
+    def save_model(self, request, obj: models.ProjectVersion, form, change):
+        if "egg_file" in form.changed_data and form.cleaned_data.get("egg_file"):
+            eggs.fill_egg_metadata(obj, form.cleaned_data["egg_file"])
+        super().save_model(request, obj, form, change)
+
     def has_egg_file(self, obj: models.ProjectVersion):
-        if obj.egg_file and obj.egg_file.storage.exists(obj.egg_file.name):
-            return True
-        return False
+        # 使用持久化的元数据, 由 EggScanScheduler 定期刷新, 渲染列表时不访问存储
+        return bool(obj.egg_file) and obj.egg_present
     has_egg_file.boolean = True
     has_egg_file.short_description = "egg文件"
 
@@ -273,6 +310,41 @@ class ProjectVersionAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related("project", "project__node")
 
+    def deploy_to_project_nodes(self, request, queryset):
+        """并发部署到所有有同名项目的节点, 已有相同 egg 的节点跳过"""
+        for version in queryset:
+            if not version.egg_file:
+                messages.error(request, f"{version.full_path} 没有egg文件")
+                continue
+            try:
+                results = deploy.deploy_version(version, deploy.project_nodes(version))
+            except Exception as e:
+                messages.error(request, f"部署 {version.full_path} 失败: {e}")
+                continue
+            failed = {name: result for name, result in results.items() if result.startswith(deploy.DeployResult.FAILED)}
+            summary = ", ".join(f"{name}: {result}" for name, result in results.items())
+            level = messages.ERROR if failed else messages.SUCCESS
+            self.message_user(request, f"部署 {version.full_path}: {summary}", level=level)
+    deploy_to_project_nodes.short_description = "部署到同名项目的所有节点"
+
+    def _version_gc(self, request, queryset, dry_run: bool):
+        keep_last = get_setting("VERSION_GC_KEEP_LAST", 0) or 5
+        projects = models.Project.objects.filter(id__in=queryset.values("project_id"))
+        report = retention.collect_versions(keep_last, projects=projects, dry_run=dry_run)
+        prefix = "预计回收" if dry_run else "已回收"
+        self.message_user(request, f"保留每个项目最近{keep_last}个版本, {prefix}版本{len(report['versions'])}个: {', '.join(report['versions']) or '-'}", level=messages.INFO)
+        self.message_user(request, f"{prefix}egg文件{len(report['eggs'])}个: {', '.join(report['eggs']) or '-'}", level=messages.INFO)
+        for name, error in report["failed"].items():
+            self.message_user(request, f"回收 {name} 失败: {error}", level=messages.ERROR)
+
+    def preview_version_gc(self, request, queryset):
+        self._version_gc(request, queryset, dry_run=True)
+    preview_version_gc.short_description = "预览回收选中版本所在项目的旧版本"
+
+    def run_version_gc(self, request, queryset):
+        self._version_gc(request, queryset, dry_run=False)
+    run_version_gc.short_description = "回收选中版本所在项目的旧版本"
+
     class Media:
         js = ("admin/js/core.js", "admin/js/spider_group_linked.js")
 
@@ -378,8 +450,12 @@ class SpiderAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
     def start_spider_view(self, request, spider_id):
         spider = get_object_or_404(models.Spider, pk=spider_id)
         try:
-            job_id = scrapyd_api.start_spider(spider)
-            self.message_user(request, f"成功启动爬虫 {spider.name} (job_id={job_id})", level=messages.SUCCESS)
+            if scrapyd_api.dispatch_queue_enabled():
+                scrapyd_api.enqueue_spider(spider)
+                self.message_user(request, f"爬虫 {spider.name} 已加入调度队列", level=messages.SUCCESS)
+            else:
+                job_id = scrapyd_api.start_spider(spider)
+                self.message_user(request, f"成功启动爬虫 {spider.name} (job_id={job_id})", level=messages.SUCCESS)
         except Exception as e:
             self.message_user(request, f"启动失败: {e}", level=messages.ERROR)
         from django.shortcuts import redirect
@@ -410,8 +486,13 @@ class SpiderAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
         if not queryset:
             messages.error(request, "请选择要启动的爬虫")
             return
+        queue_enabled = scrapyd_api.dispatch_queue_enabled()
         for spider in queryset:
             try:
+                if queue_enabled:
+                    scrapyd_api.enqueue_spider(spider)
+                    messages.success(request, f"爬虫 {spider.name} 已加入调度队列")
+                    continue
                 job_id = scrapyd_api.start_spider(spider)
                 messages.success(request, f"成功启动爬虫 {spider.name} (job_id={job_id})")
             except Exception as e:
@@ -421,15 +502,16 @@ class SpiderAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
 
 @admin.register(models.SpiderGroup)
 class SpiderGroupAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
-    list_display = ("name", "code", "node", "project", "related_spiders", "formatted_kwargs", "formatted_settings", "formatted_version", "start_spider_group", "create_time")
+    list_display = ("name", "code", "node", "placement", "project", "related_spiders", "formatted_kwargs", "formatted_settings", "formatted_version", "start_spider_group", "create_time")
     readonly_fields = ("create_time", "update_time")
-    filter_horizontal = ("spiders", )
+    filter_horizontal = ("spiders", "node_pool")
     form = forms.SpiderGroupForm
     actions = ["start_group_spiders"]
-    list_filter = ("node",)
+    list_filter = ("node", "placement")
     fields = (
         ("name", "code"),
         ("node", "project"),
+        ("placement", "node_pool"),
         "version",
         "spiders",
         "description",
@@ -590,22 +672,24 @@ class JobStatusFilter(CustomFilter):
         return value
 
     def lookups(self, request, model_admin):
-        filters = [
-            (x, models.JobStatus[x.upper()].label) for x in models.Job.objects.values_list("status", flat=True).distinct()
-        ]
-        filters.sort()
-        return filters
+        # 状态是固定的枚举, 不需要每次渲染都对整张表做 SELECT DISTINCT
+        return sorted(models.JobStatus.choices) + [(self.archived, "已归档")]
+
+    archived = "archived"
 
 
 @admin.register(models.Job)
 class JobAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
     list_display = (
-        "job_id", "job_spider", "job_project_version", "start_time", "end_time", "status", "pid", "job_sample_records", "job_info", "stop_job",
+        "job_id", "job_spider", "job_project_version", "start_time", "end_time", "status", "pid", "job_sample_records", "job_info", "job_log", "job_items", "stop_job",
     )
     readonly_fields = ("create_time", "update_time", "start_time", "end_time", "pid", "log_url", "items_url", "spider", "status")
     list_filter = (JobStatusFilter, JobNodeFilter, JobProjectFilter)
     actions = ["stop_jobs"]
     ordering = ("-status", "-start_time")
+    # 大表使用 keyset 分页和缓存/估计的总数, 筛选时也不再统计全表总数
+    paginator = pagination.KeysetPaginator
+    show_full_result_count = False
 
     def has_change_permission(self, request, obj=None):
         return False
@@ -646,6 +730,29 @@ class JobAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
         return format_html(f'<a class="button" href="{href}">Job最新状态</a>',)
     job_info.short_description = "Job最新状态"
 
+    def job_log(self, obj: models.Job):
+        if not obj.log_url:
+            return "-"
+        href = f"{app_index_url}/{models.Job._meta.model_name}/{obj.id}/log/"
+        return format_html('<a class="button" href="{}" target="_blank">查看日志</a>', href)
+    job_log.short_description = "日志"
+
+    def job_items(self, obj: models.Job):
+        if not obj.items_url:
+            return "-"
+        href = f"{app_index_url}/{models.Job._meta.model_name}/{obj.id}/items/"
+        return format_html('<a class="button" href="{}" target="_blank">预览Item</a>', href)
+    job_items.short_description = "Item"
+
+    def changelist_view(self, request, extra_context=None):
+        if request.GET.get(JobStatusFilter.parameter_name) == JobStatusFilter.archived:
+            # 归档的任务在冷表中, 带上节点和项目筛选跳转到归档列表
+            query = request.GET.copy()
+            query.pop(JobStatusFilter.parameter_name)
+            href = f"{app_index_url}/{models.JobArchive._meta.model_name}/"
+            return redirect(f"{href}?{query.urlencode()}" if query else href)
+        return super().changelist_view(request, extra_context)
+
     def get_list_display(self, request):
         if request.method != "GET":
             return self.list_display
@@ -668,14 +775,105 @@ class JobAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
                 self.admin_site.admin_view(self.sync_job_info_view),
                 name="scrapy_job_stop",
             ),
+            path(
+                "<path:job_id>/log/",
+                self.admin_site.admin_view(self.tail_log_view),
+                name="scrapy_job_log",
+            ),
+            path(
+                "<path:job_id>/items/",
+                self.admin_site.admin_view(self.preview_items_view),
+                name="scrapy_job_items",
+            ),
         ]
         return custom_urls + urls
 
+    def tail_log_view(self, request, job_id):
+        """
+        增量拉取日志后返回本地缓存中 offset 之后的内容, 不传 offset 时返回最后 LOG_TAIL_BYTES 个字节
+        响应头 X-Log-Offset 为下次请求可以使用的 offset
+        """
+        job = models.Job.objects.filter(pk=job_id).first() or get_object_or_404(models.JobArchive, pk=job_id)
+        state = models.JobLogState.objects.filter(job_id=job.id).first()
+        if state and logs.has_archive(state):
+            return self.archived_log_view(request, state)
+        try:
+            state, _ = logs.fetch_new_bytes(job)
+        except Exception as e:
+            self.message_user(request, f"拉取日志失败: {e}", level=messages.ERROR)
+            return redirect(request.META.get("HTTP_REFERER", f"{app_index_url}/{models.Job._meta.model_name}/"))
+        offset = request.GET.get("offset", "")
+        offset = int(offset) if offset.isdigit() else state.offset - get_setting("LOG_TAIL_BYTES", 64 * 1024)
+        offset = min(max(offset, state.start), state.offset)
+        response = StreamingHttpResponse(logs.iter_cached(state, offset, state.offset - offset), content_type="text/plain; charset=utf-8")
+        response["X-Log-Start"] = offset
+        response["X-Log-Offset"] = state.offset
+        return response
+
+    @staticmethod
+    def archived_log_view(request, state: models.JobLogState):
+        """
+        读取本地归档的日志: ?offset=&size= 读取任意区间, 默认最后 LOG_TAIL_BYTES 个字节
+        ?level=error 只返回 ERROR/CRITICAL 行, ?grep= 按正则过滤行, 每行前加上行在日志中的偏移
+        """
+        level = {"warning": 7, "error": 6, "critical": 4}.get(request.GET.get("level", "").lower(), 0)
+        pattern = request.GET.get("grep", "").encode("utf-8")
+        with logs.ArchivedLog(state.archive_path) as log:
+            if level or pattern:
+                try:
+                    lines = log.grep(pattern or None, levels=level, limit=get_setting("LOG_GREP_LIMIT", 1000))
+                except ValueError as e:
+                    return HttpResponseBadRequest(str(e), content_type="text/plain; charset=utf-8")
+                content = b"".join(b"%d: %s\n" % (offset, line) for offset, line in lines)
+                start, end = 0, log.size
+            else:
+                size = request.GET.get("size", "")
+                size = int(size) if size.isdigit() else get_setting("LOG_TAIL_BYTES", 64 * 1024)
+                offset = request.GET.get("offset", "")
+                start = int(offset) if offset.isdigit() else max(0, log.size - size)
+                content = log.read(start, size)
+                end = start + len(content)
+        response = HttpResponse(content, content_type="text/plain; charset=utf-8")
+        response["X-Log-Start"] = start
+        response["X-Log-Offset"] = end
+        return response
+
+    def preview_items_view(self, request, job_id):
+        """
+        预览任务抓取的 Item: 默认返回开头 ITEMS_PREVIEW_LIMIT 条, ?limit= 指定条数, ?tail=1 返回最后几条
+        最多读取 ITEMS_PREVIEW_MAX_BYTES 个字节; ?format=json 时返回原始 JSON
+        """
+        job = models.Job.objects.filter(pk=job_id).first() or get_object_or_404(models.JobArchive, pk=job_id)
+        if not job.items_url:
+            self.message_user(request, f"任务{job.job_id}没有items文件", level=messages.WARNING)
+            return redirect(request.META.get("HTTP_REFERER", f"{app_index_url}/{models.Job._meta.model_name}/"))
+        limit = request.GET.get("limit", "")
+        limit = min(max(int(limit), 1), 1000) if limit.isdigit() else get_setting("ITEMS_PREVIEW_LIMIT", 20)
+        try:
+            preview = feeds.preview_items(
+                job, limit=limit, max_bytes=get_setting("ITEMS_PREVIEW_MAX_BYTES", 1024 * 1024), tail=request.GET.get("tail") == "1",
+            )
+        except Exception as e:
+            self.message_user(request, f"预览Item失败: {e}", level=messages.ERROR)
+            return redirect(request.META.get("HTTP_REFERER", f"{app_index_url}/{models.Job._meta.model_name}/"))
+        if request.GET.get("format") == "json":
+            return JsonResponse(preview, json_dumps_params={"ensure_ascii": False, "indent": 2})
+        return TemplateResponse(request, "admin/django_scrapyd_manager/job/preview_items.html", {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": f"预览Item: {job.job_id}",
+            "preview": preview,
+            "items": [json.dumps(item, ensure_ascii=False, indent=2) for item in preview["items"]],
+            "end": preview["start"] + preview["bytes"],
+            "limit": limit,
+            "tail": request.GET.get("tail") == "1",
+        })
+
     def sync_job_info_view(self, request, job_id):
         job = get_object_or_404(models.Job, pk=job_id)
         try:
             info = scrapyd_api.get_job_info(job)
-            models.JobInfoLog.objects.create(job=job, info=info)
+            samples.save_job_info(job, info)
             self.message_user(request, f"Job日志同步成功 {job.job_id} ({job.spider.name})", level=messages.SUCCESS)
         except Exception as e:
             self.message_user(request, f"Job日志同步失败: {e}", level=messages.ERROR)
@@ -719,14 +917,118 @@ class JobAdmin(ScrapydSyncAdminMixin, admin.ModelAdmin):
         return get_object_or_404(models.Job, pk=object_id)
 
 
+@admin.register(models.JobArchive)
+class JobArchiveAdmin(admin.ModelAdmin):
+    list_display = (
+        "job_id", "job_spider", "node", "project", "start_time", "end_time", "archive_time", "job_sample_records",
+    )
+    list_filter = (JobNodeFilter, JobProjectFilter)
+    ordering = ("-start_time", )
+    paginator = pagination.KeysetPaginator
+    show_full_result_count = False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+    def job_spider(self, obj: models.JobArchive):
+        return obj.spider.name
+    job_spider.admin_order_field = "spider__name"
+    job_spider.short_description = "爬虫名称"
+
+    def job_sample_records(self, obj: models.JobArchive):
+        href = f"{app_index_url}/{models.JobInfoLog._meta.model_name}/?job={obj.id}"
+        return format_html('<a class="button" href="{}">采样记录</a>', href)
+    job_sample_records.short_description = "日志记录"
+
+    def changelist_view(self, request, extra_context=None):
+        href = f"{app_index_url}/{models.Job._meta.model_name}/?{JobStatusFilter.parameter_name}={models.JobStatus.FINISHED}"
+        self.message_user(request, format_html('这里是已归档的历史任务, <a href="{}">返回任务列表</a>', href), level=messages.INFO)
+        return super().changelist_view(request, extra_context)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("spider", "node", "project")
+
+
+class ArchivedJobMixin:
+    """关联到 Job 的记录在任务被归档后, 从 JobArchive 中查找任务"""
+
+    def changelist_view(self, request, extra_context=None):
+        self._archived_jobs = {}
+        return super().changelist_view(request, extra_context)
+
+    def _job(self, obj) -> models.BaseJob | None:
+        """任务被归档后 Job 表中已不存在, 从 JobArchive 中查找"""
+        try:
+            job = obj.job
+        except models.Job.DoesNotExist:
+            job = None
+        if job is not None:
+            return job
+        archived_jobs = getattr(self, "_archived_jobs", {})
+        if obj.job_id not in archived_jobs:
+            archived_jobs[obj.job_id] = models.JobArchive.objects.select_related("node", "project").filter(pk=obj.job_id).first()
+        return archived_jobs[obj.job_id]
+
+
+class JobInfoLogJobFilter(CustomFilter):
+    """
+    按任务的字段筛选采样: 分别在 Job 和 JobArchive 上按索引查出任务 id 再用 IN 子查询过滤,
+    不关联热表, 任务归档后其采样仍能筛选出来
+    """
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            lookup = {self.parameter_name: value}
+            return queryset.filter(
+                Q(job_id__in=models.Job.objects.filter(**lookup).values("id"))
+                | Q(job_id__in=models.JobArchive.objects.filter(**lookup).values("id"))
+            )
+        return queryset
+
+
+class JobInfoLogNodeFilter(JobInfoLogJobFilter):
+    title = "节点"
+    parameter_name = "node_id"
+
+    def lookups(self, request, model_admin):
+        return list(models.Node.objects.order_by("name").values_list("id", "name"))
+
+
+class JobInfoLogProjectFilter(JobInfoLogJobFilter):
+    title = "项目"
+    parameter_name = "project_id"
+
+    def lookups(self, request, model_admin):
+        projects = models.Project.objects.select_related("node").order_by("node__name", "name")
+        node_id = request.GET.get(JobInfoLogNodeFilter.parameter_name)
+        if node_id:
+            projects = projects.filter(node_id=node_id)
+        return [(project.id, f"{project.node.name}/{project.name}") for project in projects]
+
+
+class JobInfoLogSpiderFilter(JobInfoLogJobFilter):
+    title = "爬虫"
+    parameter_name = "spider_id"
+
+    def lookups(self, request, model_admin):
+        return list(models.SpiderRegistry.objects.order_by("name").values_list("id", "name"))
+
+
 @admin.register(models.JobInfoLog)
-class JobInfoLogAdmin(admin.ModelAdmin):
+class JobInfoLogAdmin(ArchivedJobMixin, admin.ModelAdmin):
     list_display = (
-        "job", "job_node", "job_project",
+        "log_job", "job_node", "job_project",
     )
 
-    list_filter = ("job__node", "job__project", "job__spider")
+    list_filter = (JobInfoLogNodeFilter, JobInfoLogProjectFilter, JobInfoLogSpiderFilter)
     ordering = ("-job_id", "-create_time")
+    paginator = pagination.KeysetPaginator
+    show_full_result_count = False
+    fields = readonly_fields = ("log_job", "create_time", "codec", "base", "formatted_info")
 
     def has_change_permission(self, request, obj=None):
         return False
@@ -734,38 +1036,262 @@ class JobInfoLogAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
+    def formatted_info(self, obj: models.JobInfoLog):
+        info = json.dumps(obj.get_info(), ensure_ascii=False, indent=2, default=str)
+        return format_html('<pre style="margin: 0">{}</pre>', info)
+    formatted_info.short_description = "详情"
+
+    def log_job(self, obj: models.JobInfoLog):
+        return self._job(obj) or "-"
+    log_job.admin_order_field = "job_id"
+    log_job.short_description = "Job"
+
     def job_id(self, obj: models.JobInfoLog):
-        return obj.job.job_id
+        job = self._job(obj)
+        return job.job_id if job else "-"
     job_id.short_description = "JobId"
 
     def job_node(self, obj: models.JobInfoLog):
-        return obj.job.node
-    job_node.admin_order_field = "node_id"
+        job = self._job(obj)
+        return job.node if job else "-"
     job_node.short_description = "节点名称"
 
     def job_project(self, obj: models.JobInfoLog):
-        return obj.job.project
-    job_project.admin_order_field = "project"
+        job = self._job(obj)
+        return job.project if job else "-"
     job_project.short_description = "项目名称"
 
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related("job")
+        return super().get_queryset(request).prefetch_related("job", "job__node", "job__project")
+
+
+class RollupResolutionFilter(CustomFilter):
+    parameter_name = "resolution"
+    title = "粒度"
+
+    def value(self):
+        return super().value() or str(models.RollupResolution.MINUTE)
+
+    def lookups(self, request, model_admin):
+        return models.RollupResolution.choices
+
+
+class RollupSpiderFilter(CustomFilter):
+    parameter_name = "spider_id"
+    title = "爬虫"
+
+    def lookups(self, request, model_admin):
+        return list(models.SpiderRegistry.objects.order_by("name").values_list("id", "name"))
+
+
+class RollupGroupFilter(CustomFilter):
+    parameter_name = "group_id"
+    title = "爬虫组"
+
+    def lookups(self, request, model_admin):
+        return list(models.SpiderGroup.objects.order_by("name").values_list("id", "name"))
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            return queryset.filter(spider__in=models.SpiderRegistry.objects.filter(spiders__id=value))
+        return queryset
+
+
+@admin.register(models.ThroughputRollup)
+class ThroughputRollupAdmin(admin.ModelAdmin):
+    list_display = ("bucket", "resolution", "node", "spider", "items", "requests", "errors", "items_per_minute", "requests_per_minute")
+    list_filter = (RollupResolutionFilter, JobNodeFilter, RollupSpiderFilter, RollupGroupFilter)
+    ordering = ("-bucket", )
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+    def items_per_minute(self, obj: models.ThroughputRollup):
+        return round(obj.items * 60 / obj.resolution, 2)
+    items_per_minute.short_description = "Item/分钟"
+
+    def requests_per_minute(self, obj: models.ThroughputRollup):
+        return round(obj.requests * 60 / obj.resolution, 2)
+    requests_per_minute.short_description = "响应/分钟"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path(
+                "api/chart/",
+                self.admin_site.admin_view(self.chart_view),
+                name="throughput_chart",
+            ),
+        ]
+        return custom_urls + urls
+
+    def chart_view(self, request):
+        """图表数据, 使用与列表页相同的筛选条件, 只读取 rollup 表"""
+        changelist = self.get_changelist_instance(request)
+        resolution = next(int(spec.value()) for spec in changelist.filter_specs if isinstance(spec, RollupResolutionFilter))
+        since = timezone.now() - timedelta(seconds=resolution * get_setting("ROLLUP_CHART_POINTS", 120))
+        series = rollups.throughput_series(changelist.queryset.filter(bucket__gte=since), resolution)
+        return JsonResponse({"resolution": resolution, "series": series})
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("node", "spider")
+
+    class Media:
+        js = ("admin/js/core.js", "admin/js/throughput_chart.js")
+
+
+class LogErrorSpiderFilter(RollupSpiderFilter):
+    pass
+
+
+class LogErrorSignatureSpiderFilter(LogErrorSpiderFilter):
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value:
+            return queryset.filter(id__in=models.LogErrorOccurrence.objects.filter(spider_id=value).values("signature_id"))
+        return queryset
+
+
+@admin.register(models.LogErrorSignature)
+class LogErrorSignatureAdmin(admin.ModelAdmin):
+    list_display = ("title", "exception", "level", "logger", "count", "error_jobs", "first_seen", "last_seen")
+    list_filter = ("level", LogErrorSignatureSpiderFilter)
+    # 签名精确匹配走唯一索引
+    search_fields = ("=signature", "exception", "title")
+    ordering = ("-last_seen", )
+    fields = readonly_fields = ("signature", "level", "logger", "exception", "title", "count", "job_count", "first_seen", "last_seen", "formatted_sample")
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+    def error_jobs(self, obj: models.LogErrorSignature):
+        href = f"{app_index_url}/{models.LogErrorOccurrence._meta.model_name}/?signature={obj.id}"
+        return format_html('<a href="{}">{}</a>', href, obj.job_count)
+    error_jobs.admin_order_field = "job_count"
+    error_jobs.short_description = "任务数"
+
+    def formatted_sample(self, obj: models.LogErrorSignature):
+        return format_html('<pre style="margin: 0">{}</pre>', obj.sample)
+    formatted_sample.short_description = "示例"
+
+
+@admin.register(models.LogErrorOccurrence)
+class LogErrorOccurrenceAdmin(ArchivedJobMixin, admin.ModelAdmin):
+    list_display = ("signature", "error_job", "node", "spider", "count", "first_seen", "last_seen", "error_log")
+    list_filter = (LogErrorSpiderFilter, JobNodeFilter)
+    search_fields = ("=signature__signature", )
+    ordering = ("-last_seen", "-id")
+    paginator = pagination.KeysetPaginator
+    show_full_result_count = False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+    def error_job(self, obj: models.LogErrorOccurrence):
+        return self._job(obj) or "-"
+    error_job.admin_order_field = "job_id"
+    error_job.short_description = "Job"
+
+    def error_log(self, obj: models.LogErrorOccurrence):
+        href = f"{app_index_url}/{models.Job._meta.model_name}/{obj.job_id}/log/?offset={obj.first_offset}"
+        return format_html('<a class="button" href="{}" target="_blank">查看日志</a>', href)
+    error_log.short_description = "日志"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("signature", "node", "spider")
+
+
+@admin.register(models.DispatchRequest)
+class DispatchRequestAdmin(admin.ModelAdmin):
+    list_display = (
+        "id", "spider_name", "node", "priority", "status", "wait_time", "attempts", "job_id", "enqueue_time", "dispatch_time",
+    )
+    list_editable = ("priority",)
+    list_filter = ("status", JobNodeFilter)
+    readonly_fields = ("node", "spider", "spider_name", "fp", "kwargs", "settings", "status", "attempts", "next_attempt_time", "job_id", "message", "enqueue_time", "dispatch_time", "create_time", "update_time")
+    actions = ["cancel_requests", "dispatch_now"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def wait_time(self, obj: models.DispatchRequest):
+        return f"{obj.wait_seconds}秒"
+    wait_time.short_description = "等待时间"
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        stats = dispatcher.queue_stats().values()
+        depth = sum(x["depth"] for x in stats)
+        if depth:
+            oldest = min(x["oldest"] for x in stats)
+            wait = int((timezone.now() - oldest).total_seconds())
+            self.message_user(request, f"当前排队{depth}个任务, 最长等待{wait}秒", level=messages.INFO)
+        return super().changelist_view(request, extra_context)
+
+    def cancel_requests(self, request, queryset):
+        updated = queryset.filter(status=models.DispatchStatus.QUEUED).update(status=models.DispatchStatus.CANCELLED)
+        self.message_user(request, f"已取消{updated}个排队任务", level=messages.SUCCESS)
+    cancel_requests.short_description = "取消选中的排队任务"
+
+    def dispatch_now(self, request, queryset):
+        """忽略 pending 阈值立即下发"""
+        for obj in queryset.filter(status=models.DispatchStatus.QUEUED):
+            attempts = obj.attempts
+            if dispatcher.dispatch_request(obj):
+                messages.success(request, f"{obj} 下发成功 (job_id={obj.job_id})")
+            elif obj.status == models.DispatchStatus.QUEUED and obj.attempts == attempts:
+                messages.warning(request, f"{obj} 已被其他进程下发")
+            else:
+                messages.error(request, f"{obj} 下发失败")
+    dispatch_now.short_description = "立即下发选中的排队任务"
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("node", "spider")
 
 
 @admin.register(models.Guardian)
 class GuardianAdmin(admin.ModelAdmin):
     list_display = (
-        "id", "spider_group", "strategy", "description", "enable", "last_action", "interval", "last_check", "create_time",
+        "id", "spider_group", "strategy", "description", "enable", "quarantine_status", "last_action", "interval", "last_check", "create_time",
     )
     list_editable = ("enable",)
-    readonly_fields = ("last_action", "create_time", "update_time")
+    list_filter = ("strategy", "quarantined")
+    readonly_fields = ("last_action", "quarantined", "quarantine_status", "create_time", "update_time")
+    actions = ["release_quarantine"]
     fields = (
         ("spider_group", "strategy", "enable",),
         ("last_check", "last_action"),
         "interval",
+        ("backoff_base", "backoff_max"),
+        ("restart_budget", "budget_window"),
+        ("quarantined", "quarantine_status"),
         "create_time"
     )
 
+    def quarantine_status(self, obj: models.Guardian):
+        spiders = obj.quarantined_spiders
+        if not spiders:
+            return "-"
+        return format_html('<span style="color: red; line-height: 1">{}</span>', ", ".join(spiders))
+    quarantine_status.short_description = "已隔离爬虫"
+
+    def release_quarantine(self, request, queryset):
+        """清空重启状态, guardian 下一轮检测时重新开始计数"""
+        updated = queryset.update(restart_state={}, quarantined=False)
+        self.message_user(request, f"已解除{updated}个守护任务的隔离", level=messages.SUCCESS)
+    release_quarantine.short_description = "解除隔离并重置重启计数"
+
     def get_queryset(self, request):
         return super().get_queryset(request).prefetch_related("spider_group", "spider_group__spiders")
 
@@ -773,9 +1299,11 @@ class GuardianAdmin(admin.ModelAdmin):
 @admin.register(models.GuardianLog)
 class GuardianLogAdmin(admin.ModelAdmin):
     list_display = (
-        "id", "guardian", "node", "spider_name", "action", "reason", "success", "create_time",
+        "id", "guardian", "node", "spider_name", "action", "reason", "success", "repeat_count", "create_time", "last_time",
     )
     ordering = ("-create_time", )
+    paginator = pagination.KeysetPaginator
+    show_full_result_count = False
 
     def has_change_permission(self, request, obj = ...):
         return False
@@ -786,3 +1314,69 @@ class GuardianLogAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.select_related("guardian", "node", "group", "spider")
+
+
+@admin.register(models.GuardianLogDaily)
+class GuardianLogDailyAdmin(admin.ModelAdmin):
+    list_display = ("date", "guardian", "node", "spider_name", "action", "success", "count")
+    list_filter = ("action", "success")
+    date_hierarchy = "date"
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("guardian", "node")
+
+
+@admin.register(models.RemoteDeletion)
+class RemoteDeletionAdmin(admin.ModelAdmin):
+    list_display = ("id", "node", "project", "version", "attempts", "message", "update_time")
+    list_filter = ("node",)
+    search_fields = ("project", "version")
+    readonly_fields = ("node", "project", "version", "attempts", "message", "create_time", "update_time")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.SchedulerLease)
+class SchedulerLeaseAdmin(admin.ModelAdmin):
+    list_display = ("name", "owner", "token", "acquire_time", "expire_time", "is_alive")
+    readonly_fields = ("name", "owner", "token", "acquire_time", "expire_time", "create_time", "update_time")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def is_alive(self, obj: models.SchedulerLease):
+        return obj.expire_time > timezone.now()
+    is_alive.boolean = True
+    is_alive.short_description = "持有中"
+
+
+@admin.register(models.SchedulerWorker)
+class SchedulerWorkerAdmin(admin.ModelAdmin):
+    list_display = ("name", "scheduler", "nodes", "heartbeat", "is_alive")
+    list_filter = ("scheduler",)
+    readonly_fields = ("name", "scheduler", "nodes", "heartbeat", "create_time")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def is_alive(self, obj: models.SchedulerWorker):
+        ttl = get_setting("GUARDIAN_LEASE_TTL", 10)
+        return (timezone.now() - obj.heartbeat).total_seconds() < ttl
+    is_alive.boolean = True
+    is_alive.short_description = "存活"
@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from logging import getLogger
+from threading import Lock
+from django.db import close_old_connections, transaction
+from .utils import get_setting
+
+
+logger = getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """进程内共享的后台线程池, 用于执行请求 Scrapyd 的副作用"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_setting("BACKGROUND_MAX_WORKERS", 8), thread_name_prefix="scrapyd-bg")
+        return _executor
+
+
+def _run(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        logger.exception(e)
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs) -> Future:
+    return get_executor().submit(_run, func, *args, **kwargs)
+
+
+def submit_on_commit(func, *args, **kwargs):
+    """当前事务提交后再提交到后台线程池, 事务回滚时不执行; 不在事务中时立即提交"""
+    transaction.on_commit(lambda: submit(func, *args, **kwargs))
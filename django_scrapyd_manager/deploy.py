@@ -0,0 +1,166 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from django.db import close_old_connections
+from . import models, scrapyd_api, background
+from .utils import get_setting
+
+
+logger = getLogger(__name__)
+
+
+class DeployResult:
+    DEPLOYED = "deployed"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+
+def egg_sha256(version: models.ProjectVersion) -> str:
+    """按块计算 egg 文件的 sha256 并保存, 已计算过时直接返回"""
+    if version.egg_sha256:
+        return version.egg_sha256
+    if not version.egg_file:
+        raise ValueError(f"{version.full_path}没有egg文件")
+    digest = hashlib.sha256()
+    with version.egg_file.storage.open(version.egg_file.name, "rb") as f:
+        while chunk := f.read(scrapyd_api.MultipartEggBody.chunk_size):
+            digest.update(chunk)
+    version.egg_sha256 = digest.hexdigest()
+    if version.pk:
+        models.ProjectVersion.objects.filter(pk=version.pk).update(egg_sha256=version.egg_sha256)
+    return version.egg_sha256
+
+
+def node_versions(version: models.ProjectVersion, node: models.Node):
+    return models.ProjectVersion.objects.filter(project__node=node, project__name=version.project.name, version=version.version)
+
+
+def deploy_to_node(version: models.ProjectVersion, node: models.Node, sha256: str) -> str:
+    """把 version 的 egg 部署到 node, node 上同一项目已有相同内容的同名版本时跳过"""
+    try:
+        if node_versions(version, node).filter(egg_sha256=sha256, scrapyd_exists=True).exists():
+            return DeployResult.SKIPPED
+        try:
+            scrapyd_api.add_version(version, node=node)
+        except Exception:
+            node_versions(version, node).update(sync_status=models.SyncStatus.FAILED)
+            raise
+        if node.id == version.project.node_id:
+            target = version
+        else:
+            project, _ = models.Project.objects.get_or_create(node=node, name=version.project.name)
+            target = models.ProjectVersion.objects.filter(project=project, version=version.version).first()
+            if target is None:
+                target = models.ProjectVersion(project=project, version=version.version, description=version.description)
+            target.egg_file = version.egg_file.name
+            target.egg_size, target.egg_stored_at, target.egg_present = version.egg_size, version.egg_stored_at, version.egg_present
+        target.egg_sha256 = sha256
+        target.scrapyd_exists = True
+        target.sync_status = models.SyncStatus.SUCCESS
+        if target.pk:
+            target.save(update_fields=[
+                "egg_file", "egg_sha256", "egg_size", "egg_stored_at", "egg_present", "scrapyd_exists", "sync_status", "update_time",
+            ])
+        else:
+            target.save()
+        scrapyd_api.sync_project_version_spiders(target)
+        return DeployResult.DEPLOYED
+    finally:
+        close_old_connections()
+
+
+def deploy_version(version: models.ProjectVersion, nodes=None, max_workers: int = None) -> dict[str, str]:
+    """
+    并发把一个版本的 egg 部署到多个节点, 默认只部署到版本所在节点
+    每个节点独立按块读取 egg 上传, 返回 {节点名: 结果}
+    """
+    nodes = list(nodes) if nodes is not None else [version.project.node]
+    if not nodes:
+        return {}
+    sha256 = egg_sha256(version)
+    max_workers = min(len(nodes), max_workers or get_setting("DEPLOY_MAX_WORKERS", 8))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="deploy") as executor:
+        futures = {node.name: executor.submit(deploy_to_node, version, node, sha256) for node in nodes}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logger.error(f"部署{version.full_path}到节点{name}失败: {e}")
+            results[name] = f"{DeployResult.FAILED}: {e}"
+    return results
+
+
+def project_nodes(version: models.ProjectVersion):
+    """部署了同名项目的所有节点"""
+    return models.Node.objects.filter(projects__name=version.project.name).distinct()
+
+
+def _deploy_in_background(version_id: int):
+    version = models.ProjectVersion.objects.select_related("project", "project__node").get(pk=version_id)
+    results = deploy_version(version)
+    logger.info(f"部署{version.full_path}: {results}")
+
+
+def submit_deploy(version: models.ProjectVersion):
+    """事务提交后在后台线程部署版本, 不阻塞保存请求"""
+    background.submit_on_commit(_deploy_in_background, version.pk)
+
+
+def record_remote_deletion(node_id: int, project: str, version: str, error: Exception):
+    """记录删除失败的远端项目/版本, 不写回已经删除的数据库记录"""
+    deletion, _ = models.RemoteDeletion.objects.get_or_create(node_id=node_id, project=project, version=version)
+    deletion.attempts += 1
+    deletion.message = str(error)
+    deletion.save(update_fields=["attempts", "message", "update_time"])
+
+
+def undeploy_version(version: models.ProjectVersion):
+    """从 Scrapyd 删除已经从数据库删除的版本, 失败时记录到 RemoteDeletion 等待重试"""
+    project = models.Project.objects.select_related("node").filter(pk=version.project_id).first()
+    if project is None:
+        # 项目一并被删除, 由 delproject 处理
+        return
+    version.project = project
+    try:
+        scrapyd_api.delete_version(version)
+    except Exception as e:
+        logger.error(f"删除版本{version.full_path}失败: {e}")
+        record_remote_deletion(project.node_id, project.name, version.version, e)
+
+
+def undeploy_project(project: models.Project):
+    """从 Scrapyd 删除已经从数据库删除的项目, 失败时记录到 RemoteDeletion 等待重试"""
+    try:
+        scrapyd_api.delete_project(project)
+    except Exception as e:
+        logger.error(f"删除项目{project.node}/{project.name}失败: {e}")
+        record_remote_deletion(project.node_id, project.name, "", e)
+
+
+def retry_remote_deletions(max_attempts: int = 10) -> int:
+    """
+    重试删除失败的远端项目/版本, 返回成功删除的个数
+    同名项目/版本在此期间又被重新创建时放弃删除, 超过 max_attempts 次的记录保留在管理页由人工处理
+    """
+    deleted = 0
+    for deletion in models.RemoteDeletion.objects.select_related("node").filter(attempts__lt=max_attempts).order_by("id"):
+        project = models.Project(node=deletion.node, name=deletion.project)
+        recreated = models.Project.objects.filter(node_id=deletion.node_id, name=deletion.project)
+        if deletion.version:
+            recreated = models.ProjectVersion.objects.filter(project__in=recreated, version=deletion.version)
+        if recreated.exists():
+            deletion.delete()
+            continue
+        try:
+            if deletion.version:
+                scrapyd_api.delete_version(models.ProjectVersion(project=project, version=deletion.version))
+            else:
+                scrapyd_api.delete_project(project)
+        except Exception as e:
+            logger.warning(f"重试删除{deletion}失败: {e}")
+            record_remote_deletion(deletion.node_id, deletion.project, deletion.version, e)
+            continue
+        deletion.delete()
+        deleted += 1
+    return deleted
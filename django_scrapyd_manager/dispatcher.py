@@ -0,0 +1,120 @@
+import traceback
+from datetime import timedelta
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from django_sched.sched import BaseScheduler
+from django_scrapyd_manager import models, scrapyd_api
+from django_scrapyd_manager.lease import get_lease
+from django_scrapyd_manager.utils import get_setting
+
+
+def queued_requests(node: models.Node = None):
+    queryset = models.DispatchRequest.objects.filter(status=models.DispatchStatus.QUEUED)
+    if node is not None:
+        queryset = queryset.filter(node=node)
+    return queryset
+
+
+def ready_requests(node: models.Node = None, now=None):
+    """退避期已过, 可以下发的排队记录"""
+    now = now or timezone.now()
+    return queued_requests(node).filter(Q(next_attempt_time__isnull=True) | Q(next_attempt_time__lte=now))
+
+
+def queue_stats() -> dict[int, dict]:
+    """按节点统计队列深度和最早入队时间"""
+    rows = queued_requests().values("node_id").annotate(depth=Count("id"), oldest=Min("enqueue_time"))
+    return {row["node_id"]: row for row in rows}
+
+
+def dispatch_request(request: models.DispatchRequest) -> bool:
+    """
+    把排队记录下发到 scrapyd, 失败后按 DISPATCH_RETRY_DELAY 指数退避, 失败次数超过上限后标记为失败
+    下发前先把记录从排队中原子地改为下发中, 多个进程(或调度器与管理页的立即下发)同时处理同一条记录时只有一个会下发
+    """
+    now = timezone.now()
+    claimed = models.DispatchRequest.objects.filter(id=request.id, status=models.DispatchStatus.QUEUED).update(
+        status=models.DispatchStatus.DISPATCHING, update_time=now,
+    )
+    if not claimed:
+        return False
+    request.status = models.DispatchStatus.DISPATCHING
+    spider = request.spider
+    if spider is None:
+        request.status = models.DispatchStatus.FAILED
+        request.message = f"爬虫{request.spider_name}所在的版本已被删除"
+        request.save(update_fields=["message", "status", "update_time"])
+        return False
+    spider.kwargs = request.kwargs
+    spider.settings = request.settings
+    request.attempts += 1
+    try:
+        request.job_id = scrapyd_api.start_spider(spider, node=request.node)
+    except Exception:
+        request.message = traceback.format_exc()
+        if request.attempts >= get_setting("DISPATCH_MAX_ATTEMPTS", 3):
+            request.status = models.DispatchStatus.FAILED
+        else:
+            request.status = models.DispatchStatus.QUEUED
+            delay = get_setting("DISPATCH_RETRY_DELAY", 30) * 2 ** (request.attempts - 1)
+            request.next_attempt_time = now + timedelta(seconds=delay)
+        request.save(update_fields=["attempts", "message", "status", "next_attempt_time", "update_time"])
+        return False
+    request.status = models.DispatchStatus.DISPATCHED
+    request.dispatch_time = timezone.now()
+    request.save(update_fields=["attempts", "job_id", "status", "dispatch_time", "update_time"])
+    return True
+
+
+def fail_stale_dispatching(timeout: int) -> int:
+    """
+    下发过程中进程退出会让记录停在下发中; 无法确定 schedule.json 是否已经成功, 为避免重复启动只标记为失败
+    """
+    return models.DispatchRequest.objects.filter(
+        status=models.DispatchStatus.DISPATCHING, update_time__lt=timezone.now() - timedelta(seconds=timeout),
+    ).update(status=models.DispatchStatus.FAILED, message="下发过程中断, 请确认任务是否已启动", update_time=timezone.now())
+
+
+class DispatchScheduler(BaseScheduler):
+    """
+    调度队列下发器
+    每轮对有排队任务的节点读取 daemonstatus, 只在 pending 数低于阈值时按优先级下发
+    多进程部署时通过租约保证只有一个进程下发
+    """
+    interval = 5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lease = get_lease("dispatch", ttl=self.interval)
+
+    def dispatch_node(self, node: models.Node) -> int:
+        threshold = node.max_pending or get_setting("DISPATCH_MAX_PENDING", 5)
+        try:
+            pending = int(scrapyd_api.daemon_status(node).get("pending", 0))
+        except Exception as e:
+            self.logger.warning(f"获取节点{node}状态失败, 暂不下发: {e}")
+            return 0
+        capacity = threshold - pending
+        if capacity <= 0:
+            return 0
+        dispatched = 0
+        requests = ready_requests(node).select_related(
+            "spider", "spider__version", "spider__version__project", "spider__version__project__node",
+        ).order_by("-priority", "enqueue_time")[:capacity]
+        for request in requests:
+            request.node = node
+            if dispatch_request(request):
+                dispatched += 1
+        return dispatched
+
+    def schedule(self, now):
+        if self.lease is not None and self.lease.acquire() is None:
+            return
+        failed = fail_stale_dispatching(get_setting("DISPATCH_CLAIM_TIMEOUT", 300))
+        if failed:
+            self.logger.warning(f"[Dispatch] {failed}个任务下发过程中断, 已标记为失败")
+        node_ids = ready_requests(now=now).values_list("node_id", flat=True).distinct()
+        for node in models.Node.objects.filter(id__in=node_ids):
+            dispatched = self.dispatch_node(node)
+            if dispatched:
+                self.logger.info(f"[Dispatch] {node}: 下发{dispatched}个任务")
@@ -0,0 +1,133 @@
+import ast
+import configparser
+import hashlib
+import zipfile
+from logging import getLogger
+from django.utils import timezone
+from django_sched.sched import BaseScheduler
+from . import models
+from .utils import get_setting
+
+
+logger = getLogger(__name__)
+
+
+def _settings_module(egg: zipfile.ZipFile) -> str | None:
+    """scrapyd-deploy 打包的 egg 在 entry_points.txt 中声明 settings 模块"""
+    try:
+        content = egg.read("EGG-INFO/entry_points.txt").decode("utf-8")
+    except KeyError:
+        return None
+    parser = configparser.ConfigParser()
+    parser.read_string(content)
+    if parser.has_option("scrapy", "settings"):
+        return parser.get("scrapy", "settings")
+    return None
+
+
+def _spider_modules(egg: zipfile.ZipFile, settings_module: str) -> list[str]:
+    path = settings_module.replace(".", "/") + ".py"
+    tree = ast.parse(egg.read(path))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == "SPIDER_MODULES" for t in node.targets):
+            return list(ast.literal_eval(node.value))
+    return []
+
+
+def _class_spider_names(source: bytes) -> list[str]:
+    names = []
+    for node in ast.walk(ast.parse(source)):
+        if not isinstance(node, ast.ClassDef) or not node.bases:
+            continue
+        for statement in node.body:
+            if (
+                isinstance(statement, ast.Assign)
+                and any(isinstance(t, ast.Name) and t.id == "name" for t in statement.targets)
+                and isinstance(statement.value, ast.Constant)
+                and isinstance(statement.value.value, str)
+            ):
+                names.append(statement.value.value)
+    return names
+
+
+def extract_spider_names(version: models.ProjectVersion) -> list[str] | None:
+    """
+    不经过 Scrapyd, 直接从 egg 文件静态解析爬虫名
+    只识别 SPIDER_MODULES 下类属性 name 为字符串常量的爬虫, 无法解析时返回 None
+    """
+    if not version.egg_file:
+        return None
+    try:
+        with version.egg_file.storage.open(version.egg_file.name, "rb") as f, zipfile.ZipFile(f) as egg:
+            settings_module = _settings_module(egg)
+            if not settings_module:
+                return None
+            modules = [module.replace(".", "/") for module in _spider_modules(egg, settings_module)]
+            names = set()
+            for path in egg.namelist():
+                if path.endswith(".py") and any(path.startswith(m + "/") or path == m + ".py" for m in modules):
+                    names.update(_class_spider_names(egg.read(path)))
+    except Exception as e:
+        logger.warning(f"解析{version.full_path}的egg失败: {e}")
+        return None
+    return sorted(names) or None
+
+
+def fill_egg_metadata(version: models.ProjectVersion, uploaded_file):
+    """上传时从上传的文件计算 egg 元数据, 避免保存后再读存储"""
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    version.egg_sha256 = digest.hexdigest()
+    version.egg_size = size
+    version.egg_stored_at = timezone.now()
+    version.egg_present = True
+
+
+def scan_egg_files(versions) -> list[models.ProjectVersion]:
+    """检查一批版本的 egg 文件是否还在存储中, 返回元数据有变化的版本"""
+    changed = []
+    for version in versions:
+        present, size = False, None
+        if version.egg_file:
+            storage = version.egg_file.storage
+            try:
+                present = storage.exists(version.egg_file.name)
+                size = storage.size(version.egg_file.name) if present else None
+            except Exception as e:
+                # 存储暂时不可用时保留原状态
+                logger.warning(f"检查{version.full_path}的egg文件失败: {e}")
+                continue
+        if (present, size) != (version.egg_present, version.egg_size):
+            if present and size != version.egg_size:
+                # 文件被替换过, 重新计算 sha256
+                version.egg_sha256 = None
+            version.egg_present, version.egg_size = present, size
+            changed.append(version)
+    return changed
+
+
+class EggScanScheduler(BaseScheduler):
+    """
+    分批扫描 egg 文件, 刷新 ProjectVersion 上持久化的 egg 元数据
+    管理页和守护任务只读这些字段, 不在请求中访问存储
+    """
+    interval = 300
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor = 0
+
+    def schedule(self, now):
+        batch_size = get_setting("EGG_SCAN_BATCH_SIZE", 200)
+        versions = list(models.ProjectVersion.objects.select_related("project", "project__node").filter(
+            id__gt=self.cursor,
+        ).exclude(egg_file__isnull=True, egg_present=False).order_by("id")[:batch_size])
+        # 扫描到末尾后下一轮从头开始
+        self.cursor = versions[-1].id if len(versions) == batch_size else 0
+        changed = scan_egg_files(versions)
+        if changed:
+            models.ProjectVersion.objects.bulk_update(changed, ["egg_present", "egg_size", "egg_sha256"])
+            self.logger.info(f"[EggScan] 更新{len(changed)}个版本的egg元数据")
@@ -0,0 +1,68 @@
+"""预览任务的 items 文件 (Scrapyd 默认保存为 JSON lines)"""
+import json
+import re
+from . import models, scrapyd_api
+
+
+CHUNK_SIZE = 16 * 1024
+
+
+def _content_range(resp) -> tuple[int | None, int | None]:
+    """解析 Content-Range: bytes 100-199/200 或 bytes */200, 返回 (起始偏移, 总大小)"""
+    match = re.match(r"bytes (?:(\d+)-\d+|\*)/(\d+)", resp.headers.get("Content-Range", ""))
+    if not match:
+        return None, None
+    return int(match.group(1)) if match.group(1) else None, int(match.group(2))
+
+
+def _parse_lines(lines: list[bytes], result: dict):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            result["items"].append(json.loads(line))
+        except ValueError:
+            result["invalid"] += 1
+
+
+def preview_items(job: models.BaseJob, limit: int = 20, max_bytes: int = 1024 * 1024, tail: bool = False) -> dict:
+    """
+    流式读取任务的 items 文件, 读到 limit 条或 max_bytes 个字节后立即断开连接, 不会下载整个文件
+    tail 为 True 时用 Range 只请求最后 max_bytes 个字节并返回其中最后 limit 条, 第一行不完整时丢弃; 服务端忽略 Range 时退回读取开头
+    :return: {"items", "start": 读取的起始偏移, "bytes": 读取的字节数, "total": 文件大小, "invalid": 无法解析的行数, "truncated": 是否只读取了部分文件}
+    """
+    resp = scrapyd_api.request_job_file(job, job.items_url, suffix=max_bytes if tail else None)
+    result = {"items": [], "start": 0, "bytes": 0, "total": None, "invalid": 0, "truncated": False}
+    with resp:
+        if resp.status_code == 416:
+            result["total"] = _content_range(resp)[1]
+            return result
+        if resp.status_code == 206:
+            start, result["total"] = _content_range(resp)
+            result["start"] = start or 0
+        else:
+            tail = False
+            result["total"] = int(resp.headers.get("Content-Length") or 0) or None
+        buffer, skip_first, exhausted = b"", tail and result["start"] > 0, False
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            chunk = chunk[:max_bytes - result["bytes"]]
+            result["bytes"] += len(chunk)
+            lines = (buffer + chunk).split(b"\n")
+            buffer = lines.pop()
+            if skip_first and lines:
+                lines, skip_first = lines[1:], False
+            _parse_lines(lines, result)
+            if (not tail and len(result["items"]) >= limit) or result["bytes"] >= max_bytes:
+                break
+        else:
+            exhausted = True
+        # 读到文件末尾时最后一行可能没有换行
+        if (exhausted or tail) and not skip_first:
+            _parse_lines([buffer], result)
+    result["items"] = result["items"][max(len(result["items"]) - limit, 0):] if tail else result["items"][:limit]
+    if result["total"] is not None:
+        result["truncated"] = result["start"] > 0 or result["start"] + result["bytes"] < result["total"]
+    else:
+        result["truncated"] = not exhausted
+    return result
@@ -1,7 +1,14 @@
+import time
 import traceback
 from typing import Iterable
 from django_scrapyd_manager import models, scrapyd_api, signals
+from django_scrapyd_manager.outbox import send_signal
+from django_scrapyd_manager.lease import LeaseKeeper, get_lease, fence_guardian
+from django_scrapyd_manager.sharding import ShardKeeper
+from django_scrapyd_manager.reconcile import get_reconciler
+from django_scrapyd_manager.utils import get_setting
 from django.utils import timezone
+from django.db.models import Q
 from django_sched.sched import BaseScheduler
 
 
@@ -17,18 +24,24 @@ def node_has_project(node: models.Node, project: models.Project) -> bool:
     return False
 
 
-def deploy_project_version(project_version: models.ProjectVersion):
-    scrapyd_api.add_version(project_version)
-    scrapyd_api.sync_project_version_spiders(project_version)
+deploy_project_version = scrapyd_api.deploy_project_version
 
 
 def missing_spiders_jobs_on_node(required_spiders: Iterable[models.Spider], node: models.Node) -> Iterable[models.Spider]:
-    node_jobs = scrapyd_api.sync_jobs(node)
+    return missing_spiders_jobs_on_nodes(required_spiders, [node])
+
+
+def missing_spiders_jobs_on_nodes(required_spiders: Iterable[models.Spider], nodes: Iterable[models.Node]) -> Iterable[models.Spider]:
     job_ids = []
     missing_spiders = []
-    for job in node_jobs:
-        if job.status != models.JobStatus.FINISHED:
-            job_ids.append(job.job_id)
+    for node in nodes:
+        for job in scrapyd_api.poll_jobs(node):
+            if job.status != models.JobStatus.FINISHED:
+                job_ids.append(job.job_id)
+    # 调度队列中还未下发的爬虫不算缺失
+    job_ids.extend(models.DispatchRequest.objects.filter(
+        node__in=nodes, status__in=[models.DispatchStatus.QUEUED, models.DispatchStatus.DISPATCHING],
+    ).values_list("fp", flat=True))
 
     for required_spider in required_spiders:
         spider_fp = required_spider.fp
@@ -61,26 +74,293 @@ class GuardSpiderGroup:
         self.code = group.code
         self.kwargs = group.kwargs
         self.settings = group.settings
+        self.placement = group.placement
+        self.placement_nodes = group.placement_nodes
 
 
 def get_group_publishable_version(spider_group: models.SpiderGroup) -> models.ProjectVersion:
     version = spider_group.version
     if version is not None:
-        if version.egg_file:
+        if version.egg_file and version.egg_present:
             return version
         else:
             raise InvalidVersionError(f"{spider_group.project}/{version.version}没有egg文件")
     version = spider_group.project.versions.filter(
-        egg_file__isnull=False,
+        egg_file__isnull=False, egg_present=True,
     ).order_by("-create_time", "-version").first()
     if version is None:
         raise InvalidVersionError(f"项目({spider_group.project})没有可用的带egg版本")
     return version
 
 
+class RestartTracker:
+    """
+    按 (guardian, 爬虫指纹) 在内存中记录重启历史, 用于指数退避和重启限额。
+    状态定期持久化到 Guardian.restart_state, 隔离状态变化时立即持久化。
+    """
+
+    def __init__(self, persist_interval: int = 60, stable_period: int = None):
+        self.persist_interval = persist_interval
+        self.stable_period = stable_period
+        self._states: dict[int, dict[str, dict]] = {}
+        self._persisted_quarantined: dict[int, bool] = {}
+        self._dirty: set[int] = set()
+        self._last_persist = time.time()
+
+    def attach(self, guardian: models.Guardian):
+        """首次见到 guardian 时从数据库加载状态; 在admin中解除隔离后丢弃内存状态"""
+        released = self._persisted_quarantined.get(guardian.id) and not guardian.quarantined
+        if guardian.id not in self._states or released:
+            self._states[guardian.id] = dict(guardian.restart_state or {})
+            self._persisted_quarantined[guardian.id] = guardian.quarantined
+
+    def _state(self, guardian: models.Guardian, spider: models.Spider) -> dict:
+        states = self._states.setdefault(guardian.id, {})
+        return states.setdefault(spider.fp, {"name": spider.name, "failures": 0, "next_time": 0, "restarts": []})
+
+    def is_quarantined(self, guardian: models.Guardian) -> bool:
+        return any(state.get("quarantined") for state in self._states.get(guardian.id, {}).values())
+
+    def forget(self, guardian_ids: Iterable[int]):
+        """丢弃内存状态, 下次见到时从数据库重新加载"""
+        for guardian_id in guardian_ids:
+            self._states.pop(guardian_id, None)
+            self._persisted_quarantined.pop(guardian_id, None)
+            self._dirty.discard(guardian_id)
+
+    def next_retry_time(self, guardian: models.Guardian) -> float | None:
+        """退避期内最早可以重启的时间"""
+        now = time.time()
+        times = [state["next_time"] for state in self._states.get(guardian.id, {}).values()
+                 if not state.get("quarantined") and state["next_time"] > now]
+        return min(times) if times else None
+
+    def record_alive(self, guardian: models.Guardian, spider: models.Spider, now: float):
+        """
+        爬虫连续存活超过 stable_period 秒(默认取 backoff_base)后才清零失败次数,
+        重启后很快又崩溃的爬虫每轮都会被看到存活一次, 立即清零会让退避永远停在 backoff_base
+        """
+        state = self._states.get(guardian.id, {}).get(spider.fp)
+        if not state or not state["failures"]:
+            return
+        if "alive_since" not in state:
+            state["alive_since"] = now
+            self._dirty.add(guardian.id)
+        if now - state["alive_since"] >= (self.stable_period if self.stable_period is not None else guardian.backoff_base):
+            state["failures"] = 0
+            state["next_time"] = 0
+            state.pop("alive_since")
+
+    def check(self, guardian: models.Guardian, spider: models.Spider, now: float) -> str | None:
+        """
+        判断是否允许重启
+        :return: None 表示允许; "backoff" 表示仍在退避期; "quarantined" 表示已隔离; "quarantine" 表示本次超限需要隔离
+        """
+        state = self._state(guardian, spider)
+        # 爬虫已经不在运行, 存活时间重新计算
+        state.pop("alive_since", None)
+        if state.get("quarantined"):
+            return "quarantined"
+        if now < state["next_time"]:
+            return "backoff"
+        if guardian.strategy == models.GuardianStrategy.RESTART_BUDGET:
+            state["restarts"] = [t for t in state["restarts"] if t > now - guardian.budget_window]
+            if len(state["restarts"]) >= guardian.restart_budget:
+                state["quarantined"] = True
+                self._dirty.add(guardian.id)
+                return "quarantine"
+        return None
+
+    def record_restart(self, guardian: models.Guardian, spider: models.Spider, now: float):
+        state = self._state(guardian, spider)
+        state["failures"] += 1
+        delay = min(guardian.backoff_base * 2 ** (state["failures"] - 1), guardian.backoff_max)
+        state["next_time"] = now + delay
+        # 只有限额策略需要重启历史, 追加时就去掉窗口外的记录, 避免 restart_state 无限增长
+        if guardian.strategy == models.GuardianStrategy.RESTART_BUDGET:
+            state["restarts"] = [t for t in state["restarts"] if t > now - guardian.budget_window] + [now]
+        else:
+            state["restarts"] = []
+        self._dirty.add(guardian.id)
+
+    def persist(self, guardians: Iterable[models.Guardian], force=False) -> list[models.Guardian]:
+        """把有变化的状态写回 guardian 对象, 返回需要保存的对象, 由调用方统一保存"""
+        now = time.time()
+        quarantine_changed = any(self.is_quarantined(g) != self._persisted_quarantined.get(g.id, False) for g in guardians)
+        if not (force or quarantine_changed or now - self._last_persist >= self.persist_interval):
+            return []
+        changed = []
+        for guardian in guardians:
+            if guardian.id not in self._dirty:
+                continue
+            guardian.restart_state = self._states.get(guardian.id, {})
+            guardian.quarantined = self.is_quarantined(guardian)
+            self._persisted_quarantined[guardian.id] = guardian.quarantined
+            self._dirty.discard(guardian.id)
+            changed.append(guardian)
+        self._last_persist = now
+        return changed
+
+
+class GuardianLogBuffer:
+    """
+    缓冲一轮守护产生的日志, 每轮结束时批量写入
+    同一 (守护任务, 节点, 爬虫, 动作) 同一天内连续出现相同结果时只累加最近一条日志的次数和时间, 跨天时新建一条, 按天汇总时次数不会算到第一天
+    """
+
+    def __init__(self):
+        self._latest: dict[tuple, models.GuardianLog | None] = {}
+        self._created: list[models.GuardianLog] = []
+        self._updated: dict[int, models.GuardianLog] = {}
+
+    @staticmethod
+    def _key(log: models.GuardianLog) -> tuple:
+        return log.guardian_id, log.node_id, log.spider_name, log.action
+
+    def _get_latest(self, key: tuple) -> models.GuardianLog | None:
+        if key not in self._latest:
+            guardian_id, node_id, spider_name, action = key
+            self._latest[key] = models.GuardianLog.objects.filter(
+                guardian_id=guardian_id, node_id=node_id, spider_name=spider_name, action=action,
+            ).order_by("-create_time", "-id").first()
+        return self._latest[key]
+
+    def add(self, log: models.GuardianLog) -> models.GuardianLog:
+        key = self._key(log)
+        latest = self._get_latest(key)
+        if latest is not None and (latest.success, latest.reason, latest.create_time.date()) == (log.success, log.reason, log.create_time.date()):
+            latest.repeat_count += 1
+            latest.last_time = log.create_time
+            latest.message = log.message
+            if latest.pk:
+                self._updated[latest.pk] = latest
+            return latest
+        log.last_time = log.create_time
+        self._latest[key] = log
+        self._created.append(log)
+        return log
+
+    def forget(self, guardian_ids: Iterable[int]):
+        """丢弃缓存的最近日志, 其他进程可能已经写入了更新的日志"""
+        guardian_ids = set(guardian_ids)
+        for key in [key for key in self._latest if key[0] in guardian_ids]:
+            self._latest.pop(key)
+
+    def flush(self):
+        if self._created:
+            models.GuardianLog.objects.bulk_create(self._created)
+            for log in self._created:
+                # 不支持返回主键的数据库(MySQL)下次从数据库重新读取
+                if log.pk is None:
+                    self._latest.pop(self._key(log), None)
+        if self._updated:
+            models.GuardianLog.objects.bulk_update(self._updated.values(), ["repeat_count", "last_time", "message"])
+        self._created = []
+        self._updated = {}
+
+
 class GuardianScheduler(BaseScheduler):
     interval = 30
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.restart_tracker = self.new_restart_tracker()
+        self.log_buffer = GuardianLogBuffer()
+        self.sharding = get_setting("GUARDIAN_SHARDING", False)
+        self.lease = None if self.sharding else get_lease(f"guardian:{self.name}")
+        self.lease_keeper = None
+        self.leader_token = None
+        self.shard_keeper = None
+        self.shard_tokens: dict[int, int] = {}
+        self.reconciler = get_reconciler(self.interval)
+
+    @staticmethod
+    def new_restart_tracker():
+        return RestartTracker(
+            persist_interval=get_setting("GUARDIAN_STATE_PERSIST_INTERVAL", 60),
+            stable_period=get_setting("GUARDIAN_STABLE_PERIOD", None),
+        )
+
+    def acquire_leadership(self) -> int | None:
+        """多进程部署时只有持有租约的进程执行守护, 其余进程作为备用"""
+        if self.lease is None:
+            return None
+        if self.lease_keeper is None:
+            self.lease.acquire()
+            self.lease_keeper = LeaseKeeper(self.lease)
+            self.lease_keeper.start()
+        if not self.lease.is_held():
+            return None
+        token = self.lease.token
+        if token != self.leader_token:
+            # 重新成为 leader 时内存中的重启状态可能已过期, 从数据库重新加载
+            self.restart_tracker = self.new_restart_tracker()
+            self.log_buffer = GuardianLogBuffer()
+            self.reconciler = get_reconciler(self.interval)
+            self.leader_token = token
+        return token
+
+    def acquire_shard(self) -> list[int]:
+        """分片模式下返回当前 worker 负责的节点"""
+        if self.shard_keeper is None:
+            self.shard_keeper = ShardKeeper(self.name, ttl=get_setting("GUARDIAN_LEASE_TTL", 10))
+            self.shard_keeper.rebalance()
+            self.shard_keeper.start()
+        node_ids = self.shard_keeper.held_nodes()
+        tokens = {node_id: self.shard_keeper.node_token(node_id) for node_id in node_ids}
+        changed = [node_id for node_id, token in tokens.items() if self.shard_tokens.get(node_id) != token]
+        if changed:
+            # 新接管的节点, 其守护任务的重启状态和日志可能已被其他 worker 更新
+            guardian_ids = list(models.Guardian.objects.filter(
+                Q(spider_group__node_id__in=changed) | Q(spider_group__node_pool__in=changed),
+            ).values_list("id", flat=True).distinct())
+            self.restart_tracker.forget(guardian_ids)
+            self.log_buffer.forget(guardian_ids)
+        self.shard_tokens = tokens
+        return node_ids
+
+    def can_guard(self, obj: models.Guardian, token: int = None) -> bool:
+        if self.shard_keeper is not None:
+            # 任务可能被放到调度目标中的任一节点上, 必须持有全部节点的租约; 令牌取组所在节点的租约
+            group = obj.spider_group
+            if any(self.shard_keeper.node_token(node.id) is None for node in group.placement_nodes):
+                return False
+            token = self.shard_keeper.node_token(group.node_id)
+            return token is not None and fence_guardian(obj, token, self.shard_keeper.node_lease_name(group.node_id))
+        if token is None:
+            return True
+        return self.lease.is_held() and fence_guardian(obj, token, self.lease.name)
+
+    def filter_restartable_spiders(self, spider_guardian: models.Guardian, running_spiders, missing_spiders, logs: list) -> list[models.Spider]:
+        """按守护策略过滤掉仍在退避期或已隔离的爬虫"""
+        if spider_guardian.strategy == models.GuardianStrategy.RESTART_ALWAYS:
+            return list(missing_spiders)
+        tracker = self.restart_tracker
+        tracker.attach(spider_guardian)
+        now = time.time()
+        for spider in running_spiders:
+            tracker.record_alive(spider_guardian, spider, now)
+        restartable = []
+        node = spider_guardian.spider_group.node
+        for spider in missing_spiders:
+            verdict = tracker.check(spider_guardian, spider, now)
+            if verdict is None:
+                tracker.record_restart(spider_guardian, spider, now)
+                restartable.append(spider)
+            elif verdict == "quarantine":
+                log = models.GuardianLog(
+                    guardian=spider_guardian,
+                    node=node,
+                    spider=spider,
+                    spider_name=spider.name,
+                    group=spider_guardian.spider_group,
+                    action=models.GuardianAction.QUARANTINE_SPIDER,
+                    success=False,
+                    reason=f"爬虫{spider.name}在{spider_guardian.budget_window}秒内重启超过{spider_guardian.restart_budget}次, 已隔离"
+                )
+                logs.append(self.log_buffer.add(log))
+        return restartable
+
     def guard_object(self, spider_guardian: models.Guardian):
         logs = []
         node = spider_guardian.spider_group.node
@@ -104,11 +384,17 @@ class GuardianScheduler(BaseScheduler):
                     log.success = False
                     log.message = traceback.format_exc()
                     self.logger.exception(e)
-            log.save()
-            logs.append(log)
-        guard_spiders = spider_guardian.spider_group.resolved_spiders
-        missing_spiders = missing_spiders_jobs_on_node(guard_spiders, node)
+            logs.append(self.log_buffer.add(log))
+        group = spider_guardian.spider_group
+        placement_nodes = group.placement_nodes
+        guard_spiders = group.resolved_spiders
+        missing_spiders = missing_spiders_jobs_on_nodes(guard_spiders, placement_nodes)
+        running_spiders = [spider for spider in guard_spiders if spider not in missing_spiders]
+        missing_spiders = self.filter_restartable_spiders(spider_guardian, running_spiders, missing_spiders, logs)
 
+        placer = None
+        if group.placement == models.PlacementMode.POOL:
+            placer = scrapyd_api.NodePlacer(placement_nodes)
         if missing_spiders:
             for spider in missing_spiders:
                 # 依次记录每个爬虫的启动状态
@@ -123,23 +409,40 @@ class GuardianScheduler(BaseScheduler):
                 )
                 try:
                     guard_spider_group = GuardSpiderGroup(group=spider_guardian.spider_group, missing_spiders=[spider])
-                    scrapyd_api.start_spider_group(guard_spider_group)
+                    target = node
+                    if placer is not None:
+                        target = log.node = placer.choose()
+                    scrapyd_api.start_spider_group(guard_spider_group, node=target)
                 except Exception as e:
                     log.success = False
                     log.message = traceback.format_exc()
                     self.logger.exception(e)
-                log.save()
-                logs.append(log)
+                logs.append(self.log_buffer.add(log))
         return logs
 
-    def guard_objects(self, objects: list[models.Guardian] = None):
-        objects = objects or models.Guardian.objects.filter(enable=True).prefetch_related("spider_group",
-                                                                                          "spider_group__node",
-                                                                                          "spider_group__project")
-        signals.guard_objects_started.send(sender=self.__class__, objects=objects)
+    @staticmethod
+    def get_guard_objects():
+        return models.Guardian.objects.filter(enable=True).prefetch_related("spider_group",
+                                                                            "spider_group__node",
+                                                                            "spider_group__project")
+
+    def guard_objects(self, objects: list[models.Guardian] = None, token: int = None):
+        objects = self.get_guard_objects() if objects is None else objects
+        send_signal(signals.guard_objects_started, self.__class__, objects=objects)
+        try:
+            return self._guard_objects(objects, token)
+        finally:
+            self.log_buffer.flush()
+
+    def _guard_objects(self, objects: list[models.Guardian], token: int = None):
         result_mapping = {}
         for obj in objects:
             name = (obj.description or "")[:20] or f"爬虫组守护{obj.spider_group.name}"
+            if not self.can_guard(obj, token):
+                self.logger.warning(f"[Guardian] 租约已失效或{name}已被其他进程处理, 跳过")
+                if self.reconciler is not None:
+                    self.reconciler.skipped(obj)
+                continue
             try:
                 logs = self.guard_object(obj)
                 result_mapping[name] = {
@@ -147,17 +450,23 @@ class GuardianScheduler(BaseScheduler):
                     "logs": logs
                 }
                 obj.last_action = logs[0].action if logs else "ok"
-                signals.guard_obj_success.send(sender=self.__class__, model=obj, logs=logs)
+                send_signal(signals.guard_obj_success, self.__class__, model=obj, logs=logs)
             except Exception as e:
+                logs = None
                 result_mapping[name] = {
                     "success": False,
                     "error": str(e)
                 }
                 self.logger.exception(e)
                 obj.last_action = f"error: {e}"[:200]
-                signals.guard_obj_error.send(sender=self.__class__, model=obj, exception=e)
+                send_signal(signals.guard_obj_error, self.__class__, model=obj, exception=e)
             obj.last_check = timezone.now()
-            obj.save()
+            obj.save(update_fields=["last_check", "last_action", "update_time"])
+            if self.reconciler is not None:
+                self.reconciler.done(obj, acted=logs != [], retry_at=self.restart_tracker.next_retry_time(obj))
+        changed = self.restart_tracker.persist(objects)
+        if changed:
+            models.Guardian.objects.bulk_update(changed, ["restart_state", "quarantined"])
         return result_mapping
 
     # ANSI 颜色
@@ -208,6 +517,24 @@ class GuardianScheduler(BaseScheduler):
         self.logger.info(sep)
 
     def schedule(self, now):
-        result_mapping = self.guard_objects()
+        objects = None
+        token = None
+        if self.sharding:
+            node_ids = self.acquire_shard()
+            if not node_ids:
+                self.logger.debug("[Guardian] 当前 worker 没有分到节点")
+                return
+            objects = list(self.get_guard_objects().filter(spider_group__node_id__in=node_ids))
+        else:
+            token = self.acquire_leadership()
+            if token is None and self.lease is not None:
+                self.logger.debug("[Guardian] 租约被其他进程持有, 当前进程待命")
+                return
+        if self.reconciler is not None:
+            objects = self.reconciler.next_objects(self.get_guard_objects() if objects is None else
+                                                   self.get_guard_objects().filter(id__in=[obj.id for obj in objects]))
+            if not objects:
+                return
+        result_mapping = self.guard_objects(objects=objects, token=token)
         self.log_guard_results(result_mapping)
-        signals.guard_objects_ended.send(sender=self.__class__, result=result_mapping)
+        send_signal(signals.guard_objects_ended, self.__class__, result=result_mapping)
@@ -0,0 +1,79 @@
+"""JobInfoLog 采样的差量和压缩编码"""
+import json
+import zlib
+
+try:
+    # Python 3.14+
+    from compression import zstd
+except ImportError:
+    try:
+        import zstandard
+    except ImportError:
+        zstd = None
+    else:
+        class zstd:
+            compress = staticmethod(lambda data: zstandard.ZstdCompressor().compress(data))
+            decompress = staticmethod(lambda data: zstandard.ZstdDecompressor().decompress(data))
+
+
+class CodecUnavailable(Exception):
+    pass
+
+
+def diff(base: dict, current: dict) -> dict:
+    """
+    current 相对 base 的差量, 嵌套的 dict 递归比较
+    {"s": {新增或修改的键: 值}, "d": [删除的键], "p": {嵌套 dict 的键: 子差量}}, 没有变化的部分不出现
+    """
+    changed, deleted, nested = {}, [key for key in base if key not in current], {}
+    for key, value in current.items():
+        if key not in base:
+            changed[key] = value
+        elif isinstance(value, dict) and isinstance(base[key], dict):
+            if patch := diff(base[key], value):
+                nested[key] = patch
+        elif base[key] != value or type(base[key]) is not type(value):
+            changed[key] = value
+    patch = {}
+    if changed:
+        patch["s"] = changed
+    if deleted:
+        patch["d"] = deleted
+    if nested:
+        patch["p"] = nested
+    return patch
+
+
+def apply(base: dict, patch: dict) -> dict:
+    """把 diff 得到的差量应用到 base 上, 返回新的 dict, 不修改 base"""
+    result = dict(base)
+    for key in patch.get("d", ()):
+        result.pop(key, None)
+    result.update(patch.get("s", {}))
+    for key, sub_patch in patch.get("p", {}).items():
+        result[key] = apply(result.get(key) or {}, sub_patch)
+    return result
+
+
+def dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def compress(raw: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.compress(raw, 6)
+    if codec == "zstd":
+        if zstd is None:
+            raise CodecUnavailable("zstd 需要 Python 3.14+ 或安装 zstandard")
+        return zstd.compress(raw)
+    raise ValueError(f"未知的压缩方式: {codec}")
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstd is None:
+            raise CodecUnavailable("zstd 需要 Python 3.14+ 或安装 zstandard")
+        return zstd.decompress(data)
+    raise ValueError(f"未知的压缩方式: {codec}")
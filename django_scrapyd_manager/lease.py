@@ -0,0 +1,169 @@
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+from logging import getLogger
+from threading import Thread, Event
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from . import models
+from .utils import get_setting
+
+
+logger = getLogger(__name__)
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class BaseLease:
+    """
+    基于过期时间的租约, 同一时刻只有一个持有者
+    每次获得租约都会分配一个单调递增的令牌(fencing token), 用于拒绝旧持有者的迟到操作
+    """
+
+    def __init__(self, name: str, ttl: int = 10, owner: str = None):
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or default_owner()
+        self.token: int | None = None
+        self._valid_until = 0.0
+
+    def _acquire(self) -> int | None:
+        raise NotImplementedError
+
+    def acquire(self) -> int | None:
+        """获取或续期租约, 成功返回令牌"""
+        started = time.monotonic()
+        try:
+            token = self._acquire()
+        except Exception as e:
+            logger.warning(f"租约{self.name}续期失败: {e}")
+            token = None
+        if token is None:
+            self.token = None
+            self._valid_until = 0.0
+        else:
+            if token != self.token:
+                logger.info(f"{self.owner} 获得租约{self.name}, token={token}")
+            self.token = token
+            # 以发起请求的时间计算本地有效期, 保证不会比数据库中的过期时间更晚
+            self._valid_until = started + self.ttl
+        return self.token
+
+    def is_held(self) -> bool:
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    def _release(self):
+        raise NotImplementedError
+
+    def release(self):
+        """主动释放租约, 其他进程无需等待过期即可接管"""
+        if self.token is None:
+            return
+        try:
+            self._release()
+        except Exception as e:
+            logger.warning(f"释放租约{self.name}失败: {e}")
+        self.token = None
+        self._valid_until = 0.0
+
+
+class DatabaseLease(BaseLease):
+    """用 SchedulerLease 表实现, 通过带条件的 UPDATE 做比较交换, SQLite/MySQL/PostgreSQL 均适用"""
+
+    def _acquire(self) -> int | None:
+        now = timezone.now()
+        expire_time = now + timedelta(seconds=self.ttl)
+        try:
+            lease, _ = models.SchedulerLease.objects.get_or_create(name=self.name, defaults={"expire_time": now})
+        except IntegrityError:
+            lease = models.SchedulerLease.objects.get(name=self.name)
+        queryset = models.SchedulerLease.objects.filter(pk=lease.pk, token=lease.token)
+        if lease.owner == self.owner and lease.expire_time > now:
+            updated = queryset.filter(owner=self.owner).update(expire_time=expire_time)
+            token = lease.token
+        elif lease.expire_time <= now:
+            token = lease.token + 1
+            updated = queryset.filter(expire_time__lte=now).update(
+                owner=self.owner, token=token, expire_time=expire_time, acquire_time=now,
+            )
+        else:
+            return None
+        return token if updated else None
+
+    def _release(self):
+        models.SchedulerLease.objects.filter(name=self.name, owner=self.owner, token=self.token).update(expire_time=timezone.now())
+
+
+class CacheLease(BaseLease):
+    """
+    用 django cache 的 add 实现, 适合共享 cache(redis/memcached), 本地可用 locmem/file cache 测试
+    cache 没有比较交换, 续期先 touch 再确认键仍属于自己: touch 只延长已存在的键, 延长后其他进程在过期前无法 add,
+    确认时看到的仍是自己的令牌就说明续期的是自己的租约; 确认失败时可能顺带延长了新持有者的租约, 不影响正确性
+    """
+
+    def _acquire(self) -> int | None:
+        key = f"scrapyd_manager:lease:{self.name}"
+        if self.token is not None and cache.touch(key, self.ttl):
+            value = cache.get(key)
+            if value == {"owner": self.owner, "token": self.token}:
+                return self.token
+            return None
+        token_key = f"{key}:token"
+        cache.add(token_key, 0, None)
+        token = cache.incr(token_key)
+        if cache.add(key, {"owner": self.owner, "token": token}, self.ttl):
+            return token
+        return None
+
+    def _release(self):
+        key = f"scrapyd_manager:lease:{self.name}"
+        if cache.get(key) == {"owner": self.owner, "token": self.token}:
+            cache.delete(key)
+
+
+def get_lease(name: str, ttl: int = None) -> BaseLease | None:
+    backend = get_setting("GUARDIAN_LEASE_BACKEND", "db")
+    ttl = ttl or get_setting("GUARDIAN_LEASE_TTL", 10)
+    if backend == "db":
+        return DatabaseLease(name, ttl=ttl)
+    if backend == "cache":
+        return CacheLease(name, ttl=ttl)
+    return None
+
+
+def fence_guardian(guardian: models.Guardian, token: int, lease_name: str) -> bool:
+    """
+    记录 guardian 最近一次被哪个租约的哪个令牌处理, 已被同一租约更新的令牌处理过时返回 False
+    每个租约的令牌各自递增, 换了租约(爬虫组换了节点, 或从 leader 模式切换到分片模式)时不与旧租约的令牌比较
+    """
+    updated = models.Guardian.objects.filter(id=guardian.id).filter(
+        Q(fencing_token__lte=token) | ~Q(fencing_lease=lease_name),
+    ).update(fencing_token=token, fencing_lease=lease_name)
+    if updated:
+        guardian.fencing_token, guardian.fencing_lease = token, lease_name
+    return bool(updated)
+
+
+class LeaseKeeper(Thread):
+    """后台线程, 按固定间隔获取/续期租约; 备用进程借此在持有者失联后一个 ttl 内接管"""
+
+    def __init__(self, lease: BaseLease, interval: float = None):
+        super().__init__(daemon=True, name=f"LeaseKeeper[{lease.name}]")
+        self.lease = lease
+        self.interval = interval or max(lease.ttl / 3, 1)
+        self._stopped = Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.lease.acquire()
+            close_old_connections()
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
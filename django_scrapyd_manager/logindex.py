@@ -0,0 +1,234 @@
+"""任务日志中 ERROR/CRITICAL 记录的签名索引"""
+import hashlib
+import re
+from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import models
+
+
+# Scrapy 默认的 LOG_FORMAT: %(asctime)s [%(name)s] %(levelname)s: %(message)s
+RECORD_PATTERN = re.compile(rb"(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:[,.]\d+)? \[([^\]]+)\] (DEBUG|INFO|WARNING|ERROR|CRITICAL): ?(.*)")
+ERROR_LEVELS = {b"ERROR", b"CRITICAL"}
+FRAME_PATTERN = re.compile(r'\s*File "([^"]+)", line \d+, in (\S+)')
+EXCEPTION_PATTERN = re.compile(r"([A-Za-z_][\w.]*)(?::|$)")
+# 消息中随请求变化的部分, 计算签名前替换掉
+NORMALIZE_PATTERNS = [
+    (re.compile(r"<[A-Z]+ [^>]+>"), "<request>"),
+    (re.compile(r"\w+://\S+"), "<url>"),
+    (re.compile(r"0x[0-9a-fA-F]+"), "<hex>"),
+    (re.compile(r"\d+"), "<n>"),
+]
+SAMPLE_SIZE = 4000
+SIGNATURE_FRAMES = 8
+
+
+def normalize(message: str) -> str:
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        message = pattern.sub(replacement, message)
+    return message
+
+
+def _log_time(value: bytes) -> datetime:
+    try:
+        time = datetime.strptime(value.decode(), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return timezone.now()
+    return timezone.make_aware(time) if settings.USE_TZ else time
+
+
+class ErrorRecord:
+    """一条 ERROR/CRITICAL 记录, 包括其后的 Traceback 等续行"""
+
+    def __init__(self, offset: int, match: re.Match):
+        self.offset = offset
+        self.time = _log_time(match.group(1))
+        self.logger = match.group(2).decode("utf-8", "replace")
+        self.level = match.group(3).decode()
+        self.message = match.group(4).decode("utf-8", "replace").rstrip()
+        self.sample = match.group(0).decode("utf-8", "replace")
+        self.frames: list[str] = []
+        self.exception: str | None = None
+        self.exception_line: str | None = None
+
+    def add(self, line: bytes):
+        line = line.decode("utf-8", "replace").rstrip()
+        if len(self.sample) < SAMPLE_SIZE:
+            self.sample = f"{self.sample}\n{line}"[:SAMPLE_SIZE]
+        if match := FRAME_PATTERN.match(line):
+            # 只取路径最后两级, 不同机器上的安装路径不影响签名
+            path = "/".join(match.group(1).replace("\\", "/").split("/")[-2:])
+            self.frames = [*self.frames[-SIGNATURE_FRAMES + 1:], f"{path}:{match.group(2)}"]
+        elif self.frames and line[:1].strip() and not line.startswith(("Traceback", "---")):
+            if match := EXCEPTION_PATTERN.match(line):
+                self.exception = match.group(1).removeprefix("builtins.")
+                self.exception_line = line
+
+    @property
+    def signature(self) -> str:
+        if self.frames:
+            key = "\n".join([self.logger, self.exception or "", *self.frames])
+        else:
+            key = "\n".join([self.logger, normalize(self.message)])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    @property
+    def title(self) -> str:
+        return (self.exception_line or self.message or self.logger)[:255]
+
+
+class ErrorParser:
+    """
+    逐块解析日志, 一条记录从带时间和级别的行开始, 到下一条这样的行为止, Traceback 等续行属于上一条记录
+    feed 只返回已经完整的 ERROR/CRITICAL 记录, 最后一条要等到下一条记录开始或 close 时才返回
+    """
+
+    def __init__(self, offset: int = 0):
+        # 已经按行处理到的偏移, 不包括 buffer 中还没有换行的部分
+        self.position = offset
+        self.buffer = b""
+        self.record: ErrorRecord | None = None
+
+    @property
+    def resume_offset(self) -> int:
+        """增量解析下一次应开始的偏移: 还没结束的 ERROR 记录需要重新解析, 其他记录的续行可以跳过"""
+        return self.record.offset if self.record is not None else self.position
+
+    def _line(self, line: bytes, records: list[ErrorRecord]):
+        match = RECORD_PATTERN.match(line) if line[:1].isdigit() else None
+        if match:
+            if self.record is not None:
+                records.append(self.record)
+            self.record = ErrorRecord(self.position, match) if match.group(3) in ERROR_LEVELS else None
+        elif self.record is not None:
+            self.record.add(line)
+        self.position += len(line) + 1
+
+    def feed(self, chunk: bytes) -> list[ErrorRecord]:
+        self.buffer += chunk
+        end = self.buffer.rfind(b"\n")
+        if end < 0:
+            return []
+        records = []
+        for line in self.buffer[:end].split(b"\n"):
+            self._line(line, records)
+        self.buffer = self.buffer[end + 1:]
+        return records
+
+    def close(self) -> list[ErrorRecord]:
+        records = []
+        if self.buffer:
+            self._line(self.buffer, records)
+            self.position -= 1
+            self.buffer = b""
+        if self.record is not None:
+            records.append(self.record)
+            self.record = None
+        return records
+
+
+class ErrorSummary:
+    """同一签名在一段日志中的汇总, 只保留第一条记录作为示例"""
+
+    def __init__(self, record: ErrorRecord):
+        self.record = record
+        self.count = 0
+        self.first_seen = self.last_seen = record.time
+
+    def add(self, record: ErrorRecord):
+        self.count += 1
+        self.first_seen = min(self.first_seen, record.time)
+        self.last_seen = max(self.last_seen, record.time)
+
+
+class ErrorIndexer:
+    """
+    解析一段日志并按签名汇总 ERROR/CRITICAL 记录, save 时写入 LogErrorSignature/LogErrorOccurrence
+    内存占用与不同签名的个数成正比, 与日志大小无关
+    """
+
+    def __init__(self, offset: int = 0):
+        self.parser = ErrorParser(offset)
+        self.errors: dict[str, ErrorSummary] = {}
+
+    @property
+    def resume_offset(self) -> int:
+        return self.parser.resume_offset
+
+    def _add(self, records: list[ErrorRecord]):
+        for record in records:
+            signature = record.signature
+            if signature not in self.errors:
+                self.errors[signature] = ErrorSummary(record)
+            self.errors[signature].add(record)
+
+    def feed(self, chunk: bytes):
+        self._add(self.parser.feed(chunk))
+
+    def close(self):
+        self._add(self.parser.close())
+
+    def save(self, job: models.BaseJob, replace: bool = False):
+        """
+        把汇总累加到索引; replace 为 True 表示解析的是任务的完整日志, 用它替换该任务之前累加的结果
+        先锁任务自己的 LogErrorOccurrence 再按 id 顺序锁签名, 并发保存不同任务时不会死锁
+        """
+        if not self.errors and not replace:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            models.LogErrorSignature.objects.bulk_create([
+                models.LogErrorSignature(
+                    signature=signature, level=summary.record.level, logger=summary.record.logger[:255],
+                    exception=summary.record.exception and summary.record.exception[:255], title=summary.record.title,
+                    sample=summary.record.sample, first_seen=summary.first_seen, last_seen=summary.last_seen,
+                )
+                for signature, summary in self.errors.items()
+            ], batch_size=500, ignore_conflicts=True)
+            occurrences = models.LogErrorOccurrence.objects.select_for_update().filter(job_id=job.id)
+            if not replace:
+                occurrences = occurrences.filter(signature_id__in=models.LogErrorSignature.objects.filter(signature__in=self.errors).values("id"))
+            occurrences = {occurrence.signature_id: occurrence for occurrence in occurrences}
+            signatures = {
+                signature.id: signature for signature in models.LogErrorSignature.objects.select_for_update().filter(
+                    Q(signature__in=self.errors) | Q(id__in=occurrences),
+                ).order_by("id")
+            }
+            created, updated = [], []
+            for signature in signatures.values():
+                summary = self.errors.get(signature.signature)
+                occurrence = occurrences.pop(signature.id, None)
+                if summary is None:
+                    # 完整日志中已经没有的签名(远端日志被重新生成过)
+                    signature.count -= occurrence.count
+                    signature.job_count -= 1
+                    occurrence.delete()
+                    continue
+                signature.first_seen = min(signature.first_seen, summary.first_seen)
+                signature.last_seen = max(signature.last_seen, summary.last_seen)
+                if occurrence is None:
+                    signature.count += summary.count
+                    signature.job_count += 1
+                    created.append(models.LogErrorOccurrence(
+                        signature=signature, job_id=job.id, node_id=job.node_id, spider_id=job.spider_id, count=summary.count,
+                        first_offset=summary.record.offset, first_seen=summary.first_seen, last_seen=summary.last_seen,
+                    ))
+                    continue
+                count = summary.count if replace else occurrence.count + summary.count
+                signature.count += count - occurrence.count
+                occurrence.count = count
+                if replace:
+                    occurrence.first_offset, occurrence.first_seen, occurrence.last_seen = summary.record.offset, summary.first_seen, summary.last_seen
+                else:
+                    occurrence.first_seen = min(occurrence.first_seen, summary.first_seen)
+                    occurrence.last_seen = max(occurrence.last_seen, summary.last_seen)
+                updated.append(occurrence)
+            for signature in signatures.values():
+                signature.update_time = now
+            models.LogErrorSignature.objects.bulk_update(
+                signatures.values(), ["count", "job_count", "first_seen", "last_seen", "update_time"], batch_size=500,
+            )
+            models.LogErrorOccurrence.objects.bulk_create(created, batch_size=500)
+            models.LogErrorOccurrence.objects.bulk_update(updated, ["count", "first_offset", "first_seen", "last_seen"], batch_size=500)
@@ -0,0 +1,408 @@
+import mmap
+import os
+import re
+import struct
+import uuid
+import zlib
+import requests
+from collections import deque
+from logging import getLogger
+from django.conf import settings
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from django_sched.sched import BaseScheduler
+from . import models, scrapyd_api, logindex
+from .lease import get_lease
+from .utils import get_setting
+
+
+logger = getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def cache_dir() -> str:
+    return str(get_setting("LOG_CACHE_DIR") or os.path.join(settings.MEDIA_ROOT, "scrapyd_logs"))
+
+
+def cache_path(job: models.BaseJob) -> str:
+    return os.path.join(cache_dir(), str(job.node_id), job.project.name, job.spider.name, f"{job.job_id}.log")
+
+
+def _content_range_total(resp) -> int | None:
+    """解析 Content-Range: bytes 0-99/1000 或 bytes */1000 中的总大小"""
+    match = re.search(r"/(\d+)\s*$", resp.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
+
+def _reset(state: models.JobLogState, start: int, job: models.BaseJob):
+    """丢弃本地缓存从远端偏移 start 重新开始; 之前累加的错误索引来自旧的日志内容, 一并清空后重新解析"""
+    state.start = state.offset = state.index_offset = start
+    if os.path.exists(state.path):
+        os.remove(state.path)
+    if state.archive_path is None:
+        logindex.ErrorIndexer().save(job, replace=True)
+
+
+def _append(state: models.JobLogState, data: bytes):
+    """把远端 state.offset 之后的 data 追加到本地缓存并推进 state.offset"""
+    os.makedirs(os.path.dirname(state.path), exist_ok=True)
+    with open(state.path, "ab") as f:
+        # 上次写入后没有提交成功时, 丢弃多写的部分
+        f.truncate(state.offset - state.start)
+        f.write(data)
+    state.offset += len(data)
+
+
+def _read(chunks, skip: int = 0, limit: int = None) -> bytes:
+    """跳过 chunks 开头 skip 个字节后最多读取 limit 个字节"""
+    limit = limit if limit is not None else get_setting("LOG_FETCH_MAX_BYTES", 8 * 1024 * 1024)
+    parts, size = [], 0
+    for chunk in chunks:
+        if skip:
+            dropped = min(skip, len(chunk))
+            chunk, skip = chunk[dropped:], skip - dropped
+        chunk = chunk[:limit - size]
+        if chunk:
+            parts.append(chunk)
+            size += len(chunk)
+        if size >= limit:
+            break
+    return b"".join(parts)
+
+
+def fetch_tail(job: models.BaseJob, tail_bytes: int) -> tuple[int, bytes, int | None]:
+    """
+    首次查看时只拉取日志最后 tail_bytes 个字节
+    :return: (数据在远端日志中的起始偏移, 数据, 远端大小)
+    """
+    resp = scrapyd_api.request_job_file(job, job.log_url, suffix=tail_bytes)
+    with resp:
+        if resp.status_code == 416:
+            return 0, b"", _content_range_total(resp)
+        if resp.status_code == 206:
+            chunks = list(resp.iter_content(CHUNK_SIZE))
+            total = _content_range_total(resp)
+        else:
+            # 服务端忽略 Range, 只能下载整个文件, 只保留最后 tail_bytes 个字节
+            chunks, total, kept = deque(), 0, 0
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                chunks.append(chunk)
+                total, kept = total + len(chunk), kept + len(chunk)
+                while kept - len(chunks[0]) >= tail_bytes:
+                    kept -= len(chunks.popleft())
+    data = _read([b"".join(chunks)[-tail_bytes:]])
+    total = total if total is not None else len(data)
+    return total - len(data), data, total
+
+
+def fetch_range(job: models.BaseJob, offset: int) -> tuple[int, bytes, int | None]:
+    """
+    用 Range 请求拉取 offset 之后的新数据, 服务端忽略 Range 时跳过已有的部分; 远端日志变小时从头拉取
+    :return: (数据在远端日志中的起始偏移, 数据, 远端大小)
+    """
+    resp = scrapyd_api.request_job_file(job, job.log_url, start=offset)
+    with resp:
+        total = _content_range_total(resp)
+        if resp.status_code == 200:
+            total = int(resp.headers.get("Content-Length") or 0) or None
+        if total is not None and total < offset:
+            # 远端日志被截断或重新生成, 从头开始
+            if resp.status_code == 200:
+                return 0, _read(resp.iter_content(CHUNK_SIZE)), total
+            return fetch_range(job, 0)
+        if resp.status_code == 416:
+            return offset, b"", total
+        if resp.status_code == 206:
+            return offset, _read(resp.iter_content(CHUNK_SIZE)), total
+        # 服务端忽略 Range 返回了整个文件
+        return offset, _read(resp.iter_content(CHUNK_SIZE), skip=offset), total
+
+
+def fetch_new_bytes(job: models.BaseJob) -> tuple[models.JobLogState, int]:
+    """
+    增量拉取任务日志到本地缓存, 持久化字节偏移, 返回 (缓存状态, 本次新数据在远端日志中的起始偏移)
+    下载在事务外进行, 每次最多拉取 LOG_FETCH_MAX_BYTES 字节; 写入缓存和保存偏移时才锁定 JobLogState,
+    期间偏移已被同一任务的其他拉取推进时丢弃本次下载的数据, 直接使用对方的结果
+    """
+    state, created = models.JobLogState.objects.get_or_create(job_id=job.id, defaults={"path": cache_path(job)})
+    fetched = None
+    if job.log_url:
+        if created or not os.path.exists(state.path):
+            fetched = fetch_tail(job, get_setting("LOG_TAIL_BYTES", 64 * 1024))
+        else:
+            fetched = fetch_range(job, state.offset)
+    with transaction.atomic():
+        current = models.JobLogState.objects.select_for_update().get(pk=state.pk)
+        if current.start <= state.offset <= current.offset:
+            new_start = state.offset
+        else:
+            new_start = current.start
+        if fetched is not None and (current.start, current.offset) == (state.start, state.offset):
+            start, data, remote_size = fetched
+            if remote_size is not None:
+                current.remote_size = remote_size
+            if start != current.offset or not os.path.exists(current.path):
+                _reset(current, start, job)
+            new_start = start
+            _append(current, data)
+        if current.archive_path is None:
+            index_cached(current, job)
+        current.save()
+    return current, new_start
+
+
+def iter_cached(state: models.JobLogState, offset: int, limit: int = None):
+    """按块读取本地缓存中远端偏移 offset 之后的数据"""
+    if not os.path.exists(state.path):
+        return
+    position = max(offset, state.start) - state.start
+    remaining = limit if limit is not None else os.path.getsize(state.path) - position
+    with open(state.path, "rb") as f:
+        f.seek(position)
+        while remaining > 0 and (chunk := f.read(min(CHUNK_SIZE, remaining))):
+            remaining -= len(chunk)
+            yield chunk
+
+
+def index_cached(state: models.JobLogState, job: models.BaseJob):
+    """把本地缓存中 index_offset 之后新拉取的错误记录累加到错误索引, 还没结束的最后一条记录留到下一次"""
+    if not state.start <= state.index_offset <= state.offset:
+        # 首次只拉取了日志末尾或远端日志被重置过, 从缓存起点开始解析
+        state.index_offset = state.start
+    indexer = logindex.ErrorIndexer(state.index_offset)
+    for chunk in iter_cached(state, state.index_offset, state.offset - state.index_offset):
+        indexer.feed(chunk)
+    indexer.save(job)
+    state.index_offset = indexer.resume_offset
+
+
+# 归档索引: 每个块一条 (解压后偏移, 压缩后偏移, 日志级别标记), 最后一条记录文件总大小
+INDEX_RECORD = struct.Struct("<QQI")
+LEVEL_FLAGS = {b"WARNING": 1, b"ERROR": 2, b"CRITICAL": 4}
+LEVEL_PATTERN = re.compile(rb" (WARNING|ERROR|CRITICAL): ")
+
+
+def block_flags(block: bytes) -> int:
+    flags = 0
+    for level in set(LEVEL_PATTERN.findall(block)):
+        flags |= LEVEL_FLAGS[level]
+    return flags
+
+
+class BlockWriter:
+    """
+    把日志按行切成约 block_size 的块, 每块独立 zlib 压缩后追加到数据文件, 块的偏移写入索引文件
+    块总是在换行处切分, 一行不会跨块; 写入时使用各自独立的临时文件, 同时归档同一任务也不会互相覆盖
+    """
+
+    def __init__(self, path: str, block_size: int = 256 * 1024):
+        self.path = path
+        self.block_size = block_size
+        self.buffer = b""
+        self.size = self.compressed_size = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        suffix = f".{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+        self.temp_paths = (path + suffix, path + ".idx" + suffix)
+        self.data = open(self.temp_paths[0], "wb")
+        self.index = open(self.temp_paths[1], "wb")
+
+    def _flush(self, block: bytes):
+        compressed = zlib.compress(block, 6)
+        self.index.write(INDEX_RECORD.pack(self.size, self.compressed_size, block_flags(block)))
+        self.data.write(compressed)
+        self.size += len(block)
+        self.compressed_size += len(compressed)
+
+    def write(self, chunk: bytes):
+        self.buffer += chunk
+        while len(self.buffer) >= self.block_size:
+            cut = self.buffer.rfind(b"\n", 0, self.block_size) + 1 or self.block_size
+            self._flush(self.buffer[:cut])
+            self.buffer = self.buffer[cut:]
+
+    def close(self):
+        if self.buffer:
+            self._flush(self.buffer)
+            self.buffer = b""
+        self.index.write(INDEX_RECORD.pack(self.size, self.compressed_size, 0))
+        self.data.close()
+        self.index.close()
+        # 写完后再替换, 读取方不会看到写了一半的归档
+        os.replace(self.temp_paths[0], self.path)
+        os.replace(self.temp_paths[1], self.path + ".idx")
+
+    def abort(self):
+        self.data.close()
+        self.index.close()
+        for path in self.temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ArchivedLog:
+    """
+    通过 mmap 随机读取块压缩的归档日志, 读取任意区间只解压覆盖该区间的块
+    用法: with ArchivedLog(path) as log: log.read(offset, size)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        self._files = [open(self.path, "rb"), open(self.path + ".idx", "rb")]
+        self.index = mmap.mmap(self._files[1].fileno(), 0, access=mmap.ACCESS_READ)
+        # 空日志的数据文件为空, 不能 mmap
+        size = os.fstat(self._files[0].fileno()).st_size
+        self.data = mmap.mmap(self._files[0].fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.blocks = len(self.index) // INDEX_RECORD.size - 1
+        self.size = self._record(self.blocks)[0]
+        return self
+
+    def __exit__(self, *args):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.index.close()
+        for f in self._files:
+            f.close()
+
+    def _record(self, i: int) -> tuple[int, int, int]:
+        return INDEX_RECORD.unpack_from(self.index, i * INDEX_RECORD.size)
+
+    def _find_block(self, offset: int) -> int:
+        """二分查找包含 offset 的块, 只读取索引中用到的记录"""
+        low, high = 0, self.blocks - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._record(middle)[0] <= offset:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def block(self, i: int) -> tuple[int, bytes, int]:
+        """返回第 i 块的 (解压后起始偏移, 内容, 日志级别标记)"""
+        start, compressed_start, flags = self._record(i)
+        compressed_end = self._record(i + 1)[1]
+        return start, zlib.decompress(self.data[compressed_start:compressed_end]), flags
+
+    def read(self, offset: int, size: int) -> bytes:
+        offset = max(0, offset)
+        end = min(offset + size, self.size)
+        if offset >= end:
+            return b""
+        parts = []
+        i = self._find_block(offset)
+        while i < self.blocks:
+            start, content, _ = self.block(i)
+            if start >= end:
+                break
+            parts.append(content[max(0, offset - start):end - start])
+            i += 1
+        return b"".join(parts)
+
+    def grep(self, pattern: bytes = None, levels: int = 0, limit: int = 1000) -> list[tuple[int, bytes]]:
+        """
+        返回匹配的行 [(偏移, 行)], levels 为 LEVEL_FLAGS 的组合时跳过不含这些级别的块, 不需要解压
+        pattern 为空时返回指定级别的日志行, 不是合法的正则表达式时抛出 ValueError
+        """
+        try:
+            regex = re.compile(pattern) if pattern else None
+        except re.error as e:
+            raise ValueError(f"无效的正则表达式: {e}") from e
+        level_regex = re.compile(rb" (%s): " % b"|".join(name for name, flag in LEVEL_FLAGS.items() if flag & levels)) if levels else None
+        matches = []
+        for i in range(self.blocks):
+            if levels and not self._record(i)[2] & levels:
+                continue
+            start, content, _ = self.block(i)
+            position = 0
+            for line in content.splitlines(keepends=True):
+                if (level_regex is None or level_regex.search(line)) and (regex is None or regex.search(line)):
+                    matches.append((start + position, line.rstrip(b"\r\n")))
+                    if len(matches) >= limit:
+                        return matches
+                position += len(line)
+        return matches
+
+
+def has_archive(state: models.JobLogState) -> bool:
+    return bool(state.archive_path) and os.path.exists(state.archive_path)
+
+
+def archive_path(job: models.BaseJob) -> str:
+    return cache_path(job) + "z"
+
+
+def archive_job_log(job: models.BaseJob) -> models.JobLogState:
+    """
+    把已结束任务的完整日志下载一次, 按块压缩归档到本地, 成功后删除增量拉取的缓存
+    下载时同时解析错误记录, 用完整日志的结果替换增量拉取时累加的错误索引
+    """
+    state, _ = models.JobLogState.objects.get_or_create(job_id=job.id, defaults={"path": cache_path(job)})
+    path = archive_path(job)
+    writer = BlockWriter(path, block_size=get_setting("LOG_ARCHIVE_BLOCK_SIZE", 256 * 1024))
+    indexer = logindex.ErrorIndexer()
+    try:
+        resp = scrapyd_api.request_job_file(job, job.log_url)
+        with resp:
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                writer.write(chunk)
+                indexer.feed(chunk)
+        writer.close()
+        indexer.close()
+    except Exception as e:
+        writer.abort()
+        state.archive_error = str(e)[:500]
+        if isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code == 404:
+            # 日志已被 Scrapyd 轮转删除, 不再重试
+            state.archive_time = timezone.now()
+        state.save(update_fields=["archive_error", "archive_time", "update_time"])
+        raise
+    with transaction.atomic():
+        # 与增量拉取互斥, 归档后增量拉取不再累加错误索引
+        state = models.JobLogState.objects.select_for_update().get(pk=state.pk)
+        indexer.save(job, replace=True)
+        state.archive_path = path
+        state.archive_size = state.index_offset = writer.size
+        state.archive_compressed_size = writer.compressed_size
+        state.archive_time = timezone.now()
+        state.archive_error = None
+        if os.path.exists(state.path):
+            os.remove(state.path)
+        state.start = state.offset = 0
+        state.save()
+    return state
+
+
+class LogArchiveScheduler(BaseScheduler):
+    """
+    把已结束任务的日志拉取到本地块压缩归档, 避免 Scrapyd 按 jobs_to_keep 轮转后日志丢失
+    多进程部署时通过租约保证只有一个进程归档; 归档失败的任务 LOG_ARCHIVE_RETRY_DELAY 秒内不再重试, 不会挤占其他任务
+    """
+    interval = 300
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lease = get_lease("log-archive", ttl=self.interval)
+
+    def schedule(self, now):
+        retry_before = now - timedelta(seconds=get_setting("LOG_ARCHIVE_RETRY_DELAY", 3600))
+        jobs = models.Job.objects.filter(
+            status=models.JobStatus.FINISHED, log_url__isnull=False,
+        ).exclude(log_state__archive_time__isnull=False).exclude(
+            log_state__archive_error__isnull=False, log_state__update_time__gte=retry_before,
+        ).select_related("node", "project", "spider").order_by("-end_time")
+        archived = 0
+        for job in jobs[:get_setting("LOG_ARCHIVE_BATCH_SIZE", 20)]:
+            # 每个任务前续期, 下载耗时超过租约时让出给其他进程
+            if self.lease is not None and self.lease.acquire() is None:
+                break
+            try:
+                archive_job_log(job)
+                archived += 1
+            except Exception as e:
+                self.logger.warning(f"[LogArchive] 归档任务{job.job_id}的日志失败: {e}")
+        if archived:
+            self.logger.info(f"[LogArchive] 归档{archived}个任务的日志")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django_scrapyd_manager import models, samples
+
+
+class Command(BaseCommand):
+    help = "把已有的 JobInfoLog 完整采样改写为关键帧 + 压缩差量"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="每批处理的任务数")
+        parser.add_argument("--codec", choices=models.JobInfoCodec.values, help="压缩方式, 默认使用 JOB_INFO_CODEC")
+
+    def handle(self, *args, batch_size, codec, **options):
+        compacted = samples.compact_job_info_logs(batch_size=batch_size, codec=codec)
+        self.stdout.write(self.style.SUCCESS(f"已改写{compacted}条采样"))
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:25
+# 基线 models.py 与 0002 之间已有的差异(GuardianLock 已删除、create_time 改为 default=timezone.now 等), 与守护策略无关, 单独迁移
+
+import django.core.validators
+import django.utils.timezone
+import django_scrapyd_manager.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0002_spidergroup_code'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='GuardianLock',
+        ),
+        migrations.AlterField(
+            model_name='guardian',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='guardianlog',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='jobinfolog',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='node',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='projectversion',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='projectversion',
+            name='egg_file',
+            field=models.FileField(blank=True, null=True, upload_to=django_scrapyd_manager.models.EggPath(), verbose_name='Egg 文件'),
+        ),
+        migrations.AlterField(
+            model_name='spider',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='spidergroup',
+            name='code',
+            field=models.CharField(blank=True, max_length=100, null=True, validators=[django.core.validators.RegexValidator(code='invalid_code', message='代号只能包含英文字母', regex='^[a-zA-Z_-]*$')], verbose_name='代号'),
+        ),
+        migrations.AlterField(
+            model_name='spidergroup',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+        migrations.AlterField(
+            model_name='spiderregistry',
+            name='create_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间'),
+        ),
+    ]
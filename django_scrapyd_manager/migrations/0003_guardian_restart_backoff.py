@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0002_sync_baseline_models'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guardian',
+            name='backoff_base',
+            field=models.IntegerField(default=30, verbose_name='退避基数(秒)'),
+        ),
+        migrations.AddField(
+            model_name='guardian',
+            name='backoff_max',
+            field=models.IntegerField(default=3600, verbose_name='最大退避(秒)'),
+        ),
+        migrations.AddField(
+            model_name='guardian',
+            name='budget_window',
+            field=models.IntegerField(default=3600, verbose_name='重启限额窗口(秒)'),
+        ),
+        migrations.AddField(
+            model_name='guardian',
+            name='quarantined',
+            field=models.BooleanField(default=False, verbose_name='已隔离'),
+        ),
+        migrations.AddField(
+            model_name='guardian',
+            name='restart_budget',
+            field=models.IntegerField(default=5, verbose_name='窗口内最大重启次数'),
+        ),
+        migrations.AddField(
+            model_name='guardian',
+            name='restart_state',
+            field=models.JSONField(blank=True, default=dict, verbose_name='重启状态'),
+        ),
+        migrations.AlterField(
+            model_name='guardian',
+            name='strategy',
+            field=models.CharField(choices=[('restart_always', '始终重启'), ('restart_backoff', '指数退避重启'), ('restart_budget', '退避重启+限额隔离')], default='restart_always', max_length=20, verbose_name='守护策略'),
+        ),
+        migrations.AlterField(
+            model_name='guardianlog',
+            name='action',
+            field=models.CharField(choices=[('publish_version', '发布项目'), ('start_spider', '启动爬虫'), ('quarantine_spider', '隔离爬虫')], max_length=100, verbose_name='执行动作'),
+        ),
+    ]
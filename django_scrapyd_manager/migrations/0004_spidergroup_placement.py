@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0003_guardian_restart_backoff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='max_slots',
+            field=models.IntegerField(default=0, help_text='节点可同时运行/等待的任务数, 0表示不限制', verbose_name='最大并发槽位'),
+        ),
+        migrations.AddField(
+            model_name='spidergroup',
+            name='node_pool',
+            field=models.ManyToManyField(blank=True, db_constraint=False, related_name='pooled_groups', to='django_scrapyd_manager.node', verbose_name='节点池'),
+        ),
+        migrations.AddField(
+            model_name='spidergroup',
+            name='placement',
+            field=models.CharField(choices=[('fixed', '固定节点'), ('pool', '节点池(按负载)')], default='fixed', max_length=10, verbose_name='调度方式'),
+        ),
+    ]
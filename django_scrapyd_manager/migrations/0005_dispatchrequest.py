@@ -0,0 +1,48 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0004_spidergroup_placement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='max_pending',
+            field=models.IntegerField(default=0, help_text='调度队列只在节点pending数低于该值时下发任务, 0表示使用全局配置', verbose_name='最大等待任务数'),
+        ),
+        migrations.CreateModel(
+            name='DispatchRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spider_name', models.CharField(max_length=255, verbose_name='爬虫名')),
+                ('fp', models.CharField(max_length=32, verbose_name='爬虫指纹')),
+                ('kwargs', models.JSONField(blank=True, default=dict, verbose_name='Scrapy自定义参数')),
+                ('settings', models.JSONField(blank=True, default=dict, verbose_name='Scrapy自定义设置')),
+                ('priority', models.IntegerField(default=0, help_text='数值越大越先下发', verbose_name='优先级')),
+                ('status', models.CharField(choices=[('queued', '排队中'), ('dispatched', '已下发'), ('failed', '下发失败'), ('cancelled', '已取消')], default='queued', max_length=20, verbose_name='状态')),
+                ('attempts', models.IntegerField(default=0, verbose_name='下发次数')),
+                ('job_id', models.CharField(blank=True, max_length=255, null=True, verbose_name='任务ID')),
+                ('message', models.TextField(blank=True, null=True, verbose_name='详细日志')),
+                ('enqueue_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='入队时间')),
+                ('dispatch_time', models.DateTimeField(blank=True, null=True, verbose_name='下发时间')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('node', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='dispatch_requests', to='django_scrapyd_manager.node', verbose_name='节点')),
+                ('spider', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='dispatch_requests', to='django_scrapyd_manager.spider', verbose_name='爬虫')),
+            ],
+            options={
+                'verbose_name': 'Scrapy Dispatch Queue',
+                'verbose_name_plural': 'Scrapy Dispatch Queue',
+                'db_table': 'scrapy_dispatch_request',
+                'ordering': ['-priority', 'enqueue_time'],
+                'indexes': [models.Index(fields=['status', 'node', '-priority', 'enqueue_time'], name='dispatch_queue_idx')],
+            },
+        ),
+    ]
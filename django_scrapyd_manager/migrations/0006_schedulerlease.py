@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0005_dispatchrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='租约名')),
+                ('owner', models.CharField(blank=True, max_length=255, null=True, verbose_name='持有者')),
+                ('token', models.BigIntegerField(default=0, verbose_name='令牌')),
+                ('expire_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='过期时间')),
+                ('acquire_time', models.DateTimeField(blank=True, null=True, verbose_name='获取时间')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': 'Scheduler Lease',
+                'verbose_name_plural': 'Scheduler Lease',
+                'db_table': 'scrapy_scheduler_lease',
+            },
+        ),
+        migrations.AddField(
+            model_name='guardian',
+            name='fencing_token',
+            field=models.BigIntegerField(default=0, verbose_name='最近执行的租约令牌'),
+        ),
+    ]
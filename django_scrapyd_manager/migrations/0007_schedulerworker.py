@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0006_schedulerlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchedulerWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Worker')),
+                ('scheduler', models.CharField(max_length=100, verbose_name='调度器')),
+                ('heartbeat', models.DateTimeField(default=django.utils.timezone.now, verbose_name='心跳时间')),
+                ('nodes', models.JSONField(blank=True, default=list, verbose_name='负责的节点')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': 'Scheduler Worker',
+                'verbose_name_plural': 'Scheduler Worker',
+                'db_table': 'scrapy_scheduler_worker',
+                'ordering': ['scheduler', 'name'],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0007_schedulerworker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GuardianLogDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('spider_name', models.CharField(blank=True, default='', max_length=100, verbose_name='爬虫名')),
+                ('action', models.CharField(choices=[('publish_version', '发布项目'), ('start_spider', '启动爬虫'), ('quarantine_spider', '隔离爬虫')], max_length=100, verbose_name='执行动作')),
+                ('success', models.BooleanField(default=True, verbose_name='成功')),
+                ('count', models.IntegerField(default=0, verbose_name='次数')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': 'Scrapy Guardian Log Daily',
+                'verbose_name_plural': 'Scrapy Guardian Log Daily',
+                'db_table': 'scrapy_guardian_log_daily',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='guardianlog',
+            name='last_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='最近一次时间'),
+        ),
+        migrations.AddField(
+            model_name='guardianlog',
+            name='repeat_count',
+            field=models.IntegerField(default=1, verbose_name='连续次数'),
+        ),
+        migrations.AddIndex(
+            model_name='guardianlog',
+            index=models.Index(fields=['guardian', '-create_time'], name='guardian_log_guardian_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guardianlog',
+            index=models.Index(fields=['create_time'], name='guardian_log_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='guardianlogdaily',
+            name='guardian',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_logs', to='django_scrapyd_manager.guardian', verbose_name='守护任务'),
+        ),
+        migrations.AddField(
+            model_name='guardianlogdaily',
+            name='node',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='django_scrapyd_manager.node', verbose_name='节点'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='guardianlogdaily',
+            unique_together={('guardian', 'node', 'date', 'spider_name', 'action', 'success')},
+        ),
+    ]
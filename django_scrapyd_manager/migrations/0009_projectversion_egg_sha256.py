@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0008_guardianlog_compaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectversion',
+            name='egg_sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True, verbose_name='Egg SHA256'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:40
+
+from django.db import migrations, models
+
+
+def mark_existing_eggs_present(apps, schema_editor):
+    # 已有 egg 的版本先视为存在, 由定期扫描修正
+    ProjectVersion = apps.get_model("django_scrapyd_manager", "ProjectVersion")
+    ProjectVersion.objects.exclude(egg_file__isnull=True).exclude(egg_file="").update(egg_present=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0009_projectversion_egg_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectversion',
+            name='egg_present',
+            field=models.BooleanField(default=False, verbose_name='Egg 文件存在'),
+        ),
+        migrations.AddField(
+            model_name='projectversion',
+            name='egg_size',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='Egg 大小'),
+        ),
+        migrations.AddField(
+            model_name='projectversion',
+            name='egg_stored_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Egg 上传时间'),
+        ),
+        migrations.RunPython(mark_existing_eggs_present, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0010_projectversion_egg_metadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', '-start_time'], name='job_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['node', 'status', '-start_time'], name='job_node_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['project', 'status', '-start_time'], name='job_project_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobinfolog',
+            index=models.Index(fields=['job', '-create_time'], name='job_info_log_job_idx'),
+        ),
+    ]
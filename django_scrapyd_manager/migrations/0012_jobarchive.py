@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0011_job_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='node',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='%(class)ss', to='django_scrapyd_manager.node', verbose_name='节点'),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='project',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='%(class)ss', to='django_scrapyd_manager.project', verbose_name='项目'),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='spider',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='%(class)ss', to='django_scrapyd_manager.spiderregistry', verbose_name='爬虫'),
+        ),
+        migrations.CreateModel(
+            name='JobArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(blank=True, max_length=200, null=True, verbose_name='版本')),
+                ('job_id', models.CharField(max_length=255, verbose_name='任务ID')),
+                ('job_md5', models.CharField(max_length=32, unique=True, verbose_name='md5(job)')),
+                ('start_time', models.DateTimeField(verbose_name='开始时间')),
+                ('end_time', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('log_url', models.CharField(blank=True, max_length=255, null=True)),
+                ('items_url', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.CharField(choices=[('running', '运行中'), ('finished', '已结束'), ('pending', '启动中')], max_length=20, verbose_name='状态')),
+                ('pid', models.IntegerField(blank=True, null=True, verbose_name='进程ID')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('archive_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='归档时间')),
+                ('node', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='%(class)ss', to='django_scrapyd_manager.node', verbose_name='节点')),
+                ('project', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='%(class)ss', to='django_scrapyd_manager.project', verbose_name='项目')),
+                ('spider', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='%(class)ss', to='django_scrapyd_manager.spiderregistry', verbose_name='爬虫')),
+            ],
+            options={
+                'verbose_name': 'Scrapy Job Archive',
+                'verbose_name_plural': 'Scrapy Job Archive',
+                'db_table': 'scrapy_job_archive',
+                'indexes': [models.Index(fields=['-start_time'], name='job_archive_start_idx'), models.Index(fields=['node', '-start_time'], name='job_archive_node_idx'), models.Index(fields=['project', '-start_time'], name='job_archive_project_idx')],
+            },
+        ),
+    ]
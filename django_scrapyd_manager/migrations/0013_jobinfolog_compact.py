@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0012_jobarchive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobinfolog',
+            name='base',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='deltas', to='django_scrapyd_manager.jobinfolog', verbose_name='关键帧'),
+        ),
+        migrations.AddField(
+            model_name='jobinfolog',
+            name='codec',
+            field=models.CharField(choices=[('none', '不压缩'), ('zlib', 'zlib'), ('zstd', 'zstd')], default='none', max_length=10, verbose_name='压缩方式'),
+        ),
+        migrations.AddField(
+            model_name='jobinfolog',
+            name='data',
+            field=models.BinaryField(blank=True, null=True, verbose_name='压缩数据'),
+        ),
+    ]
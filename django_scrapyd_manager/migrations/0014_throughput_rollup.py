@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0013_jobinfolog_compact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='名称')),
+                ('position', models.BigIntegerField(default=0, verbose_name='已处理到的采样id')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': 'Scrapy Rollup Cursor',
+                'verbose_name_plural': 'Scrapy Rollup Cursor',
+                'db_table': 'scrapy_rollup_cursor',
+            },
+        ),
+        migrations.CreateModel(
+            name='ThroughputRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField(choices=[(60, '1分钟'), (3600, '1小时'), (86400, '1天')], verbose_name='粒度')),
+                ('bucket', models.DateTimeField(verbose_name='时间')),
+                ('items', models.BigIntegerField(default=0, verbose_name='Item数')),
+                ('requests', models.BigIntegerField(default=0, verbose_name='响应数')),
+                ('errors', models.BigIntegerField(default=0, verbose_name='错误数')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('node', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='throughput_rollups', to='django_scrapyd_manager.node', verbose_name='节点')),
+                ('spider', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='throughput_rollups', to='django_scrapyd_manager.spiderregistry', verbose_name='爬虫')),
+            ],
+            options={
+                'verbose_name': 'Scrapy Throughput',
+                'verbose_name_plural': 'Scrapy Throughput',
+                'db_table': 'scrapy_throughput_rollup',
+                'indexes': [models.Index(fields=['resolution', 'spider', 'bucket'], name='throughput_spider_idx'), models.Index(fields=['resolution', 'node', 'bucket'], name='throughput_node_idx')],
+                'unique_together': {('resolution', 'bucket', 'node', 'spider')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0014_throughput_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobLogState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, verbose_name='本地缓存路径')),
+                ('start', models.BigIntegerField(default=0, verbose_name='缓存起始偏移')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='已拉取到的偏移')),
+                ('remote_size', models.BigIntegerField(blank=True, null=True, verbose_name='远端大小')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('job', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='log_state', to='django_scrapyd_manager.job', verbose_name='Job')),
+            ],
+            options={
+                'verbose_name': 'Scrapy Job Log',
+                'verbose_name_plural': 'Scrapy Job Log',
+                'db_table': 'scrapy_job_log_state',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0015_joblogstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='joblogstate',
+            name='archive_compressed_size',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='归档后大小'),
+        ),
+        migrations.AddField(
+            model_name='joblogstate',
+            name='archive_error',
+            field=models.CharField(blank=True, max_length=500, null=True, verbose_name='归档失败原因'),
+        ),
+        migrations.AddField(
+            model_name='joblogstate',
+            name='archive_path',
+            field=models.CharField(blank=True, max_length=500, null=True, verbose_name='归档路径'),
+        ),
+        migrations.AddField(
+            model_name='joblogstate',
+            name='archive_size',
+            field=models.BigIntegerField(blank=True, null=True, verbose_name='归档前大小'),
+        ),
+        migrations.AddField(
+            model_name='joblogstate',
+            name='archive_time',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='归档时间'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0016_joblogstate_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogErrorSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signature', models.CharField(max_length=40, unique=True, verbose_name='签名')),
+                ('level', models.CharField(max_length=10, verbose_name='级别')),
+                ('logger', models.CharField(max_length=255, verbose_name='Logger')),
+                ('exception', models.CharField(blank=True, max_length=255, null=True, verbose_name='异常')),
+                ('title', models.CharField(max_length=255, verbose_name='摘要')),
+                ('sample', models.TextField(verbose_name='示例')),
+                ('count', models.BigIntegerField(default=0, verbose_name='出现次数')),
+                ('job_count', models.IntegerField(default=0, verbose_name='任务数')),
+                ('first_seen', models.DateTimeField(verbose_name='首次出现')),
+                ('last_seen', models.DateTimeField(db_index=True, verbose_name='最近出现')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': 'Scrapy Log Error',
+                'verbose_name_plural': 'Scrapy Log Error',
+                'db_table': 'scrapy_log_error_signature',
+            },
+        ),
+        migrations.AddField(
+            model_name='joblogstate',
+            name='index_offset',
+            field=models.BigIntegerField(default=0, verbose_name='错误索引偏移'),
+        ),
+        migrations.CreateModel(
+            name='LogErrorOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0, verbose_name='出现次数')),
+                ('first_offset', models.BigIntegerField(default=0, verbose_name='首次出现偏移')),
+                ('first_seen', models.DateTimeField(verbose_name='首次出现')),
+                ('last_seen', models.DateTimeField(verbose_name='最近出现')),
+                ('job', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='log_errors', to='django_scrapyd_manager.job', verbose_name='Job')),
+                ('node', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='log_errors', to='django_scrapyd_manager.node', verbose_name='节点')),
+                ('spider', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='log_errors', to='django_scrapyd_manager.spiderregistry', verbose_name='爬虫')),
+                ('signature', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='django_scrapyd_manager.logerrorsignature', verbose_name='签名')),
+            ],
+            options={
+                'verbose_name': 'Scrapy Log Error Job',
+                'verbose_name_plural': 'Scrapy Log Error Job',
+                'db_table': 'scrapy_log_error_occurrence',
+                'indexes': [models.Index(fields=['signature', 'last_seen'], name='log_error_signature_idx'), models.Index(fields=['spider', 'last_seen'], name='log_error_spider_idx')],
+                'unique_together': {('signature', 'job')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0017_log_error_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='guardianlog',
+            name='guardian_log_time_idx',
+        ),
+        migrations.AddIndex(
+            model_name='guardianlog',
+            index=models.Index(fields=['last_time'], name='guardian_log_last_time_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0018_guardianlog_last_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemoteDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project', models.CharField(max_length=255, verbose_name='项目')),
+                ('version', models.CharField(blank=True, default='', help_text='为空表示删除整个项目', max_length=255, verbose_name='版本')),
+                ('attempts', models.IntegerField(default=0, verbose_name='尝试次数')),
+                ('message', models.TextField(blank=True, null=True, verbose_name='详细日志')),
+                ('create_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('update_time', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('node', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='remote_deletions', to='django_scrapyd_manager.node', verbose_name='节点')),
+            ],
+            options={
+                'verbose_name': 'Scrapyd Remote Deletion',
+                'verbose_name_plural': 'Scrapyd Remote Deletion',
+                'db_table': 'scrapy_remote_deletion',
+                'unique_together': {('node', 'project', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0019_remote_deletion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dispatchrequest',
+            name='spider',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dispatch_requests', to='django_scrapyd_manager.spider', verbose_name='爬虫'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0020_dispatchrequest_spider_set_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rollupcursor',
+            name='gaps',
+            field=models.JSONField(blank=True, default=dict, help_text='游标之前尚未提交的采样id及发现时间, 超时后放弃', verbose_name='尚未出现的采样id'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0021_rollupcursor_gaps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dispatchrequest',
+            name='next_attempt_time',
+            field=models.DateTimeField(blank=True, help_text='下发失败后退避, 为空表示立即下发', null=True, verbose_name='下次下发时间'),
+        ),
+        migrations.AlterField(
+            model_name='dispatchrequest',
+            name='status',
+            field=models.CharField(choices=[('queued', '排队中'), ('dispatching', '下发中'), ('dispatched', '已下发'), ('failed', '下发失败'), ('cancelled', '已取消')], default='queued', max_length=20, verbose_name='状态'),
+        ),
+    ]
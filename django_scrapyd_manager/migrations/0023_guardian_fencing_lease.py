@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_scrapyd_manager', '0022_dispatchrequest_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='guardian',
+            name='fencing_lease',
+            field=models.CharField(blank=True, default='', help_text='不同租约的令牌各自递增, 只与同一租约的令牌比较', max_length=100, verbose_name='令牌所属租约'),
+        ),
+    ]
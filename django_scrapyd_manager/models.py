@@ -6,6 +6,7 @@ from django.db import models
 from django.utils import timezone
 from django.utils.deconstruct import deconstructible
 from .utils import get_md5
+from . import jsondelta
 import json
 import os
 
@@ -19,6 +20,8 @@ class Node(models.Model):
     auth = models.BooleanField(default=False, verbose_name="是否需要认证")
     username = models.CharField(max_length=255, blank=True, null=True)
     password = models.CharField(max_length=255, blank=True, null=True)
+    max_slots = models.IntegerField(default=0, verbose_name="最大并发槽位", help_text="节点可同时运行/等待的任务数, 0表示不限制")
+    max_pending = models.IntegerField(default=0, verbose_name="最大等待任务数", help_text="调度队列只在节点pending数低于该值时下发任务, 0表示使用全局配置")
     create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
     update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
@@ -106,6 +109,10 @@ class ProjectVersion(models.Model):
     version = models.CharField(max_length=255, verbose_name='版本')
     is_spider_synced = models.BooleanField(default=False, verbose_name="是否已同步当前版本爬虫")
     egg_file = models.FileField(upload_to=EggPath(), null=True, blank=True, verbose_name="Egg 文件")
+    egg_sha256 = models.CharField(max_length=64, null=True, blank=True, db_index=True, verbose_name="Egg SHA256")
+    egg_size = models.BigIntegerField(null=True, blank=True, verbose_name="Egg 大小")
+    egg_stored_at = models.DateTimeField(null=True, blank=True, verbose_name="Egg 上传时间")
+    egg_present = models.BooleanField(default=False, verbose_name="Egg 文件存在")
     description = models.CharField(max_length=200, null=True, blank=True, verbose_name="描述")
     sync_mode = models.CharField(max_length=10, choices=SyncMode.choices, default=SyncMode.AUTO, verbose_name="同步模式")
     scrapyd_exists = models.BooleanField(default=False, verbose_name="在Scrapyd中存在")
@@ -198,6 +205,11 @@ class Spider(models.Model):
         ordering = ["-version", "name"]
 
 
+class PlacementMode(models.TextChoices):
+    FIXED = "fixed", "固定节点"
+    POOL = "pool", "节点池(按负载)"
+
+
 class SpiderGroup(models.Model):
     name = models.CharField(max_length=255, verbose_name="任务组名称", unique=True)
     code = models.CharField(max_length=100, null=True, blank=True, verbose_name="代号", validators=[
@@ -208,6 +220,8 @@ class SpiderGroup(models.Model):
             )
         ])
     node = models.ForeignKey(Node, db_constraint=False, on_delete=models.DO_NOTHING, verbose_name="节点")
+    placement = models.CharField(max_length=10, choices=PlacementMode.choices, default=PlacementMode.FIXED, verbose_name="调度方式")
+    node_pool = models.ManyToManyField(Node, blank=True, db_constraint=False, related_name="pooled_groups", verbose_name="节点池")
     project = models.ForeignKey(Project, db_constraint=False, verbose_name='项目', on_delete=models.CASCADE)
     version = models.ForeignKey(ProjectVersion, verbose_name='版本', null=True, blank=True, on_delete=models.CASCADE)
     spiders = models.ManyToManyField(SpiderRegistry, db_constraint=False, related_name="spiders", verbose_name="爬虫")
@@ -221,6 +235,16 @@ class SpiderGroup(models.Model):
     def resolved_version(self):
         return self.version if self.version else self.project.latest_version
 
+    @property
+    def placement_nodes(self) -> list[Node]:
+        """可调度的节点, 节点池模式下总是包含组所在节点"""
+        if self.placement != PlacementMode.POOL:
+            return [self.node]
+        nodes = list(self.node_pool.all())
+        if self.node not in nodes:
+            nodes.insert(0, self.node)
+        return nodes
+
     @property
     def resolved_spiders(self):
         version = self.resolved_version
@@ -250,10 +274,10 @@ class JobStatus(models.TextChoices):
     PENDING = "pending", "启动中"
 
 
-class Job(models.Model):
-    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, verbose_name="节点", db_constraint=False, related_name="jobs")
-    project = models.ForeignKey(Project, on_delete=models.DO_NOTHING, verbose_name="项目", db_constraint=False, related_name="jobs")
-    spider = models.ForeignKey(SpiderRegistry, on_delete=models.DO_NOTHING, verbose_name="爬虫", db_constraint=False, related_name="jobs")
+class BaseJob(models.Model):
+    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, verbose_name="节点", db_constraint=False, related_name="%(class)ss")
+    project = models.ForeignKey(Project, on_delete=models.DO_NOTHING, verbose_name="项目", db_constraint=False, related_name="%(class)ss")
+    spider = models.ForeignKey(SpiderRegistry, on_delete=models.DO_NOTHING, verbose_name="爬虫", db_constraint=False, related_name="%(class)ss")
     version = models.CharField(max_length=200, verbose_name="版本", null=True, blank=True)
     job_id = models.CharField(max_length=255, verbose_name="任务ID")
     job_md5 = models.CharField(max_length=32, verbose_name="md5(job)", unique=True)
@@ -291,29 +315,257 @@ class Job(models.Model):
         return self.version
 
     class Meta:
-        db_table = "scrapy_job"
-        verbose_name = verbose_name_plural = "Scrapy Job"
+        abstract = True
 
     def __str__(self):
         return self.job_id
 
 
+class Job(BaseJob):
+
+    class Meta:
+        db_table = "scrapy_job"
+        verbose_name = verbose_name_plural = "Scrapy Job"
+        indexes = [
+            # JobAdmin 默认按状态过滤并按 (-status, -start_time) 排序
+            models.Index(fields=["status", "-start_time"], name="job_status_start_idx"),
+            # sync_jobs 按 (node, status) 删除, JobAdmin 按节点过滤
+            models.Index(fields=["node", "status", "-start_time"], name="job_node_status_idx"),
+            # JobAdmin 按项目过滤
+            models.Index(fields=["project", "status", "-start_time"], name="job_project_status_idx"),
+        ]
+
+
+class JobArchive(BaseJob):
+    """已结束的历史任务, 由 RetentionScheduler 从 Job 表分批移入, 保留原 id, 只追加不修改"""
+    archive_time = models.DateTimeField(default=timezone.now, verbose_name="归档时间")
+
+    class Meta:
+        db_table = "scrapy_job_archive"
+        verbose_name = verbose_name_plural = "Scrapy Job Archive"
+        indexes = [
+            models.Index(fields=["-start_time"], name="job_archive_start_idx"),
+            models.Index(fields=["node", "-start_time"], name="job_archive_node_idx"),
+            models.Index(fields=["project", "-start_time"], name="job_archive_project_idx"),
+        ]
+
+
+class JobInfoCodec(models.TextChoices):
+    NONE = "none", "不压缩"
+    ZLIB = "zlib", "zlib"
+    ZSTD = "zstd", "zstd"
+
+
 class JobInfoLog(models.Model):
+    """
+    Job 状态采样
+    base 为空时是关键帧, 保存完整信息; 否则只保存相对关键帧 base 的差量(jsondelta.diff)
+    codec 不为 none 时 info 为空, 内容压缩后保存在 data 中; 读取完整信息统一用 get_info()
+    """
     job = models.ForeignKey(Job, on_delete=models.DO_NOTHING, verbose_name="Job", db_constraint=False, related_name="logs")
+    base = models.ForeignKey(
+        "self", null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name="deltas", verbose_name="关键帧",
+    )
     info = models.JSONField(null=True, blank=True, verbose_name="详情")
+    codec = models.CharField(max_length=10, choices=JobInfoCodec.choices, default=JobInfoCodec.NONE, verbose_name="压缩方式")
+    data = models.BinaryField(null=True, blank=True, verbose_name="压缩数据")
     create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
     update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
     class Meta:
         db_table = "scrapy_job_info_log"
         verbose_name = verbose_name_plural = "Scrapy Job Info"
+        indexes = [
+            models.Index(fields=["job", "-create_time"], name="job_info_log_job_idx"),
+        ]
 
     def __str__(self):
         return str(self.job)
 
+    @property
+    def payload(self) -> dict | None:
+        """本行保存的内容: 关键帧的完整信息或差量"""
+        if self.codec == JobInfoCodec.NONE:
+            return self.info
+        return json.loads(jsondelta.decompress(bytes(self.data), self.codec))
+
+    def get_info(self, base_info: dict = None) -> dict | None:
+        """还原完整信息, 批量读取时可以传入已还原的关键帧信息避免重复查询"""
+        if self.base_id is None:
+            return self.payload
+        if base_info is None:
+            base_info = JobInfoLog.objects.get(pk=self.base_id).get_info()
+        return jsondelta.apply(base_info or {}, self.payload)
+
+
+class JobLogState(models.Model):
+    """
+    任务日志在本地的缓存, 本地文件保存远端日志 [start, offset) 区间的字节
+    每次只用 Range 请求拉取 offset 之后的新数据; 任务结束后整个日志按块压缩归档到 archive_path
+    """
+    job = models.OneToOneField(Job, on_delete=models.DO_NOTHING, db_constraint=False, related_name="log_state", verbose_name="Job")
+    path = models.CharField(max_length=500, verbose_name="本地缓存路径")
+    start = models.BigIntegerField(default=0, verbose_name="缓存起始偏移")
+    offset = models.BigIntegerField(default=0, verbose_name="已拉取到的偏移")
+    remote_size = models.BigIntegerField(null=True, blank=True, verbose_name="远端大小")
+    archive_path = models.CharField(max_length=500, null=True, blank=True, verbose_name="归档路径")
+    archive_size = models.BigIntegerField(null=True, blank=True, verbose_name="归档前大小")
+    archive_compressed_size = models.BigIntegerField(null=True, blank=True, verbose_name="归档后大小")
+    archive_time = models.DateTimeField(null=True, blank=True, verbose_name="归档时间")
+    archive_error = models.CharField(max_length=500, null=True, blank=True, verbose_name="归档失败原因")
+    index_offset = models.BigIntegerField(default=0, verbose_name="错误索引偏移")
+    update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        db_table = "scrapy_job_log_state"
+        verbose_name = verbose_name_plural = "Scrapy Job Log"
+
+    def __str__(self):
+        return f"{self.job_id}: [{self.start}, {self.offset})"
+
+
+class LogErrorSignature(models.Model):
+    """
+    日志中 ERROR/CRITICAL 记录的签名: 有 Traceback 时由 logger、异常类型和调用栈计算, 否则由去掉数字、URL 等可变部分的消息计算
+    由 logindex 在拉取或归档日志时增量累加
+    """
+    signature = models.CharField(max_length=40, unique=True, verbose_name="签名")
+    level = models.CharField(max_length=10, verbose_name="级别")
+    logger = models.CharField(max_length=255, verbose_name="Logger")
+    exception = models.CharField(max_length=255, null=True, blank=True, verbose_name="异常")
+    title = models.CharField(max_length=255, verbose_name="摘要")
+    sample = models.TextField(verbose_name="示例")
+    count = models.BigIntegerField(default=0, verbose_name="出现次数")
+    job_count = models.IntegerField(default=0, verbose_name="任务数")
+    first_seen = models.DateTimeField(verbose_name="首次出现")
+    last_seen = models.DateTimeField(db_index=True, verbose_name="最近出现")
+    update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        db_table = "scrapy_log_error_signature"
+        verbose_name = verbose_name_plural = "Scrapy Log Error"
+
+    def __str__(self):
+        return self.title
+
+
+class LogErrorOccurrence(models.Model):
+    """某个签名在某个任务日志中的出现次数, first_offset 为第一次出现在日志中的字节偏移"""
+    signature = models.ForeignKey(LogErrorSignature, on_delete=models.CASCADE, db_constraint=False, related_name="occurrences", verbose_name="签名")
+    job = models.ForeignKey(Job, on_delete=models.DO_NOTHING, db_constraint=False, related_name="log_errors", verbose_name="Job")
+    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, db_constraint=False, related_name="log_errors", verbose_name="节点")
+    spider = models.ForeignKey(SpiderRegistry, on_delete=models.DO_NOTHING, db_constraint=False, related_name="log_errors", verbose_name="爬虫")
+    count = models.IntegerField(default=0, verbose_name="出现次数")
+    first_offset = models.BigIntegerField(default=0, verbose_name="首次出现偏移")
+    first_seen = models.DateTimeField(verbose_name="首次出现")
+    last_seen = models.DateTimeField(verbose_name="最近出现")
+
+    class Meta:
+        db_table = "scrapy_log_error_occurrence"
+        verbose_name = verbose_name_plural = "Scrapy Log Error Job"
+        unique_together = (("signature", "job"),)
+        indexes = [
+            models.Index(fields=["signature", "last_seen"], name="log_error_signature_idx"),
+            models.Index(fields=["spider", "last_seen"], name="log_error_spider_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.signature_id}@{self.job_id}"
+
+
+class RollupResolution(models.IntegerChoices):
+    MINUTE = 60, "1分钟"
+    HOUR = 3600, "1小时"
+    DAY = 86400, "1天"
+
+
+class ThroughputRollup(models.Model):
+    """按固定粒度汇总的爬虫吞吐, 由 rollups.ThroughputRollupScheduler 根据新的 JobInfoLog 采样增量累加"""
+    resolution = models.IntegerField(choices=RollupResolution.choices, verbose_name="粒度")
+    bucket = models.DateTimeField(verbose_name="时间")
+    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, db_constraint=False, related_name="throughput_rollups", verbose_name="节点")
+    spider = models.ForeignKey(SpiderRegistry, on_delete=models.DO_NOTHING, db_constraint=False, related_name="throughput_rollups", verbose_name="爬虫")
+    items = models.BigIntegerField(default=0, verbose_name="Item数")
+    requests = models.BigIntegerField(default=0, verbose_name="响应数")
+    errors = models.BigIntegerField(default=0, verbose_name="错误数")
+    update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        db_table = "scrapy_throughput_rollup"
+        verbose_name = verbose_name_plural = "Scrapy Throughput"
+        unique_together = (("resolution", "bucket", "node", "spider"),)
+        indexes = [
+            models.Index(fields=["resolution", "spider", "bucket"], name="throughput_spider_idx"),
+            models.Index(fields=["resolution", "node", "bucket"], name="throughput_node_idx"),
+        ]
+
+    def __str__(self):
+        return f"[{self.bucket}] {self.spider_id}@{self.node_id}"
+
+
+class RollupCursor(models.Model):
+    """增量汇总已处理到的 JobInfoLog id"""
+    name = models.CharField(max_length=100, unique=True, verbose_name="名称")
+    position = models.BigIntegerField(default=0, verbose_name="已处理到的采样id")
+    gaps = models.JSONField(default=dict, blank=True, verbose_name="尚未出现的采样id", help_text="游标之前尚未提交的采样id及发现时间, 超时后放弃")
+    update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        db_table = "scrapy_rollup_cursor"
+        verbose_name = verbose_name_plural = "Scrapy Rollup Cursor"
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+
+class DispatchStatus(models.TextChoices):
+    QUEUED = "queued", "排队中"
+    DISPATCHING = "dispatching", "下发中"
+    DISPATCHED = "dispatched", "已下发"
+    FAILED = "failed", "下发失败"
+    CANCELLED = "cancelled", "已取消"
+
+
+class DispatchRequest(models.Model):
+    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, verbose_name="节点", db_constraint=False, related_name="dispatch_requests")
+    # 版本被删除时爬虫随之删除, 保留 spider_name 后解除关联
+    spider = models.ForeignKey(Spider, null=True, blank=True, on_delete=models.SET_NULL, verbose_name="爬虫", db_constraint=False, related_name="dispatch_requests")
+    spider_name = models.CharField(max_length=255, verbose_name="爬虫名")
+    fp = models.CharField(max_length=32, verbose_name="爬虫指纹")
+    kwargs = models.JSONField(default=dict, blank=True, verbose_name="Scrapy自定义参数")
+    settings = models.JSONField(default=dict, blank=True, verbose_name="Scrapy自定义设置")
+    priority = models.IntegerField(default=0, verbose_name="优先级", help_text="数值越大越先下发")
+    status = models.CharField(max_length=20, choices=DispatchStatus.choices, default=DispatchStatus.QUEUED, verbose_name="状态")
+    attempts = models.IntegerField(default=0, verbose_name="下发次数")
+    next_attempt_time = models.DateTimeField(null=True, blank=True, verbose_name="下次下发时间", help_text="下发失败后退避, 为空表示立即下发")
+    job_id = models.CharField(max_length=255, null=True, blank=True, verbose_name="任务ID")
+    message = models.TextField(null=True, blank=True, verbose_name="详细日志")
+    enqueue_time = models.DateTimeField(default=timezone.now, verbose_name="入队时间")
+    dispatch_time = models.DateTimeField(null=True, blank=True, verbose_name="下发时间")
+    create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+    update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    @property
+    def wait_seconds(self) -> int:
+        end_time = self.dispatch_time or timezone.now()
+        return int((end_time - self.enqueue_time).total_seconds())
+
+    class Meta:
+        db_table = "scrapy_dispatch_request"
+        verbose_name = verbose_name_plural = "Scrapy Dispatch Queue"
+        ordering = ["-priority", "enqueue_time"]
+        indexes = [
+            models.Index(fields=["status", "node", "-priority", "enqueue_time"], name="dispatch_queue_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.node}/{self.spider_name}"
+
 
 class GuardianStrategy(models.TextChoices):
     RESTART_ALWAYS = "restart_always", "始终重启"
+    RESTART_BACKOFF = "restart_backoff", "指数退避重启"
+    RESTART_BUDGET = "restart_budget", "退避重启+限额隔离"
 
 
 class Guardian(models.Model):
@@ -324,9 +576,21 @@ class Guardian(models.Model):
     interval = models.IntegerField(default=60, verbose_name="检测间隔(秒), 修改后重启生效")
     last_check = models.DateTimeField(null=True, blank=True, verbose_name="上次检测时间")
     last_action = models.CharField(max_length=255, null=True, blank=True, verbose_name="上次操作说明")
+    backoff_base = models.IntegerField(default=30, verbose_name="退避基数(秒)")
+    backoff_max = models.IntegerField(default=3600, verbose_name="最大退避(秒)")
+    restart_budget = models.IntegerField(default=5, verbose_name="窗口内最大重启次数")
+    budget_window = models.IntegerField(default=3600, verbose_name="重启限额窗口(秒)")
+    restart_state = models.JSONField(default=dict, blank=True, verbose_name="重启状态")
+    quarantined = models.BooleanField(default=False, verbose_name="已隔离")
+    fencing_token = models.BigIntegerField(default=0, verbose_name="最近执行的租约令牌")
+    fencing_lease = models.CharField(max_length=100, default="", blank=True, verbose_name="令牌所属租约", help_text="不同租约的令牌各自递增, 只与同一租约的令牌比较")
     create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
     update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
 
+    @property
+    def quarantined_spiders(self) -> list[str]:
+        return [state.get("name") or fp for fp, state in (self.restart_state or {}).items() if state.get("quarantined")]
+
     class Meta:
         db_table = "scrapy_guardian"
         verbose_name = verbose_name_plural = "Scrapy Guardian"
@@ -335,9 +599,62 @@ class Guardian(models.Model):
         return f"Guardian[{self.spider_group}]"
 
 
+class RemoteDeletion(models.Model):
+    """数据库中已经删除、但在 Scrapyd 上删除失败的项目或版本, 按名称记录, 由 RetentionScheduler 重试"""
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, db_constraint=False, verbose_name="节点", related_name="remote_deletions")
+    project = models.CharField(max_length=255, verbose_name="项目")
+    version = models.CharField(max_length=255, default="", blank=True, verbose_name="版本", help_text="为空表示删除整个项目")
+    attempts = models.IntegerField(default=0, verbose_name="尝试次数")
+    message = models.TextField(null=True, blank=True, verbose_name="详细日志")
+    create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+    update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        db_table = "scrapy_remote_deletion"
+        verbose_name = verbose_name_plural = "Scrapyd Remote Deletion"
+        unique_together = (("node", "project", "version"),)
+
+    def __str__(self):
+        return f"{self.node_id}/{self.project}/{self.version or '*'}"
+
+
+class SchedulerLease(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name="租约名")
+    owner = models.CharField(max_length=255, null=True, blank=True, verbose_name="持有者")
+    token = models.BigIntegerField(default=0, verbose_name="令牌")
+    expire_time = models.DateTimeField(default=timezone.now, verbose_name="过期时间")
+    acquire_time = models.DateTimeField(null=True, blank=True, verbose_name="获取时间")
+    create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+    update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        db_table = "scrapy_scheduler_lease"
+        verbose_name = verbose_name_plural = "Scheduler Lease"
+
+    def __str__(self):
+        return f"{self.name}@{self.owner}"
+
+
+class SchedulerWorker(models.Model):
+    name = models.CharField(max_length=255, unique=True, verbose_name="Worker")
+    scheduler = models.CharField(max_length=100, verbose_name="调度器")
+    heartbeat = models.DateTimeField(default=timezone.now, verbose_name="心跳时间")
+    nodes = models.JSONField(default=list, blank=True, verbose_name="负责的节点")
+    create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+
+    class Meta:
+        db_table = "scrapy_scheduler_worker"
+        verbose_name = verbose_name_plural = "Scheduler Worker"
+        ordering = ["scheduler", "name"]
+
+    def __str__(self):
+        return self.name
+
+
 class GuardianAction(models.TextChoices):
     PUBLISH_VERSION = "publish_version", "发布项目"
     START_SPIDER = "start_spider", "启动爬虫"
+    QUARANTINE_SPIDER = "quarantine_spider", "隔离爬虫"
 
 
 class GuardianLog(models.Model):
@@ -350,14 +667,41 @@ class GuardianLog(models.Model):
     reason = models.CharField(max_length=200, null=True, blank=True, verbose_name="原因")
     success = models.BooleanField(default=True, verbose_name="成功")
     message = models.TextField(null=True, blank=True, verbose_name="详细日志")
+    repeat_count = models.IntegerField(default=1, verbose_name="连续次数")
+    last_time = models.DateTimeField(default=timezone.now, verbose_name="最近一次时间")
     create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
 
     class Meta:
         db_table = "scrapy_guardian_log"
         verbose_name = verbose_name_plural = "Scrapy Guardian Log"
         ordering = ["-create_time"]
+        indexes = [
+            models.Index(fields=["guardian", "-create_time"], name="guardian_log_guardian_idx"),
+            models.Index(fields=["last_time"], name="guardian_log_last_time_idx"),
+        ]
 
     def __str__(self):
         return f"[{self.create_time}] {self.guardian} {self.action} ({self.success})"
 
 
+class GuardianLogDaily(models.Model):
+    guardian = models.ForeignKey(Guardian, on_delete=models.CASCADE, verbose_name="守护任务", db_constraint=False, related_name="daily_logs")
+    node = models.ForeignKey(Node, on_delete=models.DO_NOTHING, db_constraint=False, verbose_name="节点")
+    date = models.DateField(verbose_name="日期")
+    spider_name = models.CharField(max_length=100, default="", blank=True, verbose_name="爬虫名")
+    action = models.CharField(max_length=100, choices=GuardianAction.choices, verbose_name="执行动作")
+    success = models.BooleanField(default=True, verbose_name="成功")
+    count = models.IntegerField(default=0, verbose_name="次数")
+    create_time = models.DateTimeField(default=timezone.now, verbose_name="创建时间")
+    update_time = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+
+    class Meta:
+        db_table = "scrapy_guardian_log_daily"
+        verbose_name = verbose_name_plural = "Scrapy Guardian Log Daily"
+        ordering = ["-date"]
+        unique_together = (("guardian", "node", "date", "spider_name", "action", "success"),)
+
+    def __str__(self):
+        return f"[{self.date}] {self.guardian} {self.action} x{self.count}"
+
+
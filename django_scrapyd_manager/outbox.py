@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import queue
+import time
+from logging import getLogger
+from threading import Thread, Lock
+from django.db import close_old_connections
+from django.db.models import Model, QuerySet
+from django.dispatch import Signal
+from .utils import get_setting
+
+
+logger = getLogger(__name__)
+
+
+def serialize(value):
+    """
+    入队时把模型实例转为字段值字典、QuerySet 立即求值为字典列表
+    后台线程投递时不会读到调用方之后修改过的实例, 也不会在另一个线程里执行延迟查询
+    """
+    if isinstance(value, Model):
+        return {field.attname: field.value_from_object(value) for field in value._meta.concrete_fields}
+    if isinstance(value, QuerySet):
+        return list(value.values())
+    if isinstance(value, dict):
+        return {key: serialize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [serialize(item) for item in value]
+    return value
+
+
+class OutboxMessage:
+
+    def __init__(self, signal: Signal, sender, payload: dict):
+        self.signal = signal
+        self.sender = sender
+        self.payload = payload
+        self.receivers = None      # 为 None 时投递给所有 receiver, 重试时只投递失败的 receiver
+        self.attempts = 0
+
+
+class SignalOutbox(Thread):
+    """
+    信号发件箱: 调用方只把信号放入有界队列, 由后台线程批量投递
+    - 队列满时丢弃新消息, 不阻塞调用方
+    - receiver 抛出异常时按指数退避只重试失败的 receiver
+    """
+
+    def __init__(self, max_size: int = 1000, batch_size: int = 100, max_retries: int = 3, retry_delay: float = 2):
+        super().__init__(daemon=True, name="SignalOutbox")
+        self.queue: queue.Queue[OutboxMessage] = queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.dropped = 0
+        self._retries: list[tuple[float, int, OutboxMessage]] = []
+        self._counter = itertools.count()
+
+    def send(self, signal: Signal, sender, **payload) -> bool:
+        try:
+            self.queue.put_nowait(OutboxMessage(signal=signal, sender=sender, payload=serialize(payload)))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"信号发件箱已满, 丢弃消息, 累计丢弃{self.dropped}条")
+            return False
+
+    def _next_batch(self) -> list[OutboxMessage]:
+        timeout = 1.0
+        if self._retries:
+            timeout = min(max(self._retries[0][0] - time.time(), 0), timeout)
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=timeout))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        now = time.time()
+        while self._retries and self._retries[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._retries)[2])
+        return batch
+
+    def deliver(self, message: OutboxMessage):
+        message.attempts += 1
+        failed = []
+        if message.receivers is None:
+            for receiver, response in message.signal.send_robust(sender=message.sender, **message.payload):
+                if isinstance(response, Exception):
+                    failed.append((receiver, response))
+        else:
+            for receiver in message.receivers:
+                try:
+                    receiver(signal=message.signal, sender=message.sender, **message.payload)
+                except Exception as e:
+                    failed.append((receiver, e))
+        if not failed:
+            return
+        if message.attempts > self.max_retries:
+            logger.error(f"信号投递失败{message.attempts}次, 放弃: {[str(e) for _, e in failed]}")
+            return
+        message.receivers = [receiver for receiver, _ in failed]
+        due = time.time() + self.retry_delay * 2 ** (message.attempts - 1)
+        heapq.heappush(self._retries, (due, next(self._counter), message))
+
+    def run(self):
+        while True:
+            batch = self._next_batch()
+            for message in batch:
+                try:
+                    self.deliver(message)
+                except Exception as e:
+                    logger.exception(e)
+            if batch:
+                close_old_connections()
+
+
+_outbox: SignalOutbox | None = None
+_outbox_lock = Lock()
+
+
+def get_outbox() -> SignalOutbox:
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = SignalOutbox(
+                max_size=get_setting("SIGNAL_OUTBOX_MAX_SIZE", 1000),
+                batch_size=get_setting("SIGNAL_OUTBOX_BATCH_SIZE", 100),
+                max_retries=get_setting("SIGNAL_OUTBOX_MAX_RETRIES", 3),
+            )
+            _outbox.start()
+        return _outbox
+
+
+def send_signal(signal: Signal, sender, **payload):
+    """开启 SIGNAL_OUTBOX 时异步投递信号, 否则同步发送"""
+    if get_setting("SIGNAL_OUTBOX", False):
+        get_outbox().send(signal, sender, **payload)
+    else:
+        signal.send(sender=sender, **payload)
@@ -0,0 +1,150 @@
+import hashlib
+from functools import cached_property
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from .utils import get_setting
+
+
+def _query_key(queryset) -> str:
+    sql, params = queryset.query.sql_with_params()
+    return hashlib.md5(f"{queryset.db}:{sql}:{params!r}".encode("utf-8")).hexdigest()
+
+
+def planner_estimate(model, using: str) -> int | None:
+    """读取数据库统计信息中的表行数估计, 不支持的数据库返回 None"""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [connection.ops.quote_name(table)])
+        elif connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", [table],
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    # PostgreSQL 未 ANALYZE 过的表 reltuples 为 -1
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def estimated_count(queryset) -> int:
+    """
+    管理页使用的总数:
+    - 没有筛选条件且统计信息中的行数超过 ADMIN_ESTIMATE_COUNT_THRESHOLD 时直接使用估计值
+    - 否则执行 COUNT(*), 结果在 cache 中保存 ADMIN_COUNT_CACHE_TTL 秒
+    """
+    if not queryset.query.where:
+        estimate = planner_estimate(queryset.model, queryset.db)
+        if estimate is not None and estimate >= get_setting("ADMIN_ESTIMATE_COUNT_THRESHOLD", 100000):
+            return estimate
+    key = f"scrapyd_manager:count:{_query_key(queryset)}"
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, get_setting("ADMIN_COUNT_CACHE_TTL", 60))
+    return count
+
+
+class KeysetPaginator(Paginator):
+    """
+    按排序字段做 keyset(seek) 分页的 Paginator
+    每页最后一行的排序字段值保存在 cache 中, 翻到下一页时用 WHERE (排序字段) < (上一页最后一行) 代替 OFFSET,
+    顺序翻页时第 N 页和第 1 页一样快; 没有上一页游标(直接跳页或游标过期)时退回 OFFSET 并记录游标
+    排序字段必须是本表不可为空的字段, 否则整体退回 OFFSET 分页
+    总数可能是估计值: 页码超出估计的页数或请求的页为空时改用精确的 COUNT(*), 仍超出时定位到最后一页
+    """
+    exact = False
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True):
+        # 游标按页号定位, orphans 会改变页边界, 不支持
+        super().__init__(object_list, per_page, 0, allow_empty_first_page)
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, "query"):
+            return super().count
+        return estimated_count(self.object_list)
+
+    def _use_exact_count(self):
+        if self.exact or not hasattr(self.object_list, "query"):
+            return
+        self.exact = True
+        self.__dict__["count"] = self.object_list.count()
+        self.__dict__.pop("num_pages", None)
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if int(number) < 1:
+                raise
+        self._use_exact_count()
+        return min(int(number), self.num_pages)
+
+    @cached_property
+    def keyset(self) -> list[tuple[str, bool]] | None:
+        """[(字段 attname, 是否倒序)], 排序不能用于 keyset 时返回 None"""
+        queryset = self.object_list
+        if not hasattr(queryset, "query") or not queryset.ordered or queryset.query.extra_order_by:
+            return None
+        opts = queryset.model._meta
+        ordering = queryset.query.order_by or opts.ordering
+        keyset = []
+        for item in ordering:
+            if not isinstance(item, str) or "__" in item or item == "?":
+                return None
+            descending = item.startswith("-")
+            name = item.lstrip("-")
+            try:
+                field = opts.pk if name == "pk" else opts.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.null or not field.concrete:
+                return None
+            keyset.append((field.attname, descending))
+        # 最后一个字段必须唯一, 否则边界行相同时会漏掉或重复
+        if not keyset or keyset[-1][0] != opts.pk.attname:
+            return None
+        return keyset
+
+    def _cursor_key(self, number: int) -> str:
+        return f"scrapyd_manager:keyset:{_query_key(self.object_list)}:{self.per_page}:{number}"
+
+    def _seek(self, values: list):
+        condition, prefix = Q(), {}
+        for (attname, descending), value in zip(self.keyset, values):
+            condition |= Q(**prefix, **{f"{attname}__{'lt' if descending else 'gt'}": value})
+            prefix[attname] = value
+        return self.object_list.filter(condition)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        page = self._page(number)
+        if not page.object_list and number > 1 and not self.exact:
+            # 估计的总数大于实际行数
+            self._use_exact_count()
+            return self.page(min(number, self.num_pages))
+        return page
+
+    def _page(self, number):
+        if not self.keyset:
+            return super().page(number)
+        cursor = cache.get(self._cursor_key(number - 1)) if number > 1 else None
+        if cursor is not None:
+            object_list = list(self._seek(cursor)[:self.per_page])
+        else:
+            bottom = (number - 1) * self.per_page
+            object_list = list(self.object_list[bottom:bottom + self.per_page])
+        if object_list:
+            last = object_list[-1]
+            cache.set(
+                self._cursor_key(number), [getattr(last, attname) for attname, _ in self.keyset],
+                get_setting("ADMIN_KEYSET_CURSOR_TTL", 600),
+            )
+        return self._get_page(object_list, number, self)
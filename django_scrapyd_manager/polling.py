@@ -0,0 +1,121 @@
+import hashlib
+import time
+from django.core.cache import cache
+from . import models
+from .utils import get_setting
+
+
+class NodePollState:
+    """
+    节点任务列表的自适应轮询状态, 保存在 django cache 中, 多进程部署时需使用共享 cache
+    - 任务集合或 daemonstatus 计数发生变化时, 间隔恢复为 min_interval
+    - 连续无变化时间隔按 factor 指数增长, 最大不超过 max_interval
+    - 手动操作(启动/停止爬虫)后立即到期
+    状态分三个键保存, 每个键只由一处整体写入, 不需要读取-修改-写回:
+    - 任务列表签名、任务 id 和间隔, 只在同步任务列表后写入
+    - daemonstatus 计数签名和探测时间
+    - 最近一次请求刷新的时间, 晚于上次同步开始的时间即视为到期
+    """
+
+    def __init__(self, node_id: int, min_interval: float, max_interval: float, factor: float = 2):
+        self.node_id = node_id
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval = min_interval
+        self.next_time = 0.0
+        self.sync_time = None
+        self.jobs_signature = None
+        self.job_ids: list[str] | None = None
+        self.status_signature = None
+        self.status_time = 0.0
+        self.refresh_time = 0.0
+
+    @property
+    def key(self) -> str:
+        return f"scrapyd_manager:poll:{self.node_id}"
+
+    @property
+    def timeout(self) -> float:
+        # 过期后视为从未同步, 下次读取时重新同步
+        return self.max_interval * 2
+
+    @classmethod
+    def load(cls, node: models.Node) -> "NodePollState":
+        min_interval = get_setting("POLL_MIN_INTERVAL", 10)
+        max_interval = get_setting("POLL_MAX_INTERVAL", 600)
+        state = cls(node.id, min_interval, max_interval, get_setting("POLL_BACKOFF_FACTOR", 2))
+        values = cache.get_many([state.key, f"{state.key}:status", f"{state.key}:refresh"])
+        state.__dict__.update(values.get(state.key, {}))
+        state.status_signature, state.status_time = values.get(f"{state.key}:status", (None, 0.0))
+        state.refresh_time = values.get(f"{state.key}:refresh", 0.0)
+        # 配置调整后立即生效
+        state.min_interval, state.max_interval = min_interval, max_interval
+        state.interval = min(max(state.interval, min_interval), max_interval)
+        return state
+
+    def is_due(self, now: float = None) -> bool:
+        if self.job_ids is None or self.refresh_time >= self.sync_time:
+            return True
+        return (now or time.time()) >= self.next_time
+
+    def refresh_now(self):
+        """只让当前实例到期, 需要让其他进程也刷新时用 request_refresh"""
+        self.refresh_time = time.time()
+
+    def record_jobs(self, jobs: list[models.Job], started: float = None):
+        """started 为开始同步的时间, 同步期间收到的刷新请求不会被这次同步覆盖"""
+        now = time.time()
+        signature = hashlib.sha1(repr(sorted((job.job_id, job.status) for job in jobs)).encode()).hexdigest()
+        if signature != self.jobs_signature:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.factor, self.max_interval)
+        self.jobs_signature = signature
+        self.job_ids = [job.job_id for job in jobs]
+        self.sync_time = started or now
+        self.next_time = now + self.interval
+        cache.set(self.key, {
+            "interval": self.interval, "next_time": self.next_time, "sync_time": self.sync_time,
+            "jobs_signature": self.jobs_signature, "job_ids": self.job_ids,
+        }, self.timeout)
+
+    def record_status(self, status: dict) -> bool:
+        """记录 daemonstatus 计数, 计数变化时返回 True 并让任务列表立即到期"""
+        self.status_time = time.time()
+        signature = (status.get("running"), status.get("pending"), status.get("finished"))
+        changed = self.status_signature is not None and signature != self.status_signature
+        self.status_signature = signature
+        cache.set(f"{self.key}:status", (signature, self.status_time), self.timeout)
+        if changed:
+            self.refresh_now()
+            cache.set(f"{self.key}:refresh", self.refresh_time, self.timeout)
+        return changed
+
+
+def adaptive_polling_enabled() -> bool:
+    return get_setting("ADAPTIVE_POLLING", False)
+
+
+def request_refresh(node: models.Node):
+    """节点上有手动操作时调用, 下次读取任务列表时强制刷新"""
+    if not adaptive_polling_enabled():
+        return
+    cache.set(f"scrapyd_manager:poll:{node.id}:refresh", time.time(), get_setting("POLL_MAX_INTERVAL", 600) * 2)
+
+
+def record_jobs(node: models.Node, jobs: list[models.Job], started: float = None):
+    if not adaptive_polling_enabled():
+        return
+    NodePollState.load(node).record_jobs(jobs, started)
+
+
+def record_status(node: models.Node, status: dict):
+    if not adaptive_polling_enabled():
+        return
+    NodePollState.load(node).record_status(status)
+
+
+def poll_intervals(nodes) -> dict[int, NodePollState]:
+    """各节点当前的有效轮询间隔, 用于管理页展示"""
+    return {node.id: NodePollState.load(node) for node in nodes}
@@ -0,0 +1,138 @@
+import heapq
+import time
+from logging import getLogger
+from django.db.models import Max
+from . import models, scrapyd_api
+from .utils import get_setting
+
+
+logger = getLogger(__name__)
+
+
+class WorkQueue:
+    """
+    去重的延迟工作队列
+    - 同一个 key 同时只存在一份, 重复加入时取更早的到期时间
+    - pop 每次最多取出 limit 个到期的 key, 用于限速
+    """
+
+    def __init__(self):
+        self._due: dict = {}
+        self._heap: list[tuple[float, object]] = []
+
+    def __len__(self):
+        return len(self._due)
+
+    def add(self, key, delay: float = 0):
+        due = time.time() + delay
+        current = self._due.get(key)
+        if current is not None and current <= due:
+            return
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+
+    def pop(self, limit: int = None) -> list:
+        now = time.time()
+        keys = []
+        while self._heap and self._heap[0][0] <= now and (limit is None or len(keys) < limit):
+            due, key = heapq.heappop(self._heap)
+            # 堆中可能残留被更早到期时间覆盖的旧记录
+            if self._due.get(key) != due:
+                continue
+            self._due.pop(key)
+            keys.append(key)
+        return keys
+
+    def discard(self, keys):
+        for key in keys:
+            self._due.pop(key, None)
+
+
+class ReconcileController:
+    """
+    守护任务的调和控制器, 只处理期望状态或观测状态发生变化的守护任务
+    - 期望状态: 守护任务/爬虫组/项目最新版本的签名, 每轮一次查询
+    - 观测状态: 每个节点 daemonstatus 的 running/pending/finished 计数, 变化(含节点恢复)时才重新检查该节点上的守护任务
+    - 检查后按结果重新排队: 有操作时稍后复查, 处于退避期时到期复查, 否则按 resync_period 兜底复查
+    """
+
+    def __init__(self, resync_period: int = 600, verify_delay: int = 30, max_per_tick: int = 50):
+        self.queue = WorkQueue()
+        self.resync_period = resync_period
+        self.verify_delay = verify_delay
+        self.max_per_tick = max_per_tick
+        self.desired: dict[int, tuple] = {}
+        self.observed: dict[int, tuple | None] = {}
+
+    def observe_desired(self, queryset):
+        rows = queryset.annotate(latest_version_id=Max("spider_group__project__versions__id")).values_list(
+            "id", "enable", "strategy", "backoff_base", "backoff_max", "restart_budget", "budget_window", "quarantined",
+            "spider_group__update_time",
+            "spider_group__version_id", "latest_version_id",
+        )
+        desired = {}
+        for guardian_id, *signature in rows:
+            desired[guardian_id] = tuple(signature)
+            if self.desired.get(guardian_id) != desired[guardian_id]:
+                self.queue.add(guardian_id)
+        self.queue.discard(set(self.desired) - set(desired))
+        self.desired = desired
+
+    def node_guardians(self, guardian_ids) -> dict[int, set[int]]:
+        mapping: dict[int, set[int]] = {}
+        rows = models.Guardian.objects.filter(id__in=guardian_ids)
+        for guardian_id, node_id in rows.values_list("id", "spider_group__node_id"):
+            mapping.setdefault(node_id, set()).add(guardian_id)
+        pooled = rows.filter(spider_group__placement=models.PlacementMode.POOL)
+        for guardian_id, node_id in pooled.values_list("id", "spider_group__node_pool__id"):
+            if node_id is not None:
+                mapping.setdefault(node_id, set()).add(guardian_id)
+        return mapping
+
+    def observe_node(self, node: models.Node) -> tuple | None:
+        try:
+            status = scrapyd_api.daemon_status(node)
+        except Exception as e:
+            logger.debug(f"节点{node}不可用: {e}")
+            return None
+        return status.get("running"), status.get("pending"), status.get("finished")
+
+    def observe_nodes(self, guardian_ids):
+        mapping = self.node_guardians(guardian_ids)
+        for node in models.Node.objects.filter(id__in=mapping.keys()):
+            signature = self.observe_node(node)
+            if node.id not in self.observed or self.observed[node.id] != signature:
+                for guardian_id in mapping[node.id]:
+                    self.queue.add(guardian_id)
+            self.observed[node.id] = signature
+
+    def next_objects(self, queryset) -> list[models.Guardian]:
+        """观测一轮状态变化, 返回本轮需要检查的守护任务"""
+        self.observe_desired(queryset)
+        self.observe_nodes(list(self.desired))
+        keys = self.queue.pop(self.max_per_tick)
+        if not keys:
+            return []
+        return list(queryset.filter(id__in=keys))
+
+    def done(self, obj: models.Guardian, acted: bool, retry_at: float = None):
+        delay = self.resync_period
+        if acted:
+            delay = self.verify_delay
+        if retry_at is not None:
+            delay = min(delay, max(retry_at - time.time(), 0))
+        self.queue.add(obj.id, delay)
+
+    def skipped(self, obj: models.Guardian):
+        """本轮因为租约未持有等原因没有检查, 按复查间隔重新放回队列, 否则要等到期望状态或节点计数变化才会再检查"""
+        self.queue.add(obj.id, self.verify_delay)
+
+
+def get_reconciler(interval: int) -> ReconcileController | None:
+    if not get_setting("GUARDIAN_RECONCILE", False):
+        return None
+    return ReconcileController(
+        resync_period=get_setting("RECONCILE_RESYNC_PERIOD", 600),
+        verify_delay=get_setting("RECONCILE_VERIFY_DELAY", interval),
+        max_per_tick=get_setting("RECONCILE_MAX_PER_TICK", 50),
+    )
@@ -0,0 +1,224 @@
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from django.db import transaction, close_old_connections
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q, OuterRef, Subquery, Window
+from django.forms.models import model_to_dict
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django_sched.sched import BaseScheduler
+from django_scrapyd_manager import models, scrapyd_api, samples, deploy
+from django_scrapyd_manager.utils import get_setting
+
+
+def compact_guardian_logs(before, batch_size: int = 1000) -> int:
+    """
+    把最近一次出现在 before 之前的 GuardianLog 按天汇总到 GuardianLogDaily 后分批删除
+    合并后的日志不会跨天(见 GuardianLogBuffer), 按 last_time 判断不会删掉守护进程仍在累加次数的日志
+    :return: 删除的日志条数
+    """
+    deleted = 0
+    while True:
+        rows = list(models.GuardianLog.objects.filter(last_time__lt=before).order_by("id").values(
+            "id", "guardian_id", "node_id", "spider_name", "action", "success", "repeat_count", "create_time",
+        )[:batch_size])
+        if not rows:
+            return deleted
+        counts = {}
+        for row in rows:
+            key = (row["guardian_id"], row["node_id"], row["create_time"].date(), row["spider_name"] or "", row["action"], row["success"])
+            counts[key] = counts.get(key, 0) + row["repeat_count"]
+        with transaction.atomic():
+            for (guardian_id, node_id, date, spider_name, action, success), count in counts.items():
+                lookup = dict(guardian_id=guardian_id, node_id=node_id, date=date, spider_name=spider_name, action=action, success=success)
+                updated = models.GuardianLogDaily.objects.filter(**lookup).update(count=F("count") + count, update_time=timezone.now())
+                if not updated:
+                    models.GuardianLogDaily.objects.create(count=count, **lookup)
+            models.GuardianLog.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        deleted += len(rows)
+
+
+def export_archived_jobs(jobs: list[dict], export_dir: str):
+    """把归档的任务按归档日期追加到 gzip 压缩的 JSON Lines 文件"""
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, f"jobs-{timezone.now():%Y%m%d}.jsonl.gz")
+    # 追加模式会产生多个 gzip member, gzip 解压时会自动拼接
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for job in jobs:
+            f.write(json.dumps(job, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n")
+
+
+def archive_jobs(before, batch_size: int = 1000, export_dir: str = None) -> int:
+    """
+    把 before 之前结束的任务分批移入 JobArchive, 保留原 id, JobInfoLog 仍能关联到归档的任务
+    :return: 归档的任务数
+    """
+    archived = 0
+    finished = models.Job.objects.filter(status=models.JobStatus.FINISHED).filter(
+        Q(end_time__lt=before) | Q(end_time__isnull=True, start_time__lt=before),
+    )
+    while True:
+        jobs = list(finished.order_by("id")[:batch_size])
+        if not jobs:
+            return archived
+        rows = [model_to_dict(job, exclude=["node", "project", "spider"]) | {
+            "node_id": job.node_id, "project_id": job.project_id, "spider_id": job.spider_id,
+        } for job in jobs]
+        if export_dir:
+            export_archived_jobs(rows, export_dir)
+        with transaction.atomic():
+            models.JobArchive.objects.bulk_create([models.JobArchive(**row) for row in rows], ignore_conflicts=True)
+            models.Job.objects.filter(id__in=[job.id for job in jobs]).delete()
+        archived += len(jobs)
+
+
+def pinned_version_ids() -> set[int]:
+    """
+    被爬虫组固定、被运行中任务或排队中的调度请求引用的版本, 以及每个项目的最新版本(Project.latest_version)
+    和最新的带 egg 版本(守护任务发布项目时使用, 见 get_group_publishable_version)
+    """
+    pinned = set(models.SpiderGroup.objects.filter(version__isnull=False).values_list("version_id", flat=True))
+    versions = models.ProjectVersion.objects.filter(project_id=OuterRef("pk"))
+    for latest_id, publishable_id in models.Project.objects.annotate(
+        latest_id=Subquery(versions.order_by("-version").values("id")[:1]),
+        publishable_id=Subquery(versions.filter(
+            egg_file__isnull=False, egg_present=True,
+        ).order_by("-create_time", "-version").values("id")[:1]),
+    ).values_list("latest_id", "publishable_id"):
+        pinned.update((latest_id, publishable_id))
+    active_jobs = models.Job.objects.filter(status__in=(models.JobStatus.RUNNING, models.JobStatus.PENDING))
+    pinned.update(models.ProjectVersion.objects.filter(
+        project__jobs__in=active_jobs.filter(version__isnull=False), version=F("project__jobs__version"),
+    ).values_list("id", flat=True))
+    # 没有记录版本的任务使用启动时项目的最新版本
+    started_version = models.ProjectVersion.objects.filter(
+        project_id=OuterRef("project_id"), create_time__lte=OuterRef("start_time"),
+    ).order_by("-create_time", "-version").values("id")[:1]
+    pinned.update(active_jobs.filter(version__isnull=True).annotate(
+        version_id=Subquery(started_version),
+    ).exclude(version_id__isnull=True).values_list("version_id", flat=True))
+    pinned.update(models.DispatchRequest.objects.filter(
+        status__in=[models.DispatchStatus.QUEUED, models.DispatchStatus.DISPATCHING],
+    ).values_list("spider__version_id", flat=True))
+    pinned.discard(None)
+    return pinned
+
+
+def collectable_versions(keep_last: int, projects=None):
+    """每个项目按创建时间保留最近 keep_last 个版本, 其余未被引用的版本可以回收"""
+    queryset = models.ProjectVersion.objects.all()
+    if projects is not None:
+        queryset = queryset.filter(project__in=projects)
+    ranked = queryset.annotate(rank=Window(
+        RowNumber(), partition_by=F("project_id"), order_by=(F("create_time").desc(), F("version").desc()),
+    ))
+    ids = ranked.filter(rank__gt=keep_last).values_list("id", flat=True)
+    return models.ProjectVersion.objects.filter(id__in=list(ids)).exclude(
+        id__in=pinned_version_ids(),
+    ).select_related("project", "project__node")
+
+
+def _delete_remote_version(version: models.ProjectVersion) -> str | None:
+    try:
+        scrapyd_api.delete_version(version)
+    except Exception as e:
+        return str(e)
+    finally:
+        close_old_connections()
+
+
+def _delete_egg(storage, name: str) -> str | None:
+    try:
+        storage.delete(name)
+    except Exception as e:
+        return str(e)
+
+
+def collect_versions(keep_last: int, projects=None, dry_run: bool = True, max_workers: int = 8) -> dict:
+    """
+    回收旧版本: 并发删除各节点 Scrapyd 上的版本, 一次删除数据库记录, 再并发删除不再被引用的 egg 文件
+    dry_run 时只返回将要删除的版本和 egg 文件
+    """
+    versions = list(collectable_versions(keep_last, projects))
+    eggs = {version.egg_file.name: version.egg_file.storage for version in versions if version.egg_file}
+    still_used = set(models.ProjectVersion.objects.filter(egg_file__in=eggs.keys()).exclude(
+        id__in=[version.id for version in versions],
+    ).values_list("egg_file", flat=True))
+    eggs = {name: storage for name, storage in eggs.items() if name not in still_used}
+    report = {"versions": [version.full_path for version in versions], "eggs": list(eggs), "failed": {}}
+    if dry_run or not versions:
+        return report
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="version-gc") as executor:
+        remote = [version for version in versions if version.scrapyd_exists]
+        errors = dict(zip(remote, executor.map(_delete_remote_version, remote)))
+    deleted = [version for version in versions if not errors.get(version)]
+    for version, error in errors.items():
+        if error:
+            report["failed"][version.full_path] = error
+            # 远端删除失败的版本保留, 对应的 egg 也不能删
+            eggs.pop(version.egg_file.name, None)
+    with transaction.atomic():
+        ids = [version.id for version in deleted]
+        # 守护日志对爬虫有外键约束, 保留爬虫名后解除关联
+        models.GuardianLog.objects.filter(spider__version_id__in=ids).update(spider=None)
+        # 远端已删除, 避免 post_delete 再次请求 Scrapyd
+        models.ProjectVersion.objects.filter(id__in=ids).update(sync_mode=models.SyncMode.NONE)
+        models.ProjectVersion.objects.filter(id__in=ids).delete()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="version-gc") as executor:
+        futures = {name: executor.submit(_delete_egg, storage, name) for name, storage in eggs.items()}
+        for name, future in futures.items():
+            if error := future.result():
+                report["failed"][name] = error
+    report["versions"] = [version.full_path for version in deleted]
+    report["eggs"] = [name for name in eggs if name not in report["failed"]]
+    return report
+
+
+class RetentionScheduler(BaseScheduler):
+    """定期清理历史数据"""
+    interval = 3600
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 各降采样粒度已处理到的时间, 进程重启后从头处理一次
+        self.downsampled: dict[int, datetime] = {}
+
+    def downsample_job_samples(self, now):
+        for age, bucket in get_setting("JOB_SAMPLE_DOWNSAMPLE", [(3600, 60), (86400, 3600)]):
+            # 按桶对齐, 避免一个桶被两轮分别处理后各保留一条
+            before = now - timedelta(seconds=age)
+            before -= timedelta(seconds=int(before.timestamp()) % bucket, microseconds=before.microsecond)
+            deleted = samples.downsample_job_info_logs(before, bucket, since=self.downsampled.get(bucket))
+            self.downsampled[bucket] = before
+            if deleted:
+                self.logger.info(f"[Retention] 降采样为每{bucket}秒一条, 删除{deleted}条任务采样")
+
+    def schedule(self, now):
+        self.downsample_job_samples(now)
+        for resolution, days in get_setting("ROLLUP_RETENTION_DAYS", {60: 2, 3600: 90}).items():
+            models.ThroughputRollup.objects.filter(resolution=resolution, bucket__lt=now - timedelta(days=days)).delete()
+        days = get_setting("GUARDIAN_LOG_RETENTION_DAYS", 30)
+        if days:
+            deleted = compact_guardian_logs(now - timedelta(days=days), batch_size=get_setting("RETENTION_BATCH_SIZE", 1000))
+            if deleted:
+                self.logger.info(f"[Retention] 汇总并删除{deleted}条守护日志")
+        days = get_setting("JOB_ARCHIVE_DAYS", 30)
+        if days:
+            archived = archive_jobs(
+                now - timedelta(days=days),
+                batch_size=get_setting("RETENTION_BATCH_SIZE", 1000),
+                export_dir=get_setting("JOB_ARCHIVE_EXPORT_DIR"),
+            )
+            if archived:
+                self.logger.info(f"[Retention] 归档{archived}个已结束的任务")
+        deleted = deploy.retry_remote_deletions(get_setting("REMOTE_DELETE_MAX_ATTEMPTS", 10))
+        if deleted:
+            self.logger.info(f"[Retention] 重试删除Scrapyd上的{deleted}个项目/版本")
+        keep_last = get_setting("VERSION_GC_KEEP_LAST", 0)
+        if keep_last:
+            report = collect_versions(keep_last, dry_run=get_setting("VERSION_GC_DRY_RUN", False))
+            if report["versions"] or report["failed"]:
+                self.logger.info(f"[Retention] 回收版本: {report}")
@@ -0,0 +1,159 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django_sched.sched import BaseScheduler
+from . import models, samples
+from .lease import get_lease
+from .utils import get_setting, bulk_upsert
+
+
+# 汇总的计数器: 字段名 -> Scrapy stats 中的键
+COUNTERS = {
+    "items": "item_scraped_count",
+    "requests": "response_received_count",
+    "errors": "log_count/ERROR",
+}
+
+
+def extract_counters(info: dict | None) -> dict[str, int] | None:
+    """从采样中取出累计计数器, Scrapy stats 可能在 info["stats"] 中, 也可能就是 info 本身"""
+    if not isinstance(info, dict):
+        return None
+    stats = info.get("stats") if isinstance(info.get("stats"), dict) else info
+    return {name: int(stats.get(key) or 0) for name, key in COUNTERS.items()}
+
+
+def bucket_start(time: datetime, resolution: int) -> datetime:
+    return time - timedelta(seconds=int(time.timestamp()) % resolution, microseconds=time.microsecond)
+
+
+def _previous_counters(job_id: int, before_id: int, gaps) -> tuple[int, dict[str, int] | None]:
+    """任务已经汇总过的最后一条采样: (采样 id, 计数器)"""
+    log = models.JobInfoLog.objects.filter(job_id=job_id, id__lte=before_id).exclude(id__in=gaps).order_by("-id").first()
+    return (log.id, extract_counters(log.get_info())) if log else (0, None)
+
+
+def _job_keys(job_ids) -> dict[int, tuple[int, int]]:
+    """任务 id -> (节点 id, 爬虫 id), 已归档的任务从 JobArchive 中查找"""
+    keys = {job_id: (node_id, spider_id) for job_id, node_id, spider_id in models.Job.objects.filter(
+        id__in=job_ids,
+    ).values_list("id", "node_id", "spider_id")}
+    missing = set(job_ids) - keys.keys()
+    if missing:
+        keys.update({job_id: (node_id, spider_id) for job_id, node_id, spider_id in models.JobArchive.objects.filter(
+            id__in=missing,
+        ).values_list("id", "node_id", "spider_id")})
+    return keys
+
+
+def rollup_job_samples(previous: dict[int, tuple] = None, batch_size: int = 5000) -> int:
+    """
+    汇总 id 大于游标的一批 JobInfoLog: 计数器与同一任务上一条采样的差值累加到 1分钟/1小时/1天 三个粒度
+    每条采样只处理一次, 代价与新采样数成正比; previous 保存各任务上一条汇总过的采样 (id, 计数器), 为空时从数据库查询
+    并发写入时较小的 id 可能晚于较大的 id 提交, 游标跳过的 id 记录在 cursor.gaps 中, 之后出现时补充汇总,
+    超过 ROLLUP_GAP_TIMEOUT 秒仍未出现的视为已回滚
+    :return: 处理的采样条数
+    """
+    previous = {} if previous is None else previous
+    cursor, _ = models.RollupCursor.objects.get_or_create(name="throughput")
+    now = timezone.now()
+    expire = now.timestamp() - get_setting("ROLLUP_GAP_TIMEOUT", 600)
+    gaps = {int(log_id): time for log_id, time in cursor.gaps.items() if time > expire}
+    logs = list(models.JobInfoLog.objects.filter(Q(id__gt=cursor.position) | Q(id__in=gaps)).order_by("id")[:batch_size])
+    if not logs:
+        if len(gaps) != len(cursor.gaps):
+            cursor.gaps = {str(log_id): time for log_id, time in gaps.items()}
+            cursor.save(update_fields=["gaps", "update_time"])
+        return 0
+    infos = samples.load_infos(logs)
+    job_keys = _job_keys({log.job_id for log in logs})
+    totals = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for log in logs:
+        gaps.pop(log.id, None)
+        counters = extract_counters(infos[log.id])
+        if counters is None or log.job_id not in job_keys:
+            continue
+        if log.job_id not in previous:
+            previous[log.job_id] = _previous_counters(log.job_id, cursor.position, [*gaps, log.id])
+        last_id, last = previous[log.job_id]
+        if last_id > log.id:
+            # 迟到的采样: 之后的采样已经按更早的采样计算过差值, 总量中已包含这一段
+            continue
+        previous[log.job_id] = (log.id, counters)
+        last = last or {}
+        node_id, spider_id = job_keys[log.job_id]
+        for resolution in models.RollupResolution.values:
+            total = totals[(resolution, bucket_start(log.create_time, resolution), node_id, spider_id)]
+            for name, value in counters.items():
+                # 计数器变小说明任务重启过, 本次的值就是增量
+                total[name] += value - last.get(name, 0) if value >= last.get(name, 0) else value
+    position = max(cursor.position, logs[-1].id)
+    fetched = {log.id for log in logs if log.id > cursor.position}
+    # 跨度过大通常是数据库跳号, 不逐个记录
+    if position - cursor.position - len(fetched) <= batch_size:
+        gaps.update({log_id: now.timestamp() for log_id in range(cursor.position + 1, position) if log_id not in fetched})
+    with transaction.atomic():
+        existing = models.ThroughputRollup.objects.filter(
+            resolution__in={key[0] for key in totals},
+            bucket__in={key[1] for key in totals},
+            node_id__in={key[2] for key in totals},
+            spider_id__in={key[3] for key in totals},
+        )
+        for row in existing:
+            key = (row.resolution, row.bucket, row.node_id, row.spider_id)
+            if key in totals:
+                for name in COUNTERS:
+                    totals[key][name] += getattr(row, name)
+        now = timezone.now()
+        rows = [
+            models.ThroughputRollup(resolution=resolution, bucket=bucket, node_id=node_id, spider_id=spider_id, update_time=now, **total)
+            for (resolution, bucket, node_id, spider_id), total in totals.items()
+        ]
+        bulk_upsert(
+            models.ThroughputRollup, rows,
+            unique_fields=["resolution", "bucket", "node", "spider"], update_fields=[*COUNTERS, "update_time"],
+        )
+        cursor.position = position
+        cursor.gaps = {str(log_id): time for log_id, time in gaps.items()}
+        cursor.save(update_fields=["position", "gaps", "update_time"])
+    return len(logs)
+
+
+def throughput_series(queryset, resolution: int) -> list[dict]:
+    """按时间汇总 rollup, 返回每个时间桶每分钟的 Item 数、响应数和错误数"""
+    minutes = resolution / 60
+    rows = queryset.filter(resolution=resolution).values("bucket").annotate(
+        **{f"total_{name}": Sum(name) for name in COUNTERS},
+    ).order_by("bucket")
+    return [
+        {"bucket": row["bucket"], **{name: round(row[f"total_{name}"] / minutes, 2) for name in COUNTERS}}
+        for row in rows
+    ]
+
+
+class ThroughputRollupScheduler(BaseScheduler):
+    """增量汇总新的 JobInfoLog 采样, 多进程部署时通过租约保证只有一个进程汇总"""
+    interval = 60
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lease = get_lease("throughput-rollup", ttl=self.interval)
+        self.previous: dict[int, tuple] = {}
+
+    def schedule(self, now):
+        if self.lease is not None and self.lease.acquire() is None:
+            return
+        batch_size = get_setting("ROLLUP_BATCH_SIZE", 5000)
+        processed = 0
+        while True:
+            count = rollup_job_samples(self.previous, batch_size=batch_size)
+            processed += count
+            if count < batch_size:
+                break
+        # 只保留运行中的任务, 已结束的任务不再占用内存
+        running = set(models.Job.objects.filter(status=models.JobStatus.RUNNING).values_list("id", flat=True))
+        self.previous = {job_id: counters for job_id, counters in self.previous.items() if job_id in running}
+        if processed:
+            self.logger.info(f"[Rollup] 汇总{processed}条任务采样")
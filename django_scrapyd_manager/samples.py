@@ -0,0 +1,262 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from logging import getLogger
+from threading import BoundedSemaphore
+import requests
+from django.db import transaction
+from django.db.models import Exists, Min, OuterRef, Subquery
+from django_sched.sched import BaseScheduler
+from . import models, jsondelta, scrapyd_api
+from .lease import get_lease
+from .utils import get_setting
+
+
+logger = getLogger(__name__)
+
+
+class Keyframe:
+    """一个任务当前的关键帧及其已有的差量数"""
+
+    def __init__(self, log: models.JobInfoLog, info: dict, deltas: int = 0):
+        self.log = log
+        self.info = info
+        self.deltas = deltas
+
+    @classmethod
+    def latest(cls, job_id: int) -> "Keyframe | None":
+        log = models.JobInfoLog.objects.filter(job_id=job_id, base__isnull=True).order_by("-create_time").first()
+        if log is None:
+            return None
+        return cls(log, log.get_info(), log.deltas.count())
+
+
+def _codec() -> str:
+    codec = get_setting("JOB_INFO_CODEC", models.JobInfoCodec.ZLIB)
+    if codec == models.JobInfoCodec.ZSTD and jsondelta.zstd is None:
+        logger.warning("zstd 不可用, JobInfoLog 改用 zlib 压缩")
+        return models.JobInfoCodec.ZLIB
+    return codec
+
+
+def _encode(log: models.JobInfoLog, payload: dict, codec: str):
+    raw = jsondelta.dumps(payload)
+    if codec != models.JobInfoCodec.NONE:
+        data = jsondelta.compress(raw, codec)
+        # 很小的差量压缩后反而更大, 直接存 JSON
+        if len(data) < len(raw):
+            log.codec, log.data, log.info = codec, data, None
+            return
+    log.codec, log.data, log.info = models.JobInfoCodec.NONE, None, payload
+
+
+def encode_sample(log: models.JobInfoLog, info: dict, keyframe: Keyframe | None, codec: str = None) -> Keyframe:
+    """
+    把采样 info 编码到 log: 差量不到完整信息一半且关键帧的差量数未达到 JOB_INFO_KEYFRAME_INTERVAL 时只存差量,
+    否则 log 作为新的关键帧; 返回之后采样应使用的关键帧
+    差量总是相对关键帧而不是上一条采样, 删除任意非关键帧的采样不影响其他采样还原
+    """
+    codec = codec or _codec()
+    if keyframe is not None and info is not None and keyframe.deltas < get_setting("JOB_INFO_KEYFRAME_INTERVAL", 30):
+        patch = jsondelta.diff(keyframe.info or {}, info)
+        if len(jsondelta.dumps(patch)) * 2 < len(jsondelta.dumps(info)):
+            log.base = keyframe.log
+            _encode(log, patch, codec)
+            keyframe.deltas += 1
+            return keyframe
+    log.base = None
+    _encode(log, info, codec)
+    return Keyframe(log, info)
+
+
+def save_job_info(job: models.Job, info: dict) -> models.JobInfoLog:
+    log = models.JobInfoLog(job=job)
+    encode_sample(log, info, Keyframe.latest(job.id))
+    log.save()
+    return log
+
+
+def load_infos(logs) -> dict[int, dict]:
+    """批量还原采样的完整信息, 每个关键帧只查询和解码一次, 返回 {采样 id: info}"""
+    logs = list(logs)
+    base_ids = {log.base_id for log in logs if log.base_id} - {log.id for log in logs}
+    keyframes = {log.id: log for log in logs if log.base_id is None}
+    keyframes.update(models.JobInfoLog.objects.in_bulk(base_ids))
+    keyframe_infos = {log_id: log.get_info() for log_id, log in keyframes.items()}
+    return {
+        log.id: keyframe_infos[log.id] if log.base_id is None else log.get_info(keyframe_infos.get(log.base_id))
+        for log in logs
+    }
+
+
+def compact_job_info_logs(batch_size: int = 100, codec: str = None) -> int:
+    """
+    把旧版本保存的完整 JSON 采样改写为关键帧 + 压缩差量, 每批处理 batch_size 个任务
+    只处理未压缩的关键帧, 可以重复执行; 每个任务最新的关键帧只压缩, 运行中的采样器可能正以它为基准写入差量
+    :return: 改写的采样条数
+    """
+    codec = codec or _codec()
+    legacy = models.JobInfoLog.objects.filter(base__isnull=True, codec=models.JobInfoCodec.NONE, info__isnull=False)
+    compacted, last_job_id = 0, 0
+    while True:
+        job_ids = list(legacy.filter(job_id__gt=last_job_id).order_by("job_id").values_list("job_id", flat=True).distinct()[:batch_size])
+        if not job_ids:
+            return compacted
+        last_job_id = job_ids[-1]
+        logs = list(legacy.filter(job_id__in=job_ids).order_by("job_id", "create_time", "id"))
+        # 已经被新采样作为关键帧引用的行和各任务最新的关键帧只压缩, 不能改写为差量
+        referenced = set(models.JobInfoLog.objects.filter(base_id__in=[log.id for log in logs]).values_list("base_id", flat=True))
+        newest = models.JobInfoLog.objects.filter(job_id=OuterRef("job_id"), base__isnull=True).order_by("-create_time", "-id")
+        referenced.update(models.JobInfoLog.objects.filter(
+            job_id__in=job_ids, base__isnull=True, id=Subquery(newest.values("id")[:1]),
+        ).values_list("id", flat=True))
+        changed, keyframe, job_id = [], None, None
+        for log in logs:
+            if log.job_id != job_id:
+                keyframe, job_id = None, log.job_id
+            if log.id in referenced:
+                keyframe = Keyframe(log, log.info)
+                _encode(log, log.info, codec)
+            else:
+                keyframe = encode_sample(log, log.info, keyframe, codec)
+            changed.append(log)
+        with transaction.atomic():
+            models.JobInfoLog.objects.bulk_update(changed, ["base", "info", "codec", "data"], batch_size=500)
+        compacted += len(changed)
+
+
+def fetch_job_infos(jobs, per_node: int = 4, max_workers: int = 16) -> dict[int, dict]:
+    """
+    并发获取一批任务的信息, 每个节点同时最多 per_node 个请求, 获取失败的任务不出现在结果中
+    jobs 需要预先 select_related node/project/spider, 工作线程中不访问数据库
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return {}
+    semaphores = defaultdict(lambda: BoundedSemaphore(per_node))
+    for job in jobs:
+        semaphores[job.node_id]
+    sessions = {node_id: requests.Session() for node_id in semaphores}
+
+    def fetch(job: models.Job):
+        with semaphores[job.node_id]:
+            try:
+                return scrapyd_api.fetch_job_info(job, session=sessions[job.node_id])
+            except Exception as e:
+                logger.warning(f"获取任务{job.job_id}信息失败: {e}")
+                return None
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs)), thread_name_prefix="job-sampler") as executor:
+        infos = dict(zip([job.id for job in jobs], executor.map(fetch, jobs)))
+    for session in sessions.values():
+        session.close()
+    return {job_id: info for job_id, info in infos.items() if info is not None}
+
+
+def _prune_buckets(rows, bucket: int) -> tuple[list[int], list[int]]:
+    """把按时间排序的采样分桶, 桶内优先保留第一个关键帧, 返回 (要删除的差量 id, 要删除的关键帧 id)"""
+    buckets = defaultdict(list)
+    for row in rows:
+        buckets[(row["job_id"], int(row["create_time"].timestamp()) // bucket)].append(row)
+    drop_deltas, drop_keyframes = [], []
+    for rows in buckets.values():
+        keep = next((row for row in rows if row["base_id"] is None), rows[0])
+        for row in rows:
+            if row is not keep:
+                (drop_keyframes if row["base_id"] is None else drop_deltas).append(row["id"])
+    return drop_deltas, drop_keyframes
+
+
+def _delete_samples(drop_deltas: list[int], drop_keyframes: list[int]) -> int:
+    with transaction.atomic():
+        deleted = models.JobInfoLog.objects.filter(id__in=drop_deltas).delete()[0]
+        referenced = set(models.JobInfoLog.objects.filter(base_id__in=drop_keyframes).values_list("base_id", flat=True))
+        return deleted + models.JobInfoLog.objects.filter(id__in=set(drop_keyframes) - referenced).delete()[0]
+
+
+def _sweep_keyframes(before, bucket: int, batch_size: int) -> int:
+    """
+    之前的窗口中因为仍被差量引用而保留下来的多余关键帧, 差量被后续窗口删除后不会再被处理
+    找出 before 之前已经没有差量引用的关键帧, 按同样的分桶规则重新处理其所在任务; 各任务最新的关键帧可能是采样器的基准, 不处理
+    """
+    newest = models.JobInfoLog.objects.filter(job_id=OuterRef("job_id"), base__isnull=True).order_by("-create_time", "-id")
+    orphans = models.JobInfoLog.objects.filter(create_time__lt=before, base__isnull=True).exclude(
+        Exists(models.JobInfoLog.objects.filter(base_id=OuterRef("id"))),
+    ).exclude(id=Subquery(newest.values("id")[:1]))
+    deleted, last_job_id = 0, 0
+    while True:
+        since = dict(orphans.filter(job_id__gt=last_job_id).order_by("job_id").values("job_id").annotate(
+            since=Min("create_time"),
+        ).values_list("job_id", "since")[:batch_size])
+        if not since:
+            return deleted
+        last_job_id = max(since)
+        rows = models.JobInfoLog.objects.filter(job_id__in=since, create_time__lt=before).filter(
+            create_time__gte=min(since.values()) - timedelta(seconds=bucket),
+        ).order_by("create_time", "id").values("id", "job_id", "base_id", "create_time")
+        # 只删除没有差量引用的关键帧, 已处理窗口中剩下的差量都是各桶保留的那一条
+        drop_keyframes = set(_prune_buckets(rows, bucket)[1]) & set(orphans.filter(job_id__in=since).values_list("id", flat=True))
+        deleted += _delete_samples([], list(drop_keyframes))
+
+
+def downsample_job_info_logs(before, bucket: int, since=None, batch_size: int = 100) -> int:
+    """
+    把 [since, before) 内的采样降采样为每个任务每 bucket 秒最多保留一条, 桶内优先保留关键帧
+    不再被任何采样引用的关键帧才会删除; 给出 since 时还会清理 since 之前已经不再被引用的多余关键帧
+    :return: 删除的采样条数
+    """
+    window = models.JobInfoLog.objects.filter(create_time__lt=before)
+    if since is not None:
+        window = window.filter(create_time__gte=since)
+    deleted, last_job_id = 0, 0
+    while True:
+        job_ids = list(window.filter(job_id__gt=last_job_id).order_by("job_id").values_list("job_id", flat=True).distinct()[:batch_size])
+        if not job_ids:
+            break
+        last_job_id = job_ids[-1]
+        rows = window.filter(job_id__in=job_ids).order_by("create_time", "id").values("id", "job_id", "base_id", "create_time")
+        deleted += _delete_samples(*_prune_buckets(rows, bucket))
+    if since is not None:
+        deleted += _sweep_keyframes(since, bucket, batch_size)
+    return deleted
+
+
+class JobSampleScheduler(BaseScheduler):
+    """
+    定期采样所有运行中的任务, 批量写入 JobInfoLog
+    采样间隔通过 DJANGO_SCHED 中的 INTERVAL 配置, 多进程部署时通过租约保证只有一个进程采样
+    """
+    interval = 60
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lease = get_lease("job-sampler", ttl=self.interval)
+        # 各任务当前的关键帧, 避免每轮都查询和解码
+        self.keyframes: dict[int, Keyframe] = {}
+
+    def schedule(self, now):
+        if self.lease is not None and self.lease.acquire() is None:
+            return
+        jobs = list(models.Job.objects.filter(status=models.JobStatus.RUNNING).select_related("node", "project", "spider"))
+        infos = fetch_job_infos(
+            jobs,
+            per_node=get_setting("JOB_SAMPLE_NODE_CONCURRENCY", 4),
+            max_workers=get_setting("JOB_SAMPLE_MAX_WORKERS", 16),
+        )
+        self.keyframes = {job_id: keyframe for job_id, keyframe in self.keyframes.items() if job_id in infos}
+        logs = []
+        for job in jobs:
+            if job.id not in infos:
+                continue
+            if job.id not in self.keyframes:
+                self.keyframes[job.id] = Keyframe.latest(job.id)
+            log = models.JobInfoLog(job=job, create_time=now)
+            self.keyframes[job.id] = encode_sample(log, infos[job.id], self.keyframes[job.id])
+            logs.append(log)
+        models.JobInfoLog.objects.bulk_create(logs, batch_size=500)
+        for job_id, keyframe in list(self.keyframes.items()):
+            # 不支持返回主键的数据库下一轮重新查询关键帧
+            if keyframe is not None and keyframe.log.pk is None:
+                self.keyframes.pop(job_id)
+        if logs:
+            self.logger.info(f"[JobSample] 采样{len(logs)}个运行中的任务")
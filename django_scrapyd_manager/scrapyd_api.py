@@ -1,10 +1,16 @@
 # scrapyd_manager/scrapyd_api.py
+import os
+import time
+import uuid
 import requests
+from django.core.cache import cache
 from django.utils import timezone
 from typing import List
 from logging import getLogger
 from .cache import django_ttl_cache
-from . import models
+from .utils import get_setting, bulk_upsert
+from . import models, polling, eggs
+from django.db import transaction
 from django.db.models import Q
 from typing import Protocol, Iterable
 from datetime import datetime
@@ -16,6 +22,8 @@ class SpiderGroupLike(Protocol):
     code: str | None
     kwargs: dict
     settings: dict
+    placement: str
+    placement_nodes: list[models.Node]
     resolved_spiders: Iterable[models.Spider]
 
 
@@ -30,6 +38,10 @@ class NodesSyncError(Exception):
     pass
 
 
+class NoAvailableNodeError(Exception):
+    pass
+
+
 def _auth_for_node(node: models.Node):
     """返回 node 的认证信息"""
     if getattr(node, "auth", False):
@@ -37,9 +49,11 @@ def _auth_for_node(node: models.Node):
     return None
 
 
-def start_spider(spider: models.Spider) -> str:
-    """启动爬虫并返回 Job"""
-    url = f"{spider.version.project.node.url}/schedule.json"
+def start_spider(spider: models.Spider, node: models.Node = None) -> str:
+    """启动爬虫并返回 Job, 指定 node 时在该节点上运行爬虫所属版本"""
+    home_node = spider.version.project.node
+    node = node or home_node
+    url = f"{node.url}/schedule.json"
     kwargs = spider.kwargs.copy()
     for k, v in list(kwargs.items()):
         if k.startswith("__"):
@@ -51,14 +65,35 @@ def start_spider(spider: models.Spider) -> str:
         "jobid": spider.job_id,
         **kwargs,
     }
-    resp = requests.post(url, data=data, auth=_auth_for_node(spider.version.project.node), timeout=15)
+    if node.pk != home_node.pk:
+        data["_version"] = spider.version.version
+    resp = requests.post(url, data=data, auth=_auth_for_node(node), timeout=15)
     resp.raise_for_status()
     result = resp.json()
     job_id = result.get("jobid")
     if not job_id:
         raise ValueError(f"爬虫启动失败：{result}")
+    polling.request_refresh(node)
     return job_id
 
+def dispatch_queue_enabled() -> bool:
+    return get_setting("DISPATCH_QUEUE_ENABLED", False)
+
+
+def enqueue_spider(spider: models.Spider, node: models.Node = None, priority: int = 0) -> models.DispatchRequest:
+    """把启动请求放入调度队列, 由 DispatchScheduler 按节点 pending 数下发"""
+    node = node or spider.version.project.node
+    return models.DispatchRequest.objects.create(
+        node=node,
+        spider=spider,
+        spider_name=spider.name,
+        fp=spider.fp,
+        kwargs=spider.kwargs,
+        settings=spider.settings,
+        priority=priority,
+    )
+
+
 def start_spiders(spiders: List[models.Spider]) -> bool:
     """批量启动爬虫"""
     for spider in spiders:
@@ -98,6 +133,7 @@ def stop_job(job: models.Job) -> models.Job | None:
     resp = requests.post(url, data=data, auth=_auth_for_node(job.node), timeout=15)
     resp.raise_for_status()
     result = resp.json()
+    polling.request_refresh(job.node)
     if result.get("status") == "ok":
         job.status = models.JobStatus.FINISHED
         job.end_time = timezone.now()
@@ -116,15 +152,91 @@ def stop_jobs(jobs: List[models.Job]) -> List[models.Job]:
     return stopped_jobs
 
 
-def start_spider_group(group: SpiderGroupLike) -> List[models.Job]:
-    """启动任务组里的所有爬虫"""
+class NodePlacer:
+    """
+    按节点负载为爬虫选择节点
+    - 负载取自 daemonstatus 的 running + pending, 每轮只请求一次, 之后按已分配的爬虫累加
+    - 剩余槽位最多的节点优先, 不限槽位(max_slots=0)的节点按负载最低优先
+    """
+
+    def __init__(self, nodes: Iterable[models.Node]):
+        self.nodes = list(nodes)
+        self._load: dict[int, int] | None = None
+
+    def load(self) -> dict[int, int]:
+        if self._load is None:
+            self._load = {}
+            for node in self.nodes:
+                try:
+                    status = daemon_status(node)
+                except Exception as e:
+                    logger.warning(f"获取节点{node}负载失败, 跳过: {e}")
+                    continue
+                self._load[node.id] = int(status.get("running", 0)) + int(status.get("pending", 0))
+        return self._load
+
+    def choose(self) -> models.Node:
+        load = self.load()
+        candidates = []
+        for node in self.nodes:
+            if node.id not in load:
+                continue
+            used = load[node.id]
+            free = node.max_slots - used if node.max_slots else float("inf")
+            if free > 0:
+                candidates.append((free, -used, node))
+        if not candidates:
+            raise NoAvailableNodeError(f"节点{[node.name for node in self.nodes]}没有空闲槽位")
+        free, _, node = max(candidates, key=lambda x: (x[0], x[1]))
+        load[node.id] += 1
+        return node
+
+
+def ensure_version_on_node(version: models.ProjectVersion, node: models.Node) -> models.ProjectVersion:
+    """确保版本已部署到 node, 没有则用该版本的 egg 部署"""
+    if version.project.node_id == node.id:
+        return version
+    project, _ = models.Project.objects.get_or_create(node=node, name=version.project.name)
+    target = models.ProjectVersion.objects.filter(project=project, version=version.version).first()
+    if target is not None and target.scrapyd_exists:
+        return target
+    if not version.egg_file:
+        raise ValueError(f"{version.full_path}没有egg文件, 无法部署到节点{node}")
+    if target is None:
+        target = models.ProjectVersion(
+            project=project,
+            version=version.version,
+            egg_file=version.egg_file.name,
+            egg_sha256=version.egg_sha256,
+            egg_size=version.egg_size,
+            egg_stored_at=version.egg_stored_at,
+            egg_present=version.egg_present,
+            description=version.description,
+        )
+    deploy_project_version(target)
+    return target
+
+
+def start_spider_group(group: SpiderGroupLike, node: models.Node = None) -> List[str | models.DispatchRequest]:
+    """
+    启动任务组里的所有爬虫, 节点池模式下逐个爬虫选择负载最低的节点
+    开启调度队列时只入队, 返回排队记录
+    """
     spiders = group.resolved_spiders
     if not spiders:
         raise ValueError("group下面没有爬虫")
+    placer = None
+    if node is None and group.placement == models.PlacementMode.POOL:
+        placer = NodePlacer(group.placement_nodes)
     job_ids = []
     for spider in spiders:
-        job_id = start_spider(spider)
-        job_ids.append(job_id)
+        target = placer.choose() if placer else node
+        if target is not None:
+            ensure_version_on_node(spider.version, target)
+        if dispatch_queue_enabled():
+            job_ids.append(enqueue_spider(spider, node=target))
+        else:
+            job_ids.append(start_spider(spider, node=target))
     return job_ids
 
 
@@ -138,21 +250,54 @@ def stop_spider_group(group: models.SpiderGroup) -> List[models.Job]:
     return jobs
 
 
-@django_ttl_cache()
-def get_job_info(job: models.Job) -> dict:
-    """获取某个任务的详细信息"""
+def fetch_job_info(job: models.Job, session: requests.Session = None) -> dict:
+    """请求 Scrapyd 获取某个任务的详细信息, 不经过缓存"""
     url = f"{job.node.url}/logs/{job.project.name}/{job.spider.name}/{job.job_id}.json"
-    resp = requests.get(url, auth=_auth_for_node(job.node), timeout=15)
+    resp = (session or requests).get(url, auth=_auth_for_node(job.node), timeout=15)
     resp.raise_for_status()
     return resp.json()
 
 
+def job_file_url(job: models.BaseJob, path: str) -> str:
+    """listjobs 返回的 log_url/items_url 是相对 Scrapyd 根路径的地址"""
+    if path.startswith(("http://", "https://")):
+        return path
+    return f"{job.node.url}/{path.lstrip('/')}"
+
+
+def request_job_file(job: models.BaseJob, path: str, start: int = None, suffix: int = None) -> requests.Response:
+    """
+    流式请求任务的日志或 items 文件, start 不为空时只请求 start 之后的字节, suffix 不为空时只请求最后 suffix 个字节
+    返回 206 表示服务端按 Range 返回, 200 表示服务端忽略了 Range, 416 表示请求的范围内没有数据
+    """
+    headers = {}
+    if start is not None:
+        headers["Range"] = f"bytes={start}-"
+    elif suffix is not None:
+        headers["Range"] = f"bytes=-{suffix}"
+    resp = requests.get(job_file_url(job, path), headers=headers, auth=_auth_for_node(job.node), stream=True, timeout=30)
+    if resp.status_code not in (200, 206, 416):
+        resp.close()
+        resp.raise_for_status()
+    return resp
+
+
+def get_job_info(job: models.Job) -> dict:
+    """获取某个任务的详细信息, 按任务 id 缓存 10 秒"""
+    key = f"scrapyd_manager:job_info:{job.id}"
+    info = cache.get(key)
+    if info is None:
+        info = fetch_job_info(job)
+        cache.set(key, info, 10)
+    return info
+
+
 @django_ttl_cache()
 def sync_jobs(node: models.Node) -> List[models.Job]:
     """列出节点上的所有任务并同步到数据库"""
+    started = time.time()
     url = f"{node.url}/listjobs.json"
     jobs = []
-    models.Job.objects.filter(node=node, status=models.JobStatus.PENDING).delete()
     for project in node.projects.all():
         resp = requests.get(url, params={"project": project.name}, auth=_auth_for_node(node), timeout=15)
         resp.raise_for_status()
@@ -185,82 +330,211 @@ def sync_jobs(node: models.Node) -> List[models.Job]:
                 job.gen_md5()
                 jobs.append(job)
 
-    models.Job.objects.bulk_create(jobs, ignore_conflicts=True)
+    # Scrapyd 仍会返回已经归档的历史任务, 不再写回热表
+    archived = set(models.JobArchive.objects.filter(
+        job_md5__in=[job.job_md5 for job in jobs if job.status == models.JobStatus.FINISHED],
+    ).values_list("job_md5", flat=True))
+    with transaction.atomic():
+        models.Job.objects.filter(node=node, status=models.JobStatus.PENDING).delete()
+        # 已存在的任务更新状态, 否则结束的任务会一直停留在运行中
+        bulk_upsert(models.Job, [job for job in jobs if job.job_md5 not in archived], unique_fields=["job_md5"], update_fields=["status", "end_time", "pid", "log_url", "items_url", "update_time"])
     logger.info(f"{len(jobs)} jobs synced for {node}")
+    polling.record_jobs(node, jobs, started)
     return jobs
 
 
+def poll_jobs(node: models.Node) -> List[models.Job]:
+    """
+    按自适应间隔读取节点任务列表, 未到期时返回上次同步的结果
+    未到期期间用代价很低的 daemonstatus 探测任务启动/结束, 计数变化时立即重新同步, 否则从数据库读取上次同步的任务
+    """
+    if not polling.adaptive_polling_enabled():
+        return sync_jobs(node)
+    state = polling.NodePollState.load(node)
+    now = time.time()
+    if not state.is_due(now) and now - state.status_time >= state.min_interval:
+        try:
+            daemon_status(node)
+            state = polling.NodePollState.load(node)
+        except Exception as e:
+            logger.warning(f"获取节点{node}状态失败, 重新同步任务: {e}")
+            state.refresh_now()
+    if state.is_due(now):
+        return sync_jobs.__wrapped__(node)
+    return list(models.Job.objects.filter(node=node, job_id__in=state.job_ids))
+
+
+def list_project_versions(node: models.Node, project_name: str) -> list[str]:
+    url = f"{node.url}/listversions.json"
+    resp = requests.get(url, params={"project": project_name}, auth=_auth_for_node(node), timeout=15)
+    resp.raise_for_status()
+    return resp.json().get("versions", [])
+
+
+def save_project_versions(project_versions: dict[models.Project, list[str]]):
+    """批量写入多个项目在 Scrapyd 上的版本, 只写入新增或状态变化的版本, 不在列表中的版本标记为不存在"""
+    synced = set(models.ProjectVersion.objects.filter(
+        project__in=project_versions.keys(), sync_status=models.SyncStatus.SUCCESS, scrapyd_exists=True,
+    ).values_list("project_id", "version"))
+    objs = [
+        models.ProjectVersion(project=project, version=version, sync_status=models.SyncStatus.SUCCESS, scrapyd_exists=True)
+        for project, versions in project_versions.items() for version in versions
+        if (project.id, version) not in synced
+    ]
+    missing = Q()
+    for project, versions in project_versions.items():
+        missing |= Q(project=project) & ~Q(version__in=versions)
+    if missing:
+        models.ProjectVersion.objects.filter(missing, scrapyd_exists=True).update(scrapyd_exists=False)
+    bulk_upsert(models.ProjectVersion, objs, unique_fields=["project", "version"], update_fields=["sync_status", "scrapyd_exists", "update_time"])
+
+
 @django_ttl_cache()
 def sync_project_versions(project: models.Project):
-    url = f"{project.node.url}/listversions.json"
-    resp = requests.get(url, params={"project": project.name}, auth=_auth_for_node(project.node), timeout=15)
-    resp.raise_for_status()
-    data = resp.json()
-    versions = data.get("versions", [])
-    project_versions = []
-    for version in versions:
-        project_versions.append(models.ProjectVersion(project=project, version=version, sync_status=models.SyncStatus.SUCCESS, scrapyd_exists=True))
-    # models.ProjectVersion.objects.bulk_create(
-    #     project_versions, update_conflicts=True, unique_fields=("project", "version"), update_fields=["sync_status", "scrapyd_exists"])
-    # mysql不支持update_conflicts=True, 所以这里先插入, 再筛选更新
-    models.ProjectVersion.objects.bulk_create(project_versions, ignore_conflicts=True)
-    models.ProjectVersion.objects.filter(project=project, version__in=versions).update(sync_status=models.SyncStatus.SUCCESS, scrapyd_exists=True)
-    models.ProjectVersion.objects.filter(~Q(version__in=versions), project=project).update(scrapyd_exists=False)
-    logger.info(f"sync {len(project_versions)} versions for {project}")
+    versions = list_project_versions(project.node, project.name)
+    with transaction.atomic():
+        save_project_versions({project: versions})
+    logger.info(f"sync {len(versions)} versions for {project}")
 
 
 @django_ttl_cache()
 def sync_node_projects(node: models.Node, include_version=True):
-    """列出某个节点上的项目，支持是否展开版本"""
+    """列出某个节点上的项目，支持是否展开版本; 先完成所有请求, 再在一个事务中批量写入"""
     url = f"{node.url}/listprojects.json"
     resp = requests.get(url, auth=_auth_for_node(node), timeout=5)
     resp.raise_for_status()
     data = resp.json()
     scrapyd_projects = data.get("projects", [])
-    projects = []
-    for project_name in scrapyd_projects:
-        project, created = models.Project.objects.update_or_create(node=node, name=project_name, defaults={"sync_status": models.SyncStatus.SUCCESS, "scrapyd_exists": True})
-        projects.append(project)
+    versions = {}
+    if include_version:
+        versions = {project_name: list_project_versions(node, project_name) for project_name in scrapyd_projects}
+    with transaction.atomic():
+        bulk_upsert(
+            models.Project,
+            [models.Project(node=node, name=name, sync_status=models.SyncStatus.SUCCESS, scrapyd_exists=True) for name in scrapyd_projects],
+            unique_fields=["node", "name"],
+            update_fields=["sync_status", "scrapyd_exists", "update_time"],
+        )
+        models.Project.objects.filter(~Q(name__in=scrapyd_projects), node=node).update(scrapyd_exists=False)
+        projects = list(node.projects.filter(name__in=scrapyd_projects))
         if include_version:
-            sync_project_versions(project)
-    models.Project.objects.filter(~Q(name__in=scrapyd_projects), node=node).update(scrapyd_exists=False)
+            save_project_versions({project: versions[project.name] for project in projects})
     logger.info(f"sync {len(scrapyd_projects)} project for {node}")
     return projects
 
 
+def known_spider_names(version: models.ProjectVersion) -> list[str] | None:
+    """
+    内容相同的 egg 包含相同的爬虫, 优先复用 sha256 相同的版本已同步的爬虫列表,
+    其次复用其他节点上同一项目同名且 egg 不冲突的版本
+    """
+    synced = models.ProjectVersion.objects.filter(is_spider_synced=True, spiders__isnull=False).exclude(pk=version.pk)
+    source = None
+    if version.egg_sha256:
+        source = synced.filter(egg_sha256=version.egg_sha256).first()
+    if source is None:
+        same_version = synced.filter(project__name=version.project.name, version=version.version)
+        if version.egg_sha256:
+            same_version = same_version.filter(Q(egg_sha256__isnull=True) | Q(egg_sha256=version.egg_sha256))
+        source = same_version.first()
+    if source is None:
+        return None
+    return list(source.spiders.values_list("name", flat=True))
+
+
+def list_spiders(version: models.ProjectVersion) -> list[str]:
+    url = f"{version.project.node.url}/listspiders.json"
+    resp = requests.get(url, params={
+        "project": version.project.name,
+        "_version": version.version,
+    }, auth=_auth_for_node(version.project.node), timeout=5)
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("spiders", [])
+
+
 def sync_project_version_spiders(version: models.ProjectVersion) -> bool:
-    """列出某个项目的爬虫"""
+    """列出某个项目的爬虫, 能从已知版本或 egg 文件得到爬虫列表时不请求 listspiders.json"""
     if version.scrapyd_exists and (not version.is_spider_synced or version.spiders.count() == 0):
-        url = f"{version.project.node.url}/listspiders.json"
-        resp = requests.get(url, params={
-            "project": version.project.name,
-            "_version": version.version,
-        }, auth=_auth_for_node(version.project.node), timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-        spiders = data.get("spiders", [])
+        spiders = known_spider_names(version)
+        source = "known version"
+        if spiders is None and get_setting("SPIDER_LIST_FROM_EGG", False):
+            spiders = eggs.extract_spider_names(version)
+            source = "egg file"
+        if spiders is None:
+            spiders = list_spiders(version)
+            source = "scrapyd"
         spider_registries = [models.SpiderRegistry(name=spider) for spider in spiders]
         models.SpiderRegistry.objects.bulk_create(spider_registries, ignore_conflicts=True)
 
         results = [models.Spider(version=version, name=spider, registry_id=spider) for spider in spiders]
         models.Spider.objects.bulk_create(results)
         # 只需同步一次, 因为一个版本的spiders是不会变的
-        logger.info(f"synced {len(spiders)} spiders for {version}@{version.project}")
+        logger.info(f"synced {len(spiders)} spiders for {version}@{version.project} from {source}")
         version.is_spider_synced = True
         version.save()
     return version.is_spider_synced
 
 
-def add_version(version: models.ProjectVersion):
-    """部署新版本"""
-    url = f"{version.project.node.url}/addversion.json"
+class MultipartEggBody:
+    """
+    流式的 multipart 请求体, 发送时按块读取 egg 文件, 不会把整个文件读入内存
+    提供 __len__ 让 requests 设置 Content-Length 而不是使用分块传输
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, fields: dict, egg_file):
+        self.egg_file = egg_file
+        self.boundary = uuid.uuid4().hex
+        head = "".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'
+            for key, value in fields.items()
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="egg"; '
+            f'filename="{os.path.basename(egg_file.name)}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+        )
+        self.head = head.encode("utf-8")
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self.size = egg_file.storage.size(egg_file.name)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return len(self.head) + self.size + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        with self.egg_file.storage.open(self.egg_file.name, "rb") as f:
+            while chunk := f.read(self.chunk_size):
+                yield chunk
+        yield self.tail
+
+
+def add_version(version: models.ProjectVersion, node: models.Node = None):
+    """部署新版本, 指定 node 时把该版本的 egg 部署到 node"""
+    node = node or version.project.node
+    url = f"{node.url}/addversion.json"
     if not version.egg_file:
         raise Exception("egg_file is not set")
-    files = {"egg": version.egg_file.open()}
-    data = {"project": version.project.name, "version": version.version}
-    resp = requests.post(url, data=data, files=files, auth=_auth_for_node(version.project.node), timeout=15)
+    body = MultipartEggBody({"project": version.project.name, "version": version.version}, version.egg_file)
+    resp = requests.post(url, data=body, headers={"Content-Type": body.content_type}, auth=_auth_for_node(node), timeout=60)
     resp.raise_for_status()
-    return resp.json()
+    result = resp.json()
+    if result.get("status") != "ok":
+        raise ScrapydResponseError(result.get("message", result))
+    return result
+
+
+def deploy_project_version(version: models.ProjectVersion):
+    """部署版本并同步该版本的爬虫"""
+    add_version(version)
+    version.scrapyd_exists = True
+    version.sync_status = models.SyncStatus.SUCCESS
+    version.save()
+    sync_project_version_spiders(version)
 
 
 def delete_version(version: models.ProjectVersion):
@@ -285,12 +559,15 @@ def delete_project(project: models.Project):
         raise ScrapydResponseError(ret["message"])
 
 
-def daemon_status(node: models.Node, timeout=3) -> dict:
-    """获取节点的 daemon 状态"""
+def daemon_status(node: models.Node, timeout=3, record=True) -> dict:
+    """获取节点的 daemon 状态, record 为 False 时不更新自适应轮询状态(只读的展示场景)"""
     url = f"{node.url}/daemonstatus.json"
     resp = requests.get(url, auth=_auth_for_node(node), timeout=timeout)
     resp.raise_for_status()
-    return resp.json()
+    result = resp.json()
+    if record:
+        polling.record_status(node, result)
+    return result
 
 
 @django_ttl_cache()
@@ -310,7 +587,7 @@ def sync_nodes(with_jobs=False):
 
     if with_jobs:
         for node in available_nodes:
-            sync_jobs(node)
+            poll_jobs(node)
 
     if error_nodes:
         return f"节点{[node.name for node in available_nodes]}同步成功, 节点{[node.name for node in error_nodes]}同步失败"
@@ -0,0 +1,135 @@
+import bisect
+import hashlib
+from datetime import timedelta
+from logging import getLogger
+from threading import Thread, Event, Lock
+from django.db import close_old_connections
+from django.utils import timezone
+from . import models
+from .lease import DatabaseLease, default_owner
+
+
+logger = getLogger(__name__)
+
+
+class HashRing:
+    """一致性哈希环, 每个成员放置 replicas 个虚拟节点, 成员增减时只有相邻区间的 key 会迁移"""
+
+    def __init__(self, members, replicas: int = 64):
+        self.ring: list[tuple[int, str]] = []
+        for member in members:
+            for i in range(replicas):
+                self.ring.append((self._hash(f"{member}#{i}"), member))
+        self.ring.sort()
+        self._keys = [h for h, _ in self.ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:16], 16)
+
+    def owner(self, key) -> str | None:
+        if not self.ring:
+            return None
+        index = bisect.bisect(self._keys, self._hash(str(key))) % len(self.ring)
+        return self.ring[index][1]
+
+
+def placement_anchors() -> dict[int, int]:
+    """
+    按守护任务的调度目标划分分片, 返回 {节点 id: 所在分片的锚点}
+    节点池模式下组的任务可能启动在池中任一节点上, 池中节点与组所在节点合并为同一分片, 锚点为分片内最小的节点 id
+    """
+    parent: dict[int, int] = {}
+
+    def find(node_id: int) -> int:
+        parent.setdefault(node_id, node_id)
+        while parent[node_id] != node_id:
+            parent[node_id] = parent[parent[node_id]]
+            node_id = parent[node_id]
+        return node_id
+
+    guardians = models.Guardian.objects.filter(enable=True, spider_group__isnull=False)
+    for node_id in guardians.values_list("spider_group__node_id", flat=True):
+        find(node_id)
+    pools = models.SpiderGroup.node_pool.through.objects.filter(
+        spidergroup__in=guardians.filter(spider_group__placement=models.PlacementMode.POOL).values("spider_group_id"),
+    ).values_list("spidergroup__node_id", "node_id")
+    for a, b in pools:
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    return {node_id: find(node_id) for node_id in list(parent)}
+
+
+class ShardKeeper(Thread):
+    """
+    分片守护的后台线程
+    - 按固定间隔在 SchedulerWorker 表中写心跳, 心跳超过 ttl 的 worker 视为已离开
+    - 按分片锚点在存活 worker 组成的哈希环上分配节点, 同一节点池中的节点总是分给同一个 worker, worker 增减时自动重新分配
+    - 对分到的每个节点持有一个租约, 保证重新分配的过渡期内同一节点不会被两个 worker 同时守护
+    """
+
+    def __init__(self, scheduler_name: str, ttl: int = 10, interval: float = None):
+        super().__init__(daemon=True, name=f"ShardKeeper[{scheduler_name}]")
+        self.scheduler_name = scheduler_name
+        self.worker = default_owner()
+        self.ttl = ttl
+        self.interval = interval or max(ttl / 3, 1)
+        self.leases: dict[int, DatabaseLease] = {}
+        self._lock = Lock()
+        self._stopped = Event()
+
+    def heartbeat(self) -> list[str]:
+        now = timezone.now()
+        models.SchedulerWorker.objects.update_or_create(
+            name=self.worker,
+            defaults={"scheduler": self.scheduler_name, "heartbeat": now, "nodes": self.held_nodes()},
+        )
+        alive_since = now - timedelta(seconds=self.ttl)
+        # 清理早已离开的 worker 记录
+        models.SchedulerWorker.objects.filter(scheduler=self.scheduler_name, heartbeat__lt=now - timedelta(seconds=self.ttl * 10)).delete()
+        return list(models.SchedulerWorker.objects.filter(
+            scheduler=self.scheduler_name, heartbeat__gte=alive_since,
+        ).values_list("name", flat=True))
+
+    def rebalance(self):
+        ring = HashRing(self.heartbeat())
+        owned = {node_id for node_id, anchor in placement_anchors().items() if ring.owner(anchor) == self.worker}
+        with self._lock:
+            for node_id in list(self.leases):
+                if node_id not in owned:
+                    self.leases.pop(node_id).release()
+            for node_id in owned:
+                if node_id not in self.leases:
+                    self.leases[node_id] = DatabaseLease(self.node_lease_name(node_id), ttl=self.ttl, owner=self.worker)
+        for lease in list(self.leases.values()):
+            lease.acquire()
+
+    def held_nodes(self) -> list[int]:
+        with self._lock:
+            return [node_id for node_id, lease in self.leases.items() if lease.is_held()]
+
+    def node_lease_name(self, node_id: int) -> str:
+        return f"{self.scheduler_name}:node:{node_id}"
+
+    def node_token(self, node_id: int) -> int | None:
+        lease = self.leases.get(node_id)
+        if lease is not None and lease.is_held():
+            return lease.token
+        return None
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self.rebalance()
+            except Exception as e:
+                logger.warning(f"{self.worker} 分片重新分配失败: {e}")
+            close_old_connections()
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            for lease in self.leases.values():
+                lease.release()
+        models.SchedulerWorker.objects.filter(name=self.worker).delete()
@@ -0,0 +1,62 @@
+(function($) {
+    $(function() {
+        const $changelist = $("#changelist");
+        if (!$changelist.length) {
+            return;
+        }
+        const series = [
+            {key: "items", name: "Item/分钟", color: "#417690"},
+            {key: "requests", name: "响应/分钟", color: "#79aec8"},
+            {key: "errors", name: "错误/分钟", color: "#ba2121"},
+        ];
+        const width = 960, height = 240, padding = 40;
+        const svgNS = "http://www.w3.org/2000/svg";
+
+        function svgElement(name, attrs) {
+            let el = document.createElementNS(svgNS, name);
+            for (let k in attrs) {
+                el.setAttribute(k, attrs[k]);
+            }
+            return el;
+        }
+
+        function draw(data) {
+            let $container = $('<div id="throughput-chart" style="margin-bottom: 16px"></div>');
+            $changelist.before($container);
+            if (!data.series.length) {
+                $container.text("所选范围内没有吞吐数据");
+                return;
+            }
+            let times = data.series.map(p => new Date(p.bucket).getTime());
+            let minTime = Math.min(...times), maxTime = Math.max(...times);
+            let maxValue = Math.max(1, ...data.series.flatMap(p => series.map(s => p[s.key])));
+            let x = t => padding + (maxTime === minTime ? 0 : (t - minTime) / (maxTime - minTime) * (width - 2 * padding));
+            let y = v => height - padding - v / maxValue * (height - 2 * padding);
+
+            let svg = svgElement("svg", {width: width, height: height, viewBox: `0 0 ${width} ${height}`});
+            svg.appendChild(svgElement("line", {x1: padding, y1: height - padding, x2: width - padding, y2: height - padding, stroke: "#ccc"}));
+            svg.appendChild(svgElement("line", {x1: padding, y1: padding, x2: padding, y2: height - padding, stroke: "#ccc"}));
+            let label = svgElement("text", {x: 2, y: padding, "font-size": 11, fill: "#666"});
+            label.textContent = maxValue;
+            svg.appendChild(label);
+            [[minTime, "start"], [maxTime, "end"]].forEach(([t, anchor]) => {
+                let text = svgElement("text", {x: x(t), y: height - padding + 16, "font-size": 11, fill: "#666", "text-anchor": anchor});
+                text.textContent = new Date(t).toLocaleString();
+                svg.appendChild(text);
+            });
+            series.forEach((s, i) => {
+                let points = data.series.map((p, j) => `${x(times[j])},${y(p[s.key])}`).join(" ");
+                svg.appendChild(svgElement("polyline", {points: points, fill: "none", stroke: s.color, "stroke-width": 2}));
+                let legend = svgElement("text", {x: width - padding - 240 + i * 80, y: 14, "font-size": 12, fill: s.color});
+                legend.textContent = s.name;
+                svg.appendChild(legend);
+            });
+            $container.append(svg);
+        }
+
+        $.ajax({
+            url: `${window.location.pathname}api/chart/${window.location.search}`,
+            success: draw,
+        });
+    });
+})(django.jQuery);
@@ -1,3 +1,1659 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.dispatch import Signal
+from django_scrapyd_manager import models, scrapyd_api, dispatcher, lease, sharding, retention, outbox, reconcile, polling, deploy, eggs, pagination, jsondelta, samples, rollups, logs, logindex, feeds
+from django_scrapyd_manager.utils import bulk_upsert
+from django_scrapyd_manager.guardian import RestartTracker, GuardianScheduler, GuardianLogBuffer
 
-# Create your tests here.
+
+def create_spider(node: models.Node = None, project="demo", version="1", name="s1", **node_kwargs) -> models.Spider:
+    """创建 节点/项目/版本/爬虫, 版本不同步到 Scrapyd"""
+    node = node or models.Node.objects.create(name=node_kwargs.pop("node_name", "n1"), ip="127.0.0.1", **node_kwargs)
+    project, _ = models.Project.objects.get_or_create(node=node, name=project)
+    version, _ = models.ProjectVersion.objects.get_or_create(project=project, version=version, defaults={"sync_mode": models.SyncMode.NONE})
+    registry, _ = models.SpiderRegistry.objects.get_or_create(name=name)
+    return models.Spider.objects.create(registry=registry, version=version, name=name)
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN 的输出格式只针对 SQLite")
+class QueryIndexTest(TestCase):
+    """确认常用查询能用上对应的组合索引"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index_name}", plan, plan)
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan, plan)
+
+    def test_job_admin_default_list(self):
+        queryset = models.Job.objects.filter(status=models.JobStatus.RUNNING).order_by("-status", "-start_time")
+        self.assertUsesIndex(queryset, "job_status_start_idx")
+
+    def test_job_admin_node_filter(self):
+        queryset = models.Job.objects.filter(node_id=1, status=models.JobStatus.RUNNING).order_by("-status", "-start_time")
+        self.assertUsesIndex(queryset, "job_node_status_idx")
+
+    def test_sync_jobs_delete_pending(self):
+        queryset = models.Job.objects.filter(node_id=1, status=models.JobStatus.PENDING)
+        self.assertIn("USING INDEX job_node_status_idx", queryset.explain())
+
+    def test_job_admin_project_filter(self):
+        queryset = models.Job.objects.filter(
+            project__name="demo", status=models.JobStatus.RUNNING,
+        ).order_by("-status", "-start_time")
+        # 没有统计信息时 SQLite 可能选择 (project, status) 或 (status, start_time), 只要求不全表扫描
+        plan = queryset.explain()
+        self.assertIn("SEARCH scrapy_job USING INDEX", plan, plan)
+
+    def test_job_info_logs(self):
+        queryset = models.JobInfoLog.objects.filter(job_id=1).order_by("-create_time")
+        self.assertUsesIndex(queryset, "job_info_log_job_idx")
+
+    def test_guardian_logs(self):
+        queryset = models.GuardianLog.objects.filter(guardian_id=1).order_by("-create_time")
+        self.assertUsesIndex(queryset, "guardian_log_guardian_idx")
+
+
+class RestartTrackerTest(SimpleTestCase):
+    spider = SimpleNamespace(fp="fp-1", name="s1")
+
+    def guardian(self, strategy, **kwargs):
+        kwargs = {"backoff_base": 10, "backoff_max": 40, "restart_budget": 3, "budget_window": 100, **kwargs}
+        return models.Guardian(id=1, strategy=strategy, **kwargs)
+
+    def test_backoff(self):
+        guardian, tracker = self.guardian(models.GuardianStrategy.RESTART_BACKOFF), RestartTracker()
+        tracker.attach(guardian)
+        now = 1000
+        for delay in (10, 20, 40, 40):
+            self.assertIsNone(tracker.check(guardian, self.spider, now))
+            tracker.record_restart(guardian, self.spider, now)
+            self.assertEqual(tracker.check(guardian, self.spider, now + delay - 1), "backoff")
+            now += delay
+        # 刚被看到存活不清零, 连续存活 backoff_base 秒后才清零
+        tracker.record_alive(guardian, self.spider, now)
+        tracker.record_alive(guardian, self.spider, now + 9)
+        tracker.record_restart(guardian, self.spider, now + 10)
+        self.assertEqual(tracker.check(guardian, self.spider, now + 49), "backoff")
+        now += 50
+        tracker.record_alive(guardian, self.spider, now)
+        tracker.record_alive(guardian, self.spider, now + 10)
+        self.assertIsNone(tracker.check(guardian, self.spider, now + 10))
+
+    def test_backoff_does_not_keep_restart_history(self):
+        guardian, tracker = self.guardian(models.GuardianStrategy.RESTART_BACKOFF), RestartTracker()
+        tracker.attach(guardian)
+        for i in range(100):
+            tracker.record_restart(guardian, self.spider, 1000 + i * 100)
+        self.assertEqual(tracker.persist([guardian], force=True)[0].restart_state["fp-1"]["restarts"], [])
+
+    def test_budget_quarantine(self):
+        guardian, tracker = self.guardian(models.GuardianStrategy.RESTART_BUDGET, backoff_max=0), RestartTracker()
+        tracker.attach(guardian)
+        for now in (1000, 1010, 1020):
+            self.assertIsNone(tracker.check(guardian, self.spider, now))
+            tracker.record_restart(guardian, self.spider, now)
+        self.assertEqual(tracker.check(guardian, self.spider, 1030), "quarantine")
+        self.assertEqual(tracker.check(guardian, self.spider, 1040), "quarantined")
+        self.assertTrue(tracker.is_quarantined(guardian))
+        changed = tracker.persist([guardian])
+        self.assertEqual(changed, [guardian])
+        self.assertTrue(guardian.quarantined)
+        self.assertEqual(guardian.quarantined_spiders, ["s1"])
+
+    def test_budget_prunes_on_append(self):
+        guardian, tracker = self.guardian(models.GuardianStrategy.RESTART_BUDGET, backoff_max=0), RestartTracker()
+        tracker.attach(guardian)
+        for now in range(1000, 2000, 60):
+            self.assertIsNone(tracker.check(guardian, self.spider, now))
+            tracker.record_restart(guardian, self.spider, now)
+        restarts = tracker.persist([guardian], force=True)[0].restart_state["fp-1"]["restarts"]
+        self.assertEqual(restarts, [1900, 1960])
+
+    def test_release_from_admin_resets_state(self):
+        guardian = self.guardian(models.GuardianStrategy.RESTART_BUDGET, quarantined=True, restart_state={"fp-1": {"name": "s1", "failures": 3, "next_time": 0, "restarts": [], "quarantined": True}})
+        tracker = RestartTracker()
+        tracker.attach(guardian)
+        self.assertEqual(tracker.check(guardian, self.spider, 1000), "quarantined")
+        guardian.quarantined, guardian.restart_state = False, {}
+        tracker.attach(guardian)
+        self.assertIsNone(tracker.check(guardian, self.spider, 1000))
+
+
+class GuardianCrashLoopTest(TestCase):
+
+    def setUp(self):
+        spider = create_spider()
+        group = models.SpiderGroup.objects.create(name="g", node=spider.version.project.node, project=spider.version.project, version=spider.version)
+        group.spiders.add(spider.registry)
+        self.guardian = models.Guardian.objects.create(spider_group=group, strategy=models.GuardianStrategy.RESTART_BACKOFF, backoff_base=30)
+        self.now, self.started = 0, []
+
+    def missing_spiders(self, spiders, nodes):
+        # 每次重启后 15 秒内崩溃
+        alive = self.started and self.now - self.started[-1] < 15
+        return [] if alive else list(spiders)
+
+    def start_spider_group(self, group, node):
+        self.started.append(self.now)
+
+    def test_backoff_grows_for_crash_loop(self):
+        scheduler = GuardianScheduler()
+        with mock.patch("django_scrapyd_manager.guardian.node_has_project", return_value=True), \
+                mock.patch("django_scrapyd_manager.guardian.missing_spiders_jobs_on_nodes", side_effect=self.missing_spiders), \
+                mock.patch.object(scrapyd_api, "start_spider_group", side_effect=self.start_spider_group), \
+                mock.patch("django_scrapyd_manager.guardian.time.time", side_effect=lambda: self.now):
+            for self.now in range(0, 1000, 10):
+                scheduler.guard_object(self.guardian)
+        self.assertEqual([b - a for a, b in zip(self.started, self.started[1:])], [30, 60, 120, 240, 480])
+
+
+class NodePlacerTest(SimpleTestCase):
+
+    def place(self, nodes, status, count):
+        def daemon_status(node):
+            if isinstance(status[node.id], Exception):
+                raise status[node.id]
+            return status[node.id]
+        with mock.patch.object(scrapyd_api, "daemon_status", side_effect=daemon_status) as patched:
+            placer = scrapyd_api.NodePlacer(nodes)
+            chosen = [placer.choose().name for _ in range(count)]
+        # 负载每轮只请求一次
+        self.assertEqual(patched.call_count, len(nodes))
+        return chosen
+
+    def test_most_free_slots_first(self):
+        nodes = [models.Node(id=1, name="a", max_slots=4), models.Node(id=2, name="b", max_slots=6)]
+        status = {1: {"running": 1, "pending": 0}, 2: {"running": 2, "pending": 1}}
+        # 剩余槽位 a=3, b=3 时负载低的 a 优先, 之后按分配累加
+        self.assertEqual(self.place(nodes, status, 4), ["a", "b", "a", "b"])
+
+    def test_unlimited_node_by_lowest_load(self):
+        nodes = [models.Node(id=1, name="a", max_slots=0), models.Node(id=2, name="b", max_slots=0)]
+        status = {1: {"running": 3, "pending": 0}, 2: {"running": 1, "pending": 0}}
+        self.assertEqual(self.place(nodes, status, 3), ["b", "b", "a"])
+
+    def test_skip_unreachable_and_full(self):
+        nodes = [models.Node(id=1, name="a", max_slots=2), models.Node(id=2, name="b", max_slots=1)]
+        status = {1: ConnectionError("down"), 2: {"running": 0, "pending": 0}}
+        with self.assertLogs(scrapyd_api.logger, "WARNING"):
+            with self.assertRaises(scrapyd_api.NoAvailableNodeError):
+                self.place(nodes, status, 2)
+            self.assertEqual(self.place(nodes, status, 1), ["b"])
+
+    def test_placement_nodes(self):
+        node = models.Node(id=1, name="a")
+        group = models.SpiderGroup(node=node, placement=models.PlacementMode.FIXED)
+        self.assertEqual(group.placement_nodes, [node])
+
+
+class DispatchQueueTest(TestCase):
+
+    def setUp(self):
+        self.spider = create_spider(max_pending=4)
+        self.node = self.spider.version.project.node
+
+    def enqueue(self, priority):
+        return scrapyd_api.enqueue_spider(self.spider, priority=priority)
+
+    def test_dispatch_by_priority_within_capacity(self):
+        low, high, middle = self.enqueue(0), self.enqueue(10), self.enqueue(5)
+        with mock.patch.object(scrapyd_api, "daemon_status", return_value={"pending": 2}), \
+                mock.patch.object(scrapyd_api, "start_spider", side_effect=["job-1", "job-2"]) as start_spider:
+            self.assertEqual(dispatcher.DispatchScheduler().dispatch_node(self.node), 2)
+        self.assertEqual(start_spider.call_count, 2)
+        for request, status, job_id in ((high, "dispatched", "job-1"), (middle, "dispatched", "job-2"), (low, "queued", None)):
+            request.refresh_from_db()
+            self.assertEqual((request.status, request.job_id), (status, job_id))
+
+    def test_full_node_dispatches_nothing(self):
+        self.enqueue(0)
+        with mock.patch.object(scrapyd_api, "daemon_status", return_value={"pending": 4}), \
+                mock.patch.object(scrapyd_api, "start_spider") as start_spider:
+            self.assertEqual(dispatcher.DispatchScheduler().dispatch_node(self.node), 0)
+        start_spider.assert_not_called()
+
+    @override_settings(SCRAPYD_MANAGER={"DISPATCH_MAX_ATTEMPTS": 2})
+    def test_failed_after_max_attempts(self):
+        request = self.enqueue(0)
+        with mock.patch.object(scrapyd_api, "start_spider", side_effect=ConnectionError("down")):
+            self.assertFalse(dispatcher.dispatch_request(request))
+            self.assertEqual(request.status, models.DispatchStatus.QUEUED)
+            self.assertFalse(dispatcher.dispatch_request(request))
+        request.refresh_from_db()
+        self.assertEqual((request.status, request.attempts), (models.DispatchStatus.FAILED, 2))
+        self.assertIn("ConnectionError", request.message)
+
+    @override_settings(SCRAPYD_MANAGER={"DISPATCH_RETRY_DELAY": 60})
+    def test_failed_request_backs_off(self):
+        request = self.enqueue(0)
+        with mock.patch.object(scrapyd_api, "daemon_status", return_value={"pending": 0}), \
+                mock.patch.object(scrapyd_api, "start_spider", side_effect=[ConnectionError("down"), "job-1"]) as start_spider:
+            scheduler = dispatcher.DispatchScheduler()
+            scheduler.schedule(timezone.now())
+            request.refresh_from_db()
+            self.assertEqual(request.status, models.DispatchStatus.QUEUED)
+            self.assertAlmostEqual((request.next_attempt_time - timezone.now()).total_seconds(), 60, delta=5)
+            scheduler.schedule(timezone.now())
+            self.assertEqual(start_spider.call_count, 1)
+            models.DispatchRequest.objects.filter(pk=request.pk).update(next_attempt_time=timezone.now() - timedelta(seconds=1))
+            with self.assertLogs("django_sched", "INFO"):
+                scheduler.schedule(timezone.now())
+        request.refresh_from_db()
+        self.assertEqual((request.status, request.attempts, request.job_id), (models.DispatchStatus.DISPATCHED, 2, "job-1"))
+
+    def test_request_is_dispatched_once(self):
+        request = self.enqueue(0)
+        first, second = models.DispatchRequest.objects.get(pk=request.pk), models.DispatchRequest.objects.get(pk=request.pk)
+        with mock.patch.object(scrapyd_api, "start_spider", return_value="job-1") as start_spider:
+            self.assertTrue(dispatcher.dispatch_request(first))
+            self.assertFalse(dispatcher.dispatch_request(second))
+        start_spider.assert_called_once()
+        request.refresh_from_db()
+        self.assertEqual((request.status, request.attempts), (models.DispatchStatus.DISPATCHED, 1))
+
+    def test_scheduler_requires_lease(self):
+        self.enqueue(0)
+        models.SchedulerLease.objects.create(name="dispatch", owner="other", token=1, expire_time=timezone.now() + timedelta(minutes=1))
+        with mock.patch.object(scrapyd_api, "daemon_status", return_value={"pending": 0}), \
+                mock.patch.object(scrapyd_api, "start_spider") as start_spider:
+            dispatcher.DispatchScheduler().schedule(timezone.now())
+        start_spider.assert_not_called()
+
+    def test_stale_dispatching_is_failed(self):
+        request = self.enqueue(0)
+        models.DispatchRequest.objects.filter(pk=request.pk).update(
+            status=models.DispatchStatus.DISPATCHING, update_time=timezone.now() - timedelta(minutes=10),
+        )
+        self.assertEqual(dispatcher.fail_stale_dispatching(300), 1)
+        request.refresh_from_db()
+        self.assertEqual(request.status, models.DispatchStatus.FAILED)
+
+
+class DatabaseLeaseTest(TestCase):
+    lease_class = lease.DatabaseLease
+
+    def expire(self, name):
+        models.SchedulerLease.objects.filter(name=name).update(expire_time=timezone.now() - timedelta(seconds=1))
+
+    def test_single_holder_and_renewal(self):
+        a, b = self.lease_class("l", ttl=30, owner="a"), self.lease_class("l", ttl=30, owner="b")
+        token = a.acquire()
+        self.assertIsNotNone(token)
+        self.assertTrue(a.is_held())
+        self.assertIsNone(b.acquire())
+        self.assertEqual(a.acquire(), token)
+
+    def test_takeover_after_expiry_bumps_token(self):
+        a, b = self.lease_class("l", ttl=30, owner="a"), self.lease_class("l", ttl=30, owner="b")
+        token = a.acquire()
+        self.expire("l")
+        self.assertEqual(b.acquire(), token + 1)
+        # 旧持有者不能再续期
+        self.assertIsNone(a.acquire())
+        self.assertFalse(a.is_held())
+
+    def test_release(self):
+        a, b = self.lease_class("l", ttl=30, owner="a"), self.lease_class("l", ttl=30, owner="b")
+        token = a.acquire()
+        a.release()
+        self.assertEqual(b.acquire(), token + 1)
+
+    def test_fence_guardian_rejects_stale_token(self):
+        guardian = models.Guardian.objects.create()
+        self.assertTrue(lease.fence_guardian(guardian, 2, "a"))
+        self.assertFalse(lease.fence_guardian(guardian, 1, "a"))
+        self.assertTrue(lease.fence_guardian(guardian, 2, "a"))
+        self.assertEqual(models.Guardian.objects.get(pk=guardian.pk).fencing_token, 2)
+        # 其他租约的令牌单独计数, 不与之前租约的令牌比较
+        self.assertTrue(lease.fence_guardian(guardian, 1, "b"))
+        self.assertFalse(lease.fence_guardian(guardian, 0, "b"))
+        guardian.refresh_from_db()
+        self.assertEqual((guardian.fencing_token, guardian.fencing_lease), (1, "b"))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "lease-test"}})
+class CacheLeaseTest(DatabaseLeaseTest):
+    lease_class = lease.CacheLease
+
+    def setUp(self):
+        cache.clear()
+
+    def expire(self, name):
+        cache.delete(f"scrapyd_manager:lease:{name}")
+
+    def test_renewal_does_not_steal_new_holder(self):
+        a, b = self.lease_class("l", ttl=30, owner="a"), self.lease_class("l", ttl=30, owner="b")
+        a.acquire()
+        self.expire("l")
+        token = b.acquire()
+        self.assertIsNone(a.acquire())
+        self.assertEqual(cache.get("scrapyd_manager:lease:l"), {"owner": "b", "token": token})
+        a.release()
+        self.assertEqual(b.acquire(), token)
+
+
+class ShardingTest(TestCase):
+
+    def setUp(self):
+        self.n1, self.n2, self.n3 = (models.Node.objects.create(name=name, ip="127.0.0.1") for name in ("n1", "n2", "n3"))
+        project = models.Project.objects.create(node=self.n2, name="demo")
+        self.fixed = models.SpiderGroup.objects.create(name="fixed", node=self.n1, project=project)
+        self.pool = models.SpiderGroup.objects.create(name="pool", node=self.n2, project=project, placement=models.PlacementMode.POOL)
+        self.pool.node_pool.set([self.n3])
+        models.Guardian.objects.create(spider_group=self.fixed)
+        self.guardian = models.Guardian.objects.create(spider_group=self.pool)
+
+    def test_pool_nodes_share_anchor(self):
+        self.assertEqual(sharding.placement_anchors(), {self.n1.id: self.n1.id, self.n2.id: self.n2.id, self.n3.id: self.n2.id})
+
+    def test_single_worker_holds_all_nodes(self):
+        keeper = sharding.ShardKeeper("test", ttl=30)
+        keeper.rebalance()
+        self.assertEqual(sorted(keeper.held_nodes()), sorted([self.n1.id, self.n2.id, self.n3.id]))
+        keeper.stop()
+
+    def test_guard_requires_every_placement_node(self):
+        scheduler = GuardianScheduler()
+        scheduler.shard_keeper = keeper = sharding.ShardKeeper("test", ttl=30)
+        keeper.rebalance()
+        keeper.leases.pop(self.n3.id).release()
+        self.assertFalse(scheduler.can_guard(self.guardian))
+        keeper.rebalance()
+        self.assertTrue(scheduler.can_guard(self.guardian))
+        self.guardian.refresh_from_db()
+        self.assertEqual(self.guardian.fencing_token, keeper.node_token(self.n2.id))
+        keeper.stop()
+
+    def test_guard_rejects_stale_node_token(self):
+        scheduler = GuardianScheduler()
+        scheduler.shard_keeper = keeper = sharding.ShardKeeper("test", ttl=30)
+        keeper.rebalance()
+        models.Guardian.objects.filter(pk=self.guardian.pk).update(
+            fencing_token=keeper.node_token(self.n2.id) + 1, fencing_lease=keeper.node_lease_name(self.n2.id),
+        )
+        self.assertFalse(scheduler.can_guard(self.guardian))
+        keeper.stop()
+
+    def test_group_moved_to_node_with_lower_token(self):
+        scheduler = GuardianScheduler()
+        scheduler.shard_keeper = keeper = sharding.ShardKeeper("test", ttl=30)
+        keeper.rebalance()
+        # 之前在 n2 上处理过很多次, 或者由 leader 模式的全局租约处理过
+        models.Guardian.objects.filter(pk=self.guardian.pk).update(
+            fencing_token=keeper.node_token(self.n1.id) + 5, fencing_lease=keeper.node_lease_name(self.n2.id),
+        )
+        self.pool.node, self.pool.placement = self.n1, models.PlacementMode.FIXED
+        self.pool.save()
+        guardian = models.Guardian.objects.select_related("spider_group").get(pk=self.guardian.pk)
+        for _ in range(2):
+            self.assertTrue(scheduler.can_guard(guardian))
+        guardian.refresh_from_db()
+        self.assertEqual((guardian.fencing_token, guardian.fencing_lease), (keeper.node_token(self.n1.id), keeper.node_lease_name(self.n1.id)))
+        keeper.stop()
+
+
+class GuardianLogCompactionTest(TestCase):
+
+    def setUp(self):
+        self.node = models.Node.objects.create(name="n1", ip="127.0.0.1")
+        self.guardian = models.Guardian.objects.create()
+        self.day = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - timedelta(days=10)
+
+    def log(self, create_time, **kwargs):
+        return models.GuardianLog(
+            guardian=self.guardian, node=self.node, group_id=1, spider_name="s1", action=models.GuardianAction.START_SPIDER,
+            reason="没有运行", create_time=create_time, **kwargs,
+        )
+
+    def test_buffer_splits_repeats_at_day_boundary(self):
+        buffer = GuardianLogBuffer()
+        first = buffer.add(self.log(self.day))
+        self.assertIs(buffer.add(self.log(self.day + timedelta(hours=1))), first)
+        buffer.flush()
+        second = buffer.add(self.log(self.day + timedelta(days=1)))
+        self.assertIsNot(second, first)
+        buffer.flush()
+        self.assertEqual(
+            list(models.GuardianLog.objects.order_by("id").values_list("repeat_count", flat=True)), [2, 1],
+        )
+
+    def test_compact_keeps_rows_still_repeating(self):
+        self.log(self.day, last_time=self.day).save()
+        active = self.log(self.day, last_time=self.day + timedelta(days=9), repeat_count=5)
+        active.save()
+        self.assertEqual(retention.compact_guardian_logs(self.day + timedelta(days=1)), 1)
+        self.assertEqual(list(models.GuardianLog.objects.values_list("id", flat=True)), [active.id])
+        daily = models.GuardianLogDaily.objects.get()
+        self.assertEqual((daily.date, daily.count), (self.day.date(), 1))
+
+
+class SignalOutboxTest(TestCase):
+
+    def setUp(self):
+        self.signal = Signal()
+        self.received = []
+        self.signal.connect(self.receiver, weak=False)
+        self.outbox = outbox.SignalOutbox(max_size=2, retry_delay=0)
+
+    def receiver(self, signal, sender, **payload):
+        self.received.append(payload)
+
+    def deliver_all(self):
+        while not self.outbox.queue.empty():
+            self.outbox.deliver(self.outbox.queue.get_nowait())
+
+    def test_payload_is_serialized_at_enqueue(self):
+        guardian = models.Guardian.objects.create(description="before")
+        self.outbox.send(self.signal, None, model=guardian, objects=models.Guardian.objects.all(), result={"g": {"logs": [guardian]}})
+        guardian.description = "after"
+        models.Guardian.objects.create()
+        self.deliver_all()
+        payload = self.received[0]
+        self.assertEqual(payload["model"]["description"], "before")
+        self.assertEqual([row["id"] for row in payload["objects"]], [guardian.id])
+        self.assertEqual(payload["result"]["g"]["logs"][0]["id"], guardian.id)
+
+    def test_drop_when_full(self):
+        self.assertTrue(self.outbox.send(self.signal, None))
+        self.assertTrue(self.outbox.send(self.signal, None))
+        with self.assertLogs(outbox.logger, "WARNING"):
+            self.assertFalse(self.outbox.send(self.signal, None))
+        self.assertEqual(self.outbox.dropped, 1)
+
+    def test_retry_only_failed_receiver(self):
+        calls = []
+
+        def flaky(signal, sender, **payload):
+            calls.append(payload)
+            if len(calls) == 1:
+                raise ValueError("boom")
+
+        self.signal.connect(flaky, weak=False)
+        self.outbox.send(self.signal, None, value=1)
+        self.deliver_all()
+        self.assertEqual((len(self.received), len(calls)), (1, 1))
+        _, _, message = self.outbox._retries[0]
+        self.outbox.deliver(message)
+        self.assertEqual((len(self.received), len(calls)), (1, 2))
+
+
+class WorkQueueTest(SimpleTestCase):
+
+    def test_dedupe_keeps_earliest_due(self):
+        work = reconcile.WorkQueue()
+        work.add("a", 60)
+        work.add("a")
+        work.add("a", 30)
+        self.assertEqual(len(work), 1)
+        self.assertEqual(work.pop(), ["a"])
+        self.assertEqual(work.pop(), [])
+
+    def test_pop_limit_and_delay(self):
+        work = reconcile.WorkQueue()
+        for key in "abc":
+            work.add(key)
+        work.add("d", 60)
+        self.assertEqual(work.pop(limit=2), ["a", "b"])
+        self.assertEqual(work.pop(), ["c"])
+        self.assertEqual(len(work), 1)
+
+
+class ReconcileControllerTest(TestCase):
+
+    def setUp(self):
+        self.spider = create_spider()
+        self.node = self.spider.version.project.node
+        group = models.SpiderGroup.objects.create(name="g", node=self.node, project=self.spider.version.project)
+        self.guardian = models.Guardian.objects.create(spider_group=group)
+        self.controller = reconcile.ReconcileController(resync_period=600, verify_delay=30)
+        self.status = {"running": 1, "pending": 0, "finished": 3}
+
+    def next_ids(self):
+        with mock.patch.object(scrapyd_api, "daemon_status", side_effect=lambda node: dict(self.status)):
+            return [obj.id for obj in self.controller.next_objects(models.Guardian.objects.all())]
+
+    def test_only_changed_guardians_are_checked(self):
+        self.assertEqual(self.next_ids(), [self.guardian.id])
+        self.controller.done(self.guardian, acted=False)
+        self.assertEqual(self.next_ids(), [])
+        self.status["finished"] = 4
+        self.assertEqual(self.next_ids(), [self.guardian.id])
+        self.controller.done(self.guardian, acted=False)
+        models.Guardian.objects.filter(pk=self.guardian.pk).update(backoff_base=5)
+        self.assertEqual(self.next_ids(), [self.guardian.id])
+
+    def test_retry_time_shortens_resync(self):
+        self.next_ids()
+        self.controller.done(self.guardian, acted=False, retry_at=0)
+        self.assertEqual(self.next_ids(), [self.guardian.id])
+
+    def test_skipped_guardian_is_requeued(self):
+        scheduler = GuardianScheduler()
+        scheduler.reconciler = self.controller
+        objects = self.next_ids()
+        self.assertEqual(len(self.controller.queue), 0)
+        with mock.patch.object(scheduler, "can_guard", return_value=False), \
+                mock.patch.object(scheduler, "guard_object") as guard_object, \
+                self.assertLogs("django_sched", "WARNING"):
+            scheduler._guard_objects(models.Guardian.objects.filter(id__in=objects))
+        guard_object.assert_not_called()
+        self.assertEqual(len(self.controller.queue), 1)
+        self.assertEqual(self.next_ids(), [])
+        with mock.patch("django_scrapyd_manager.reconcile.time.time", return_value=time.time() + 31):
+            self.assertEqual(self.next_ids(), [self.guardian.id])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "polling-test"}},
+    SCRAPYD_MANAGER={"ADAPTIVE_POLLING": True, "POLL_MIN_INTERVAL": 10, "POLL_MAX_INTERVAL": 40},
+)
+class NodePollStateTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.spider = create_spider()
+        self.node = self.spider.version.project.node
+        self.job = models.Job.objects.create(
+            node=self.node, project=self.spider.version.project, spider=self.spider.registry, job_id="job-1", job_md5="md5-1",
+            status=models.JobStatus.RUNNING, start_time=timezone.now(),
+        )
+
+    def state(self):
+        return polling.NodePollState.load(self.node)
+
+    def test_interval_backs_off_and_resets(self):
+        polling.record_jobs(self.node, [self.job])
+        self.assertEqual(self.state().interval, 10)
+        polling.record_jobs(self.node, [self.job])
+        polling.record_jobs(self.node, [self.job])
+        polling.record_jobs(self.node, [self.job])
+        self.assertEqual(self.state().interval, 40)
+        self.job.status = models.JobStatus.FINISHED
+        polling.record_jobs(self.node, [self.job])
+        self.assertEqual(self.state().interval, 10)
+        self.assertEqual(cache.get(self.state().key)["job_ids"], ["job-1"])
+
+    def test_refresh_during_sync_is_not_lost(self):
+        started = time.time()
+        polling.request_refresh(self.node)
+        polling.record_jobs(self.node, [self.job], started)
+        self.assertTrue(self.state().is_due())
+        polling.record_jobs(self.node, [self.job], time.time())
+        self.assertFalse(self.state().is_due())
+
+    def test_status_change_makes_jobs_due(self):
+        polling.record_jobs(self.node, [self.job], time.time() - 1)
+        polling.record_status(self.node, {"running": 1, "pending": 0, "finished": 0})
+        self.assertFalse(self.state().is_due())
+        polling.record_status(self.node, {"running": 0, "pending": 0, "finished": 1})
+        self.assertTrue(self.state().is_due())
+
+    def test_poll_jobs_reads_database_until_due(self):
+        polling.record_jobs(self.node, [self.job], time.time() - 1)
+        polling.record_status(self.node, {"running": 1, "pending": 0, "finished": 0})
+        with mock.patch.object(scrapyd_api.sync_jobs, "__wrapped__") as sync:
+            self.assertEqual(scrapyd_api.poll_jobs(self.node), [self.job])
+        sync.assert_not_called()
+
+    def test_read_only_status_does_not_write(self):
+        resp = mock.Mock(json=mock.Mock(return_value={"status": "ok", "running": 1, "pending": 0, "finished": 0}))
+        with mock.patch.object(scrapyd_api.requests, "get", return_value=resp):
+            scrapyd_api.daemon_status(self.node, record=False)
+            self.assertIsNone(self.state().status_signature)
+            scrapyd_api.daemon_status(self.node)
+            self.assertEqual(self.state().status_signature, (1, 0, 0))
+
+
+class EggFileMixin:
+    egg_content = b"egg-bytes"
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.spider = create_spider()
+        self.version = self.spider.version
+        self.version.egg_file.save("demo.egg", ContentFile(self.egg_content))
+
+
+class DeployTest(EggFileMixin, TestCase):
+
+    def test_egg_sha256_is_stored(self):
+        sha256 = hashlib.sha256(self.egg_content).hexdigest()
+        self.assertEqual(deploy.egg_sha256(self.version), sha256)
+        self.assertEqual(models.ProjectVersion.objects.get(pk=self.version.pk).egg_sha256, sha256)
+
+    def test_skip_node_with_same_egg(self):
+        node = models.Node.objects.create(name="n2", ip="127.0.0.2")
+        project = models.Project.objects.create(node=node, name="demo")
+        sha256 = deploy.egg_sha256(self.version)
+        models.ProjectVersion.objects.create(
+            project=project, version="1", sync_mode=models.SyncMode.NONE, scrapyd_exists=True, egg_sha256=sha256,
+        )
+        with mock.patch.object(scrapyd_api, "add_version") as add_version, mock.patch.object(deploy, "close_old_connections"):
+            self.assertEqual(deploy.deploy_to_node(self.version, node, sha256), deploy.DeployResult.SKIPPED)
+        add_version.assert_not_called()
+
+    def test_deploy_copies_version_to_other_node(self):
+        node = models.Node.objects.create(name="n2", ip="127.0.0.2")
+        sha256 = deploy.egg_sha256(self.version)
+        with mock.patch.object(scrapyd_api, "add_version"), \
+                mock.patch.object(scrapyd_api, "sync_project_version_spiders"), \
+                mock.patch.object(deploy, "close_old_connections"):
+            self.assertEqual(deploy.deploy_to_node(self.version, node, sha256), deploy.DeployResult.DEPLOYED)
+        copy = models.ProjectVersion.objects.get(project__node=node, version="1")
+        self.assertEqual((copy.egg_file.name, copy.egg_sha256, copy.scrapyd_exists), (self.version.egg_file.name, sha256, True))
+
+    def test_deploy_version_reports_each_node(self):
+        nodes = [models.Node.objects.create(name=f"n{i}", ip=f"127.0.0.{i}") for i in (2, 3)]
+        with mock.patch.object(deploy, "deploy_to_node", side_effect=[deploy.DeployResult.DEPLOYED, ConnectionError("down")]), \
+                self.assertLogs(deploy.logger, "ERROR"):
+            results = deploy.deploy_version(self.version, nodes=nodes, max_workers=1)
+        self.assertEqual(results, {"n2": deploy.DeployResult.DEPLOYED, "n3": f"{deploy.DeployResult.FAILED}: down"})
+
+
+def build_egg(files: dict[str, str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as egg:
+        for path, content in files.items():
+            egg.writestr(path, content)
+    return buffer.getvalue()
+
+
+class PoolPlacementTest(EggFileMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.home = self.version.project.node
+        self.target = models.Node.objects.create(name="n2", ip="127.0.0.2")
+        self.group = models.SpiderGroup.objects.create(
+            name="g", node=self.home, project=self.version.project, version=self.version, placement=models.PlacementMode.POOL,
+        )
+        self.group.spiders.add(self.spider.registry)
+        self.group.node_pool.set([self.target])
+
+    def test_egg_is_uploaded_before_scheduling_on_chosen_node(self):
+        calls = mock.Mock()
+        status = {self.home.id: {"running": 3, "pending": 0}, self.target.id: {"running": 0, "pending": 0}}
+        with mock.patch.object(scrapyd_api, "daemon_status", side_effect=lambda node: status[node.id]), \
+                mock.patch.object(scrapyd_api, "add_version", calls.add_version), \
+                mock.patch.object(scrapyd_api, "sync_project_version_spiders", calls.sync_spiders), \
+                mock.patch.object(scrapyd_api, "start_spider", calls.start_spider):
+            calls.start_spider.return_value = "job-1"
+            self.assertEqual(scrapyd_api.start_spider_group(self.group), ["job-1"])
+            self.assertEqual([name for name, _, _ in calls.mock_calls], ["add_version", "sync_spiders", "start_spider"])
+            target = calls.add_version.call_args.args[0]
+            self.assertEqual((target.project.node, target.version, target.egg_file.name), (self.target, "1", self.version.egg_file.name))
+            self.assertTrue(models.ProjectVersion.objects.get(pk=target.pk).scrapyd_exists)
+            self.assertEqual(calls.start_spider.call_args.kwargs["node"], self.target)
+            # 节点上已经有该版本时不再上传
+            calls.reset_mock()
+            scrapyd_api.start_spider_group(self.group)
+            self.assertEqual([name for name, _, _ in calls.mock_calls], ["start_spider"])
+            self.assertEqual(calls.start_spider.call_args.kwargs["node"], self.target)
+
+    def test_home_node_does_not_upload(self):
+        status = {self.home.id: {"running": 0, "pending": 0}, self.target.id: {"running": 3, "pending": 0}}
+        with mock.patch.object(scrapyd_api, "daemon_status", side_effect=lambda node: status[node.id]), \
+                mock.patch.object(scrapyd_api, "add_version") as add_version, \
+                mock.patch.object(scrapyd_api, "start_spider", return_value="job-1") as start_spider:
+            scrapyd_api.start_spider_group(self.group)
+        add_version.assert_not_called()
+        self.assertEqual(start_spider.call_args.kwargs["node"], self.home)
+
+
+class SpiderListTest(EggFileMixin, TestCase):
+    egg_content = build_egg({
+        "EGG-INFO/entry_points.txt": "[scrapy]\nsettings = demo.settings\n",
+        "demo/settings.py": "SPIDER_MODULES = ['demo.spiders']\n",
+        "demo/spiders/__init__.py": "",
+        "demo/spiders/a.py": "class A(Spider):\n    name = 'a'\n\nclass Helper:\n    name = 'not-a-spider'\n",
+        "demo/spiders/b.py": "class B(CrawlSpider):\n    name = 'b'\n    other = 1\n",
+        "demo/other.py": "class C(Spider):\n    name = 'c'\n",
+    })
+
+    def new_version(self, node_name, sha256=None, version="1"):
+        node = models.Node.objects.create(name=node_name, ip="127.0.0.2")
+        project = models.Project.objects.create(node=node, name="demo")
+        return models.ProjectVersion.objects.create(
+            project=project, version=version, sync_mode=models.SyncMode.NONE, scrapyd_exists=True, egg_sha256=sha256,
+        )
+
+    def mark_synced(self, sha256):
+        models.ProjectVersion.objects.filter(pk=self.version.pk).update(is_spider_synced=True, egg_sha256=sha256)
+
+    def test_reuse_by_sha256_across_projects(self):
+        self.mark_synced("x" * 64)
+        other = self.new_version("n2", sha256="x" * 64, version="2")
+        self.assertEqual(scrapyd_api.known_spider_names(other), ["s1"])
+
+    def test_reuse_same_version_unless_eggs_differ(self):
+        self.mark_synced("x" * 64)
+        self.assertEqual(scrapyd_api.known_spider_names(self.new_version("n2")), ["s1"])
+        self.assertIsNone(scrapyd_api.known_spider_names(self.new_version("n3", sha256="y" * 64)))
+
+    def test_sync_spiders_without_listspiders(self):
+        self.mark_synced("x" * 64)
+        other = self.new_version("n2", sha256="x" * 64)
+        with mock.patch.object(scrapyd_api, "list_spiders") as list_spiders:
+            self.assertTrue(scrapyd_api.sync_project_version_spiders(other))
+        list_spiders.assert_not_called()
+        self.assertEqual(list(other.spiders.values_list("name", flat=True)), ["s1"])
+
+    def test_extract_spider_names_from_egg(self):
+        self.assertEqual(eggs.extract_spider_names(self.version), ["a", "b"])
+
+    @override_settings(SCRAPYD_MANAGER={"SPIDER_LIST_FROM_EGG": True})
+    def test_sync_spiders_from_egg(self):
+        models.ProjectVersion.objects.filter(pk=self.version.pk).update(scrapyd_exists=True)
+        self.version.refresh_from_db()
+        self.version.spiders.all().delete()
+        with mock.patch.object(scrapyd_api, "list_spiders") as list_spiders:
+            scrapyd_api.sync_project_version_spiders(self.version)
+        list_spiders.assert_not_called()
+        self.assertEqual(sorted(self.version.spiders.values_list("name", flat=True)), ["a", "b"])
+
+
+class EggMetadataTest(EggFileMixin, TestCase):
+
+    def test_fill_from_upload(self):
+        version = models.ProjectVersion()
+        eggs.fill_egg_metadata(version, ContentFile(b"abc"))
+        self.assertEqual((version.egg_sha256, version.egg_size, version.egg_present), (hashlib.sha256(b"abc").hexdigest(), 3, True))
+
+    def test_scan_detects_replaced_and_missing_files(self):
+        eggs.fill_egg_metadata(self.version, ContentFile(self.egg_content))
+        self.assertEqual(eggs.scan_egg_files([self.version]), [])
+        storage, name = self.version.egg_file.storage, self.version.egg_file.name
+        storage.delete(name)
+        storage.save(name, ContentFile(b"replaced"))
+        self.assertEqual(eggs.scan_egg_files([self.version]), [self.version])
+        self.assertEqual((self.version.egg_size, self.version.egg_sha256), (len(b"replaced"), None))
+        storage.delete(name)
+        self.assertEqual(eggs.scan_egg_files([self.version]), [self.version])
+        self.assertEqual((self.version.egg_present, self.version.egg_size), (False, None))
+
+    @override_settings(SCRAPYD_MANAGER={"EGG_SCAN_BATCH_SIZE": 1})
+    def test_scheduler_walks_versions_with_cursor(self):
+        other = models.ProjectVersion.objects.create(project=self.version.project, version="2", sync_mode=models.SyncMode.NONE)
+        other.egg_file.save("other.egg", ContentFile(b"x"))
+        scheduler = eggs.EggScanScheduler()
+        with self.assertLogs(scheduler.logger, "INFO"):
+            scheduler.schedule(timezone.now())
+            self.assertEqual(scheduler.cursor, self.version.id)
+            scheduler.schedule(timezone.now())
+            self.assertEqual(scheduler.cursor, other.id)
+        for version in (self.version, other):
+            version.refresh_from_db()
+            self.assertEqual((version.egg_present, version.egg_size), (True, version.egg_file.size))
+
+
+class UndeployTest(TestCase):
+
+    def setUp(self):
+        self.spider = create_spider()
+        self.version = self.spider.version
+        self.project = self.version.project
+
+    def test_failed_version_delete_is_not_resurrected(self):
+        self.version.delete()
+        with mock.patch.object(scrapyd_api, "delete_version", side_effect=ConnectionError("down")), \
+                self.assertLogs(deploy.logger, "ERROR"):
+            deploy.undeploy_version(self.version)
+            deploy.undeploy_version(self.version)
+        self.assertFalse(models.ProjectVersion.objects.filter(pk=self.version.pk).exists())
+        deletion = models.RemoteDeletion.objects.get()
+        self.assertEqual((deletion.project, deletion.version, deletion.attempts, deletion.message), ("demo", "1", 2, "down"))
+
+    def test_failed_project_delete_is_not_resurrected(self):
+        self.project.delete()
+        with mock.patch.object(scrapyd_api, "delete_project", side_effect=ConnectionError("down")), \
+                self.assertLogs(deploy.logger, "ERROR"):
+            deploy.undeploy_project(self.project)
+        self.assertFalse(models.Project.objects.exists())
+        self.assertEqual(models.RemoteDeletion.objects.get().version, "")
+
+    def test_retry_deletes_and_skips_recreated(self):
+        node = self.project.node
+        models.RemoteDeletion.objects.create(node=node, project="gone", version="", attempts=1)
+        models.RemoteDeletion.objects.create(node=node, project="demo", version="1", attempts=1)
+        models.RemoteDeletion.objects.create(node=node, project="demo", version="old", attempts=10)
+        with mock.patch.object(scrapyd_api, "delete_project") as delete_project, \
+                mock.patch.object(scrapyd_api, "delete_version") as delete_version:
+            self.assertEqual(deploy.retry_remote_deletions(max_attempts=10), 1)
+        self.assertEqual(delete_project.call_args.args[0].name, "gone")
+        # demo/1 仍在数据库中, 不能删除远端
+        delete_version.assert_not_called()
+        self.assertEqual(list(models.RemoteDeletion.objects.values_list("version", flat=True)), ["old"])
+
+
+class VersionRetentionTest(TestCase):
+
+    def setUp(self):
+        self.spider = create_spider(version="3")
+        self.project = self.spider.version.project
+        self.versions = {"3": self.spider.version}
+        for version, days in (("1", 3), ("2", 2), ("4", 5)):
+            self.versions[version] = models.ProjectVersion.objects.create(
+                project=self.project, version=version, sync_mode=models.SyncMode.NONE,
+                create_time=timezone.now() - timedelta(days=days),
+            )
+        models.ProjectVersion.objects.filter(pk=self.versions["3"].pk).update(create_time=timezone.now() - timedelta(days=1))
+
+    def collectable(self, keep_last=1):
+        return sorted(version.version for version in retention.collectable_versions(keep_last))
+
+    def test_latest_version_by_number_is_pinned(self):
+        # 按创建时间 3 最新, 但 Project.latest_version 按版本号是 4
+        self.assertEqual(self.project.latest_version.version, "4")
+        self.assertEqual(self.collectable(), ["1", "2"])
+
+    def test_newest_egg_version_is_pinned(self):
+        models.ProjectVersion.objects.filter(pk=self.versions["1"].pk).update(egg_file="eggs/demo.egg", egg_present=True)
+        self.assertEqual(self.collectable(), ["2"])
+
+    def test_collect_detaches_finished_dispatch_requests(self):
+        spider = models.Spider.objects.create(registry=self.spider.registry, version=self.versions["1"], name="s1")
+        request = scrapyd_api.enqueue_spider(spider)
+        self.assertEqual(self.collectable(), ["2"])
+        models.DispatchRequest.objects.filter(pk=request.pk).update(status=models.DispatchStatus.DISPATCHED)
+        report = retention.collect_versions(1, dry_run=False)
+        self.assertEqual(len(report["versions"]), 2)
+        request.refresh_from_db()
+        self.assertEqual((request.spider_id, request.spider_name), (None, "s1"))
+
+    def test_dispatch_fails_when_spider_removed(self):
+        request = scrapyd_api.enqueue_spider(self.spider)
+        request.spider = None
+        self.assertFalse(dispatcher.dispatch_request(request))
+        self.assertEqual(request.status, models.DispatchStatus.FAILED)
+
+
+class BulkUpsertTest(TestCase):
+
+    def setUp(self):
+        self.node = models.Node.objects.create(name="n1", ip="127.0.0.1")
+        self.existing = models.Project.objects.create(node=self.node, name="a", sync_status=models.SyncStatus.PENDING)
+
+    def upsert(self):
+        bulk_upsert(models.Project, [
+            models.Project(node=self.node, name="a", sync_status=models.SyncStatus.SUCCESS),
+            models.Project(node=self.node, name="b", sync_status=models.SyncStatus.SUCCESS),
+        ], unique_fields=["node", "name"], update_fields=["sync_status"])
+        rows = dict(models.Project.objects.values_list("name", "sync_status"))
+        self.assertEqual(rows, {"a": models.SyncStatus.SUCCESS, "b": models.SyncStatus.SUCCESS})
+        self.assertEqual(models.Project.objects.get(name="a").pk, self.existing.pk)
+
+    def test_upsert_on_conflict(self):
+        self.upsert()
+
+    def test_upsert_fallback_without_conflict_support(self):
+        features = connection.features
+        with mock.patch.object(features, "supports_update_conflicts_with_target", False), \
+                mock.patch.object(features, "supports_update_conflicts", False):
+            self.upsert()
+
+    def test_save_project_versions_marks_missing(self):
+        models.ProjectVersion.objects.create(project=self.existing, version="old", sync_mode=models.SyncMode.NONE, scrapyd_exists=True)
+        scrapyd_api.save_project_versions({self.existing: ["1", "2"]})
+        rows = dict(self.existing.versions.values_list("version", "scrapyd_exists"))
+        self.assertEqual(rows, {"old": False, "1": True, "2": True})
+
+
+def create_job(spider: models.Spider, job_id: str, model=models.Job, node: models.Node = None, **kwargs) -> models.BaseJob:
+    return model.objects.create(
+        node=node or spider.version.project.node, project=spider.version.project, spider=spider.registry, job_id=job_id,
+        job_md5=job_id, start_time=timezone.now(), status=kwargs.pop("status", models.JobStatus.FINISHED), **kwargs,
+    )
+
+
+class ArchiveJobsTest(TestCase):
+
+    def setUp(self):
+        self.spider = create_spider()
+        old = timezone.now() - timedelta(days=40)
+        self.old = [create_job(self.spider, f"old-{i}", end_time=old) for i in range(5)]
+        # 没有结束时间的任务按开始时间判断
+        self.no_end = create_job(self.spider, "no-end")
+        models.Job.objects.filter(pk=self.no_end.pk).update(start_time=old)
+        self.recent = create_job(self.spider, "recent", end_time=timezone.now())
+        self.running = create_job(self.spider, "running", status=models.JobStatus.RUNNING)
+        models.Job.objects.filter(pk=self.running.pk).update(start_time=old)
+        self.expected = [job.id for job in self.old] + [self.no_end.id]
+        self.sample = models.JobInfoLog.objects.create(job_id=self.old[0].id, info={"items": 1})
+
+    def test_archive_in_batches(self):
+        with mock.patch.object(models.JobArchive.objects, "bulk_create", wraps=models.JobArchive.objects.bulk_create) as bulk_create:
+            self.assertEqual(retention.archive_jobs(timezone.now() - timedelta(days=30), batch_size=4), 6)
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [4, 2])
+        self.assertEqual(sorted(models.JobArchive.objects.values_list("id", flat=True)), sorted(self.expected))
+        self.assertEqual(sorted(models.Job.objects.values_list("id", flat=True)), sorted([self.recent.id, self.running.id]))
+        archived = models.JobArchive.objects.get(pk=self.old[0].pk)
+        self.assertEqual((archived.job_id, archived.node_id, archived.spider_id), ("old-0", self.old[0].node_id, self.old[0].spider_id))
+        self.assertEqual(models.JobInfoLog.objects.get(pk=self.sample.pk).job_id, archived.id)
+        self.assertEqual(retention.archive_jobs(timezone.now() - timedelta(days=30), batch_size=4), 0)
+
+    def test_export_dir(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        export_dir = os.path.join(directory.name, "jobs")
+        retention.archive_jobs(timezone.now() - timedelta(days=30), batch_size=4, export_dir=export_dir)
+        path = os.path.join(export_dir, f"jobs-{timezone.now():%Y%m%d}.jsonl.gz")
+        self.assertEqual(os.listdir(export_dir), [os.path.basename(path)])
+        # 每批追加一个 gzip member, 解压时自动拼接
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row["id"] for row in rows], sorted(self.expected))
+        self.assertEqual((rows[0]["job_id"], rows[0]["node_id"], rows[0]["spider_id"], rows[0]["status"]), ("old-0", self.old[0].node_id, self.old[0].spider_id, "finished"))
+
+    def test_failed_export_keeps_jobs(self):
+        with mock.patch.object(retention, "export_archived_jobs", side_effect=OSError("disk full")), self.assertRaises(OSError):
+            retention.archive_jobs(timezone.now() - timedelta(days=30), batch_size=4, export_dir="unused")
+        self.assertFalse(models.JobArchive.objects.exists())
+        self.assertEqual(models.Job.objects.count(), 8)
+
+
+class JobInfoLogAdminTest(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        self.spider = create_spider()
+        self.other_node = models.Node.objects.create(name="n2", ip="127.0.0.2")
+        self.hot = create_job(self.spider, "hot")
+        self.archived = create_job(self.spider, "archived", model=models.JobArchive, id=self.hot.id + 100)
+        self.other = create_job(self.spider, "other", node=self.other_node)
+        self.logs = {job.job_id: models.JobInfoLog.objects.create(job_id=job.id, info={"items": 1}) for job in (self.hot, self.archived, self.other)}
+
+    def changelist_ids(self, **params):
+        response = self.client.get(reverse("admin:django_scrapyd_manager_jobinfolog_changelist"), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(log.id for log in response.context["cl"].result_list)
+
+    def test_node_filter_includes_archived_jobs(self):
+        expected = sorted([self.logs["hot"].id, self.logs["archived"].id])
+        self.assertEqual(self.changelist_ids(node_id=self.spider.version.project.node_id), expected)
+        self.assertEqual(self.changelist_ids(node_id=self.other_node.id), [self.logs["other"].id])
+
+    def test_spider_and_project_filters(self):
+        self.assertEqual(len(self.changelist_ids(spider_id=self.spider.registry.id)), 3)
+        self.assertEqual(len(self.changelist_ids(project_id=self.spider.version.project_id)), 3)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "pagination-test"}})
+class KeysetPaginatorTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        models.SpiderRegistry.objects.bulk_create([models.SpiderRegistry(name=f"s{i:02d}") for i in range(25)])
+        self.queryset = models.SpiderRegistry.objects.order_by("-name", "-id")
+
+    def names(self, page):
+        return [registry.name for registry in page.object_list]
+
+    def test_seek_pages_match_offset_pages(self):
+        paginator = pagination.KeysetPaginator(self.queryset, 10)
+        self.assertEqual(paginator.keyset, [("name", True), ("id", True)])
+        expected = [self.names(pagination.Paginator(self.queryset, 10).page(n)) for n in (1, 2, 3)]
+        self.assertEqual([self.names(paginator.page(n)) for n in (1, 2, 3)], expected)
+        # 第 2、3 页使用上一页保存的游标
+        self.assertIsNotNone(cache.get(paginator._cursor_key(2)))
+        with mock.patch.object(paginator, "_seek", wraps=paginator._seek) as seek:
+            self.assertEqual(self.names(paginator.page(3)), expected[2])
+        seek.assert_called_once()
+
+    def test_non_unique_ordering_falls_back_to_offset(self):
+        paginator = pagination.KeysetPaginator(models.SpiderRegistry.objects.order_by("description", "id"), 10)
+        self.assertIsNone(paginator.keyset)
+        self.assertEqual(len(paginator.page(3).object_list), 5)
+
+    @override_settings(SCRAPYD_MANAGER={"ADMIN_ESTIMATE_COUNT_THRESHOLD": 0})
+    def test_low_estimate_uses_exact_count(self):
+        with mock.patch.object(pagination, "planner_estimate", return_value=5):
+            paginator = pagination.KeysetPaginator(models.SpiderRegistry.objects.order_by("name", "id"), 10)
+            self.assertEqual(paginator.count, 5)
+            page = paginator.page(3)
+        self.assertEqual((page.number, paginator.count, self.names(page)), (3, 25, [f"s{i}" for i in range(20, 25)]))
+        self.assertEqual(pagination.KeysetPaginator(self.queryset, 10).page(9).number, 3)
+
+    @override_settings(SCRAPYD_MANAGER={"ADMIN_ESTIMATE_COUNT_THRESHOLD": 0})
+    def test_high_estimate_clamps_to_last_page(self):
+        with mock.patch.object(pagination, "planner_estimate", return_value=1000):
+            paginator = pagination.KeysetPaginator(models.SpiderRegistry.objects.order_by("name", "id"), 10)
+            page = paginator.page(50)
+        self.assertEqual((page.number, paginator.num_pages, len(page.object_list)), (3, 3, 5))
+
+
+class JsonDeltaTest(SimpleTestCase):
+    base = {"items": 10, "stats": {"a": 1, "b": {"c": 2}, "gone": 1}, "flag": 1, "list": [1, 2], "drop": "x"}
+
+    def test_round_trip(self):
+        current = {"items": 12, "stats": {"a": 1, "b": {"c": 3, "d": None}}, "flag": True, "list": [1, 2, 3], "new": {"x": 1}}
+        patch = jsondelta.diff(self.base, current)
+        self.assertEqual(jsondelta.apply(self.base, patch), current)
+        # 值相等但类型不同(1 与 True)也要记录
+        self.assertIn("flag", patch["s"])
+        self.assertEqual(patch["d"], ["drop"])
+        self.assertEqual(patch["p"]["stats"], {"d": ["gone"], "p": {"b": {"s": {"c": 3, "d": None}}}})
+
+    def test_dict_replaced_by_scalar_and_back(self):
+        for base, current in (({"a": {"b": 1}}, {"a": 1}), ({"a": 1}, {"a": {"b": 1}}), ({}, {}), (self.base, self.base)):
+            self.assertEqual(jsondelta.apply(base, jsondelta.diff(base, current)), current)
+        self.assertEqual(jsondelta.diff(self.base, self.base), {})
+
+    def test_apply_does_not_modify_base(self):
+        base = {"stats": {"a": 1}}
+        jsondelta.apply(base, {"p": {"stats": {"s": {"a": 2}}}})
+        self.assertEqual(base, {"stats": {"a": 1}})
+
+    def test_compress_round_trip(self):
+        raw = jsondelta.dumps(self.base)
+        self.assertEqual(jsondelta.decompress(jsondelta.compress(raw, "zlib"), "zlib"), raw)
+        if jsondelta.zstd is not None:
+            self.assertEqual(jsondelta.decompress(jsondelta.compress(raw, "zstd"), "zstd"), raw)
+        with self.assertRaises(ValueError):
+            jsondelta.compress(raw, "gzip")
+
+
+class JobInfoSampleTest(TestCase):
+
+    def setUp(self):
+        self.job = create_job(create_spider(), "job-1", status=models.JobStatus.RUNNING)
+
+    def info(self, n):
+        return {"item_scraped_count": n, "stats": {f"key_{i}": i for i in range(20)}}
+
+    def legacy(self, n, minutes):
+        return models.JobInfoLog.objects.create(job=self.job, info=self.info(n), create_time=timezone.now() - timedelta(minutes=minutes))
+
+    @override_settings(SCRAPYD_MANAGER={"JOB_INFO_KEYFRAME_INTERVAL": 2})
+    def test_samples_restore_through_keyframes(self):
+        logs = [samples.save_job_info(self.job, self.info(n)) for n in range(5)]
+        self.assertEqual([log.base_id is None for log in logs], [True, False, False, True, False])
+        self.assertEqual(samples.load_infos(models.JobInfoLog.objects.all()), {log.id: self.info(n) for n, log in enumerate(logs)})
+        self.assertEqual(logs[4].get_info(), self.info(4))
+
+    def test_compact_keeps_newest_keyframe(self):
+        logs = [self.legacy(n, 10 - n) for n in range(4)]
+        self.assertEqual(samples.compact_job_info_logs(codec=models.JobInfoCodec.ZLIB), 4)
+        rows = {log.id: log for log in models.JobInfoLog.objects.all()}
+        self.assertIsNone(rows[logs[0].id].base_id)
+        self.assertEqual([rows[log.id].base_id for log in logs[1:3]], [logs[0].id, logs[0].id])
+        # 最新的关键帧可能是采样器内存中的基准, 只压缩不改写为差量
+        self.assertIsNone(rows[logs[3].id].base_id)
+        self.assertEqual(rows[logs[3].id].codec, models.JobInfoCodec.ZLIB)
+        self.assertEqual(samples.load_infos(rows.values()), {log.id: self.info(n) for n, log in enumerate(logs)})
+        self.assertEqual(samples.compact_job_info_logs(), 0)
+
+    def sample(self, seconds, base=None):
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=3)
+        return models.JobInfoLog.objects.create(job=self.job, base=base, info={}, create_time=start + timedelta(seconds=seconds))
+
+    def test_downsample_sweeps_keyframes_released_by_later_windows(self):
+        first = self.sample(0)
+        # 同一分钟内的第二个关键帧被下一分钟的差量引用, 第一轮降采样时不能删除
+        second = self.sample(10)
+        delta = self.sample(70, base=second)
+        third = self.sample(80)
+        newest = self.sample(200)
+        start = first.create_time
+        self.assertEqual(samples.downsample_job_info_logs(start + timedelta(seconds=60), 60), 0)
+        self.assertEqual(samples.downsample_job_info_logs(start + timedelta(seconds=120), 60, since=start + timedelta(seconds=60)), 2)
+        self.assertEqual(
+            set(models.JobInfoLog.objects.values_list("id", flat=True)), {first.id, third.id, newest.id},
+        )
+        self.assertFalse(models.JobInfoLog.objects.filter(id__in=[second.id, delta.id]).exists())
+        # 桶内唯一的关键帧在之后的清理中保留
+        extra = self.sample(250)
+        self.assertEqual(samples.downsample_job_info_logs(start + timedelta(seconds=300), 60, since=start + timedelta(seconds=120)), 0)
+        self.assertEqual(samples.downsample_job_info_logs(start + timedelta(seconds=360), 60, since=start + timedelta(seconds=300)), 0)
+        self.assertEqual(models.JobInfoLog.objects.count(), 4)
+        self.assertTrue(models.JobInfoLog.objects.filter(id=extra.id).exists())
+
+
+class FetchJobInfosTest(SimpleTestCase):
+
+    def setUp(self):
+        self.jobs = [SimpleNamespace(id=i, node_id=i % 2, job_id=f"job-{i}") for i in range(12)]
+        self.lock = threading.Lock()
+        self.active, self.peak = {0: 0, 1: 0}, {0: 0, 1: 0}
+        self.sessions = {0: set(), 1: set()}
+
+    def fetch_job_info(self, job, session=None):
+        with self.lock:
+            self.active[job.node_id] += 1
+            self.peak[job.node_id] = max(self.peak[job.node_id], self.active[job.node_id])
+            self.sessions[job.node_id].add(session)
+        time.sleep(0.01)
+        with self.lock:
+            self.active[job.node_id] -= 1
+        if job.node_id == 1 and job.id > 6:
+            raise ConnectionError("down")
+        return {"job": job.job_id}
+
+    def test_per_node_limit_and_partial_failure(self):
+        with mock.patch.object(scrapyd_api, "fetch_job_info", side_effect=self.fetch_job_info) as fetch, \
+                self.assertLogs("django_scrapyd_manager.samples", "WARNING") as captured:
+            infos = samples.fetch_job_infos(self.jobs, per_node=2, max_workers=8)
+        self.assertEqual(fetch.call_count, 12)
+        self.assertLessEqual(max(self.peak.values()), 2)
+        # 同一节点的请求复用一个 Session
+        self.assertEqual([len(sessions) for sessions in self.sessions.values()], [1, 1])
+        self.assertIsNot(*[session for sessions in self.sessions.values() for session in sessions])
+        failed = {job.id for job in self.jobs if job.node_id == 1 and job.id > 6}
+        self.assertEqual(set(infos), {job.id for job in self.jobs} - failed)
+        self.assertEqual(infos[0], {"job": "job-0"})
+        self.assertEqual(len(captured.records), len(failed))
+
+    def test_empty(self):
+        self.assertEqual(samples.fetch_job_infos([]), {})
+
+
+class JobSampleSchedulerTest(TestCase):
+
+    def setUp(self):
+        spider = create_spider()
+        self.jobs = [create_job(spider, f"job-{i}", status=models.JobStatus.RUNNING) for i in range(2)]
+        create_job(spider, "finished")
+        self.infos = {job.job_id: {"item_scraped_count": 0, "stats": {f"key_{i}": i for i in range(20)}} for job in self.jobs}
+
+    def fetch_job_info(self, job, session=None):
+        if job.job_id not in self.infos:
+            raise ConnectionError("down")
+        return dict(self.infos[job.job_id])
+
+    def schedule(self, scheduler, now):
+        with mock.patch.object(scrapyd_api, "fetch_job_info", side_effect=self.fetch_job_info), \
+                self.assertLogs("django_sched", "INFO"):
+            scheduler.schedule(now)
+
+    def test_samples_running_jobs(self):
+        scheduler = samples.JobSampleScheduler()
+        self.infos.pop("job-1")
+        with self.assertLogs("django_scrapyd_manager.samples", "WARNING"):
+            self.schedule(scheduler, timezone.now())
+        keyframe = models.JobInfoLog.objects.get()
+        self.assertEqual((keyframe.job_id, keyframe.base_id), (self.jobs[0].id, None))
+        self.infos["job-0"]["item_scraped_count"] = 10
+        self.infos["job-1"] = {"item_scraped_count": 1}
+        self.schedule(scheduler, timezone.now())
+        logs = models.JobInfoLog.objects.exclude(pk=keyframe.pk)
+        self.assertEqual({(log.job_id, log.base_id) for log in logs}, {
+            (self.jobs[0].id, keyframe.id), (self.jobs[1].id, None),
+        })
+        delta = logs.get(job_id=self.jobs[0].id)
+        self.assertEqual(samples.load_infos([keyframe, delta])[delta.id], self.infos["job-0"])
+        # 结束的任务不再采样, 也不再占用关键帧缓存
+        models.Job.objects.filter(pk=self.jobs[0].pk).update(status=models.JobStatus.FINISHED)
+        self.schedule(scheduler, timezone.now())
+        self.assertEqual(set(scheduler.keyframes), {self.jobs[1].id})
+        self.assertEqual(models.JobInfoLog.objects.count(), 4)
+
+    def test_requires_lease(self):
+        models.SchedulerLease.objects.create(name="job-sampler", owner="other", token=1, expire_time=timezone.now() + timedelta(minutes=1))
+        with mock.patch.object(scrapyd_api, "fetch_job_info") as fetch:
+            samples.JobSampleScheduler().schedule(timezone.now())
+        fetch.assert_not_called()
+        self.assertFalse(models.JobInfoLog.objects.exists())
+
+
+class ThroughputRollupTest(TestCase):
+
+    def setUp(self):
+        self.spider = create_spider()
+        self.jobs = [create_job(self.spider, f"job-{i}", status=models.JobStatus.RUNNING) for i in range(2)]
+
+    def sample(self, log_id, job, items):
+        return models.JobInfoLog.objects.create(id=log_id, job=job, info={"item_scraped_count": items})
+
+    def items(self):
+        return sum(models.ThroughputRollup.objects.filter(resolution=60).values_list("items", flat=True))
+
+    def test_late_committed_samples(self):
+        self.sample(1, self.jobs[0], 10)
+        self.sample(4, self.jobs[0], 40)
+        self.assertEqual(rollups.rollup_job_samples(), 2)
+        cursor = models.RollupCursor.objects.get(name="throughput")
+        self.assertEqual((cursor.position, set(cursor.gaps)), (4, {"2", "3"}))
+        self.assertEqual(self.items(), 40)
+        # 同一任务迟到的采样已经包含在之后采样的差值中, 其他任务的迟到采样正常汇总
+        self.sample(2, self.jobs[0], 20)
+        self.sample(3, self.jobs[1], 5)
+        self.assertEqual(rollups.rollup_job_samples({}), 2)
+        self.assertEqual(self.items(), 45)
+        cursor.refresh_from_db()
+        self.assertEqual((cursor.position, cursor.gaps), (4, {}))
+        self.assertEqual(rollups.rollup_job_samples(), 0)
+        self.assertEqual(self.items(), 45)
+
+    def test_gaps_expire(self):
+        self.sample(1, self.jobs[0], 10)
+        self.sample(3, self.jobs[0], 30)
+        previous = {}
+        rollups.rollup_job_samples(previous)
+        self.assertEqual(previous[self.jobs[0].id], (3, {"items": 30, "requests": 0, "errors": 0}))
+        models.RollupCursor.objects.filter(name="throughput").update(gaps={"2": time.time() - 3600})
+        self.assertEqual(rollups.rollup_job_samples(previous), 0)
+        self.assertEqual(models.RollupCursor.objects.get(name="throughput").gaps, {})
+        self.sample(2, self.jobs[0], 20)
+        self.assertEqual(rollups.rollup_job_samples(previous), 0)
+        self.assertEqual(self.items(), 30)
+
+
+class FakeResponse:
+    """模拟 requests 的流式响应"""
+
+    def __init__(self, content: bytes, status_code: int = 200, headers: dict = None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {"Content-Length": str(len(content))}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class RemoteFile:
+    """按 Range 语义返回 content 的 request_job_file, ignore_range 为 True 时模拟不支持 Range 的服务端"""
+
+    def __init__(self, content: bytes, ignore_range: bool = False):
+        self.content = content
+        self.ignore_range = ignore_range
+        self.calls = []
+
+    def __call__(self, job, path, start=None, suffix=None):
+        self.calls.append((start, suffix))
+        size = len(self.content)
+        if self.ignore_range or (start is None and suffix is None):
+            return FakeResponse(self.content)
+        if suffix is not None:
+            start = max(0, size - suffix)
+        if start >= size:
+            return FakeResponse(b"", 416, {"Content-Range": f"bytes */{size}"})
+        return FakeResponse(self.content[start:], 206, {"Content-Range": f"bytes {start}-{size - 1}/{size}"})
+
+
+class LogFetchTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(SCRAPYD_MANAGER={"LOG_CACHE_DIR": directory.name, "LOG_TAIL_BYTES": 10}))
+        self.job = create_job(create_spider(), "job-1", status=models.JobStatus.RUNNING, log_url="/logs/demo/s1/job-1.log")
+        self.remote = RemoteFile(b"0123456789abcdefghij")
+        self.enterContext(mock.patch.object(scrapyd_api, "request_job_file", side_effect=self.remote))
+
+    def cached(self, state):
+        return b"".join(logs.iter_cached(state, state.start))
+
+    def test_tail_then_incremental(self):
+        state, new_start = logs.fetch_new_bytes(self.job)
+        self.assertEqual((new_start, state.start, state.offset, state.remote_size), (10, 10, 20, 20))
+        self.assertEqual(self.cached(state), b"abcdefghij")
+        self.remote.content += b"KLM"
+        state, new_start = logs.fetch_new_bytes(self.job)
+        self.assertEqual((new_start, state.offset), (20, 23))
+        self.assertEqual(self.remote.calls[-1], (20, None))
+        state, new_start = logs.fetch_new_bytes(self.job)
+        self.assertEqual((new_start, state.offset), (23, 23))
+        # 远端日志被重新生成后从头拉取
+        self.remote.content = b"xyz"
+        state, new_start = logs.fetch_new_bytes(self.job)
+        self.assertEqual((new_start, state.start, state.offset), (0, 0, 3))
+        self.assertEqual(self.cached(models.JobLogState.objects.get(pk=state.pk)), b"xyz")
+
+    def test_server_ignoring_range(self):
+        logs.fetch_new_bytes(self.job)
+        self.remote.content += b"KLM"
+        self.remote.ignore_range = True
+        state, new_start = logs.fetch_new_bytes(self.job)
+        self.assertEqual((new_start, state.offset), (20, 23))
+        self.assertEqual(self.cached(state), b"abcdefghijKLM")
+
+    def test_concurrent_fetch_keeps_first_commit(self):
+        logs.fetch_new_bytes(self.job)
+        self.remote.content += b"KLM"
+        remote = self.remote
+
+        def slow_download(*args, **kwargs):
+            # 下载期间另一个请求已经拉取并提交了同样的数据
+            scrapyd_api.request_job_file.side_effect = remote
+            remote.content += b"NO"
+            logs.fetch_new_bytes(self.job)
+            return remote(*args, **kwargs)
+
+        scrapyd_api.request_job_file.side_effect = slow_download
+        state, new_start = logs.fetch_new_bytes(self.job)
+        self.assertEqual((new_start, state.offset), (20, 25))
+        self.assertEqual(self.cached(state), b"abcdefghijKLMNO")
+
+    def test_rotation_resets_error_counts(self):
+        self.remote.content = ERROR_LOG
+        with override_settings(SCRAPYD_MANAGER={"LOG_CACHE_DIR": logs.cache_dir(), "LOG_TAIL_BYTES": len(ERROR_LOG)}):
+            logs.fetch_new_bytes(self.job)
+        counts = lambda: {(signature.level, signature.count, signature.job_count) for signature in models.LogErrorSignature.objects.all()}
+        self.assertEqual(counts(), {("ERROR", 2, 1), ("CRITICAL", 1, 1)})
+        # 日志轮转后只剩一条 ERROR, 之前累加的次数不再保留
+        self.remote.content = ERROR_LOG[ERROR_LOG.index(b"2025-01-01 00:00:03"):ERROR_LOG.index(b"2025-01-01 00:00:04")] + b"2025-01-01 00:00:04 [scrapy.core.engine] INFO: Crawled 1 pages\n"
+        state, new_start = logs.fetch_new_bytes(self.job)
+        self.assertEqual((new_start, state.start, state.offset), (0, 0, len(self.remote.content)))
+        self.assertEqual(counts(), {("ERROR", 1, 1), ("CRITICAL", 0, 0)})
+        self.assertEqual(models.LogErrorOccurrence.objects.get(job_id=self.job.id).count, 1)
+
+
+class LogArchiveTest(TestCase):
+    lines = [
+        b"2025-01-01 00:00:00 [scrapy.core.engine] INFO: Spider opened",
+        b"2025-01-01 00:00:01 [scrapy.core.scraper] ERROR: Spider error processing <GET http://example.com/1>",
+        b"2025-01-01 00:00:02 [scrapy.core.engine] WARNING: slow response",
+        b"2025-01-01 00:00:03 [scrapy.core.engine] INFO: Closing spider (finished)",
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.enterContext(override_settings(SCRAPYD_MANAGER={"LOG_CACHE_DIR": directory.name, "LOG_ARCHIVE_BLOCK_SIZE": 100}))
+        self.content = b"\n".join(self.lines * 5) + b"\n"
+        self.spider = create_spider()
+        self.job = create_job(self.spider, "job-1", log_url="/logs/demo/s1/job-1.log", end_time=timezone.now())
+
+    def write(self, path, content, block_size=100):
+        writer = logs.BlockWriter(path, block_size=block_size)
+        for i in range(0, len(content), 37):
+            writer.write(content[i:i + 37])
+        writer.close()
+        return writer
+
+    def test_block_writer_round_trip(self):
+        path = f"{self.directory}/a/job.logz"
+        writer = self.write(path, self.content)
+        self.assertEqual(writer.size, len(self.content))
+        self.assertEqual(sorted(os.listdir(f"{self.directory}/a")), ["job.logz", "job.logz.idx"])
+        with logs.ArchivedLog(path) as log:
+            self.assertGreater(log.blocks, 5)
+            self.assertEqual(log.size, len(self.content))
+            self.assertEqual(log.read(0, log.size), self.content)
+            for offset, size in ((0, 10), (95, 20), (150, 300), (len(self.content) - 5, 100)):
+                self.assertEqual(log.read(offset, size), self.content[offset:offset + size])
+            self.assertEqual(log.read(log.size, 10), b"")
+            # 块在换行处切分
+            for i in range(log.blocks):
+                self.assertTrue(log.block(i)[1].endswith(b"\n"))
+
+    def test_grep(self):
+        path = f"{self.directory}/job.logz"
+        self.write(path, self.content)
+        with logs.ArchivedLog(path) as log:
+            errors = log.grep(levels=logs.LEVEL_FLAGS[b"ERROR"])
+            self.assertEqual([line for _, line in errors], [self.lines[1]] * 5)
+            for offset, line in errors:
+                self.assertEqual(log.read(offset, len(line)), line)
+            self.assertEqual(len(log.grep(rb"Closing|slow", limit=3)), 3)
+            self.assertEqual(len(log.grep(rb"Closing", levels=logs.LEVEL_FLAGS[b"WARNING"])), 0)
+            with self.assertRaises(ValueError):
+                log.grep(b"[unclosed")
+
+    def test_empty_log(self):
+        path = f"{self.directory}/empty.logz"
+        self.write(path, b"")
+        with logs.ArchivedLog(path) as log:
+            self.assertEqual((log.blocks, log.size, log.read(0, 10), log.grep(b"x")), (0, 0, b"", []))
+
+    def test_concurrent_writers_use_own_temp_files(self):
+        path = f"{self.directory}/job.logz"
+        first, second = logs.BlockWriter(path), logs.BlockWriter(path)
+        self.assertNotEqual(first.temp_paths, second.temp_paths)
+        first.write(b"first\n")
+        second.write(b"second\n")
+        second.abort()
+        first.close()
+        self.assertEqual(sorted(os.listdir(self.directory)), ["job.logz", "job.logz.idx"])
+        with logs.ArchivedLog(path) as log:
+            self.assertEqual(log.read(0, 100), b"first\n")
+
+    def test_archive_job_log(self):
+        with mock.patch.object(scrapyd_api, "request_job_file", side_effect=RemoteFile(self.content)):
+            state = logs.archive_job_log(self.job)
+        self.assertEqual((state.archive_size, state.archive_error), (len(self.content), None))
+        self.assertTrue(logs.has_archive(state))
+        self.assertEqual(models.LogErrorOccurrence.objects.get(job_id=self.job.id).count, 5)
+        with logs.ArchivedLog(state.archive_path) as log:
+            self.assertEqual(log.read(0, log.size), self.content)
+
+    def test_scheduler_backs_off_failed_jobs(self):
+        other = create_job(self.spider, "job-2", log_url="/logs/demo/s1/job-2.log", end_time=timezone.now() - timedelta(hours=1))
+        scheduler = logs.LogArchiveScheduler()
+        with mock.patch.object(logs, "archive_job_log", side_effect=ConnectionError("down")) as archive, \
+                self.assertLogs("django_sched", "WARNING"):
+            scheduler.schedule(timezone.now())
+        self.assertEqual([call.args[0].id for call in archive.call_args_list], [self.job.id, other.id])
+        models.JobLogState.objects.create(job_id=self.job.id, path="x", archive_error="down")
+        with mock.patch.object(logs, "archive_job_log") as archive, self.assertLogs("django_sched", "INFO"):
+            scheduler.schedule(timezone.now())
+            self.assertEqual([call.args[0].id for call in archive.call_args_list], [other.id])
+            scheduler.schedule(timezone.now() + timedelta(hours=2))
+            self.assertEqual([call.args[0].id for call in archive.call_args_list], [other.id, self.job.id, other.id])
+
+    @override_settings(SCRAPYD_MANAGER={"GUARDIAN_LEASE_BACKEND": "db"})
+    def test_scheduler_requires_lease(self):
+        models.SchedulerLease.objects.create(name="log-archive", owner="other", token=1, expire_time=timezone.now() + timedelta(minutes=5))
+        with mock.patch.object(logs, "archive_job_log") as archive:
+            logs.LogArchiveScheduler().schedule(timezone.now())
+        archive.assert_not_called()
+
+    def test_admin_rejects_invalid_grep(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        path = logs.archive_path(self.job)
+        self.write(path, self.content)
+        models.JobLogState.objects.create(job_id=self.job.id, path="x", archive_path=path, archive_time=timezone.now())
+        url = reverse("admin:scrapy_job_log", args=[self.job.id])
+        response = self.client.get(url, {"grep": "[unclosed"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {"grep": "Closing"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.count(b"Closing spider"), 5)
+
+
+ERROR_LOG = b"""2025-01-01 00:00:00 [scrapy.core.engine] INFO: Spider opened
+2025-01-01 00:00:01 [scrapy.core.scraper] ERROR: Spider error processing <GET http://example.com/1> (referer: None)
+Traceback (most recent call last):
+  File "/usr/lib/python3/site-packages/twisted/internet/defer.py", line 857, in _runCallbacks
+    current.result = callback(current.result, *args, **kw)
+  File "/srv/app/demo/spiders/s1.py", line 20, in parse
+    price = int(response.css(".price::text").get())
+ValueError: invalid literal for int() with base 10: 'abc'
+2025-01-01 00:00:02 [scrapy.core.engine] INFO: Crawled 10 pages
+2025-01-01 00:00:03 [scrapy.core.scraper] ERROR: Spider error processing <GET http://example.com/22> (referer: None)
+Traceback (most recent call last):
+  File "/opt/other/twisted/internet/defer.py", line 857, in _runCallbacks
+    current.result = callback(current.result, *args, **kw)
+  File "/home/deploy/demo/spiders/s1.py", line 20, in parse
+    price = int(response.css(".price::text").get())
+ValueError: invalid literal for int() with base 10: 'xyz'
+2025-01-01 00:00:04 [demo.pipelines] CRITICAL: Lost connection to 10.0.0.1:5432 after 3 retries
+2025-01-01 00:00:05 [demo.pipelines] CRITICAL: Lost connection to 10.0.0.2:5432 after 5 retries
+2025-01-01 00:00:06 [scrapy.core.engine] INFO: Closing spider (finished)"""
+
+
+class ErrorParserTest(SimpleTestCase):
+
+    def parse(self, content: bytes, offset: int = 0, chunk_size: int = 7) -> list:
+        parser = logindex.ErrorParser(offset)
+        records = []
+        for i in range(0, len(content), chunk_size):
+            records += parser.feed(content[i:i + chunk_size])
+        return records + parser.close()
+
+    def summary(self, records) -> list:
+        return [(record.offset, record.level, record.signature, record.title) for record in records]
+
+    def test_records_and_signatures(self):
+        records = self.parse(ERROR_LOG)
+        self.assertEqual([record.level for record in records], ["ERROR", "ERROR", "CRITICAL", "CRITICAL"])
+        self.assertEqual([ERROR_LOG[record.offset:record.offset + 19] for record in records], [
+            b"2025-01-01 00:00:01", b"2025-01-01 00:00:03", b"2025-01-01 00:00:04", b"2025-01-01 00:00:05",
+        ])
+        first, second, third, fourth = records
+        # 同样的调用栈在不同安装路径、不同 URL 下签名相同
+        self.assertEqual(first.frames, ["internet/defer.py:_runCallbacks", "spiders/s1.py:parse"])
+        self.assertEqual(first.exception, "ValueError")
+        self.assertEqual(first.title, "ValueError: invalid literal for int() with base 10: 'abc'")
+        self.assertEqual(first.signature, second.signature)
+        # 没有 Traceback 时按去掉数字后的消息计算签名
+        self.assertEqual(third.signature, fourth.signature)
+        self.assertNotEqual(first.signature, third.signature)
+        self.assertEqual(logindex.normalize("GET <GET http://a/1> 0x1f 42"), "GET <request> <hex> <n>")
+
+    def test_chunk_boundaries(self):
+        expected = self.summary(self.parse(ERROR_LOG, chunk_size=len(ERROR_LOG)))
+        for chunk_size in (1, 13, 64, 1000):
+            self.assertEqual(self.summary(self.parse(ERROR_LOG, chunk_size=chunk_size)), expected)
+        # 结尾有换行时结果相同
+        self.assertEqual(self.summary(self.parse(ERROR_LOG + b"\n")), expected)
+
+    def test_resume_offset(self):
+        expected = self.summary(self.parse(ERROR_LOG))
+        for cut in range(0, len(ERROR_LOG), 17):
+            parser = logindex.ErrorParser()
+            records = parser.feed(ERROR_LOG[:cut])
+            # 还没结束的 ERROR 记录从它开始的位置重新解析, 已返回的记录不会重复
+            resume = parser.resume_offset
+            self.assertLessEqual(resume, cut)
+            self.assertTrue(all(record.offset < resume for record in records))
+            records += self.parse(ERROR_LOG[resume:], offset=resume)
+            self.assertEqual(self.summary(records), expected, cut)
+
+
+class ErrorIndexerTest(TestCase):
+
+    def setUp(self):
+        spider = create_spider()
+        self.jobs = [create_job(spider, f"job-{i}") for i in range(2)]
+
+    def index(self, job, content: bytes, offset: int = 0, replace: bool = False, close: bool = True):
+        indexer = logindex.ErrorIndexer(offset)
+        indexer.feed(content)
+        if close:
+            indexer.close()
+        indexer.save(job, replace=replace)
+        return indexer
+
+    def counts(self):
+        return {
+            (signature.level, signature.count, signature.job_count)
+            for signature in models.LogErrorSignature.objects.all()
+        }
+
+    def test_incremental_save(self):
+        cut = ERROR_LOG.index(b"2025-01-01 00:00:05")
+        indexer = self.index(self.jobs[0], ERROR_LOG[:cut], close=False)
+        # 最后一条 CRITICAL 还没结束, 下一次从它开始解析
+        self.assertEqual(indexer.resume_offset, ERROR_LOG.index(b"2025-01-01 00:00:04"))
+        self.assertEqual(self.counts(), {("ERROR", 2, 1)})
+        self.index(self.jobs[0], ERROR_LOG[indexer.resume_offset:], offset=indexer.resume_offset)
+        self.assertEqual(self.counts(), {("ERROR", 2, 1), ("CRITICAL", 2, 1)})
+        self.index(self.jobs[1], ERROR_LOG)
+        self.assertEqual(self.counts(), {("ERROR", 4, 2), ("CRITICAL", 4, 2)})
+        occurrence = models.LogErrorOccurrence.objects.get(job_id=self.jobs[1].id, signature__level="ERROR")
+        self.assertEqual((occurrence.count, occurrence.first_offset), (2, ERROR_LOG.index(b"2025-01-01 00:00:01")))
+
+    def test_replace_with_full_log(self):
+        self.index(self.jobs[0], ERROR_LOG)
+        self.index(self.jobs[0], ERROR_LOG)
+        self.assertEqual(self.counts(), {("ERROR", 4, 1), ("CRITICAL", 4, 1)})
+        # 归档时用完整日志替换增量累加的结果, 完整日志中已经没有的签名被移除
+        content = ERROR_LOG[:ERROR_LOG.index(b"2025-01-01 00:00:04")]
+        self.index(self.jobs[0], content, replace=True)
+        self.assertEqual(self.counts(), {("ERROR", 2, 1), ("CRITICAL", 0, 0)})
+        self.assertEqual(models.LogErrorOccurrence.objects.filter(job_id=self.jobs[0].id).count(), 1)
+        self.index(self.jobs[0], b"", replace=True)
+        self.assertEqual(self.counts(), {("ERROR", 0, 0), ("CRITICAL", 0, 0)})
+        self.assertFalse(models.LogErrorOccurrence.objects.exists())
+
+
+class PreviewItemsTest(TestCase):
+
+    def setUp(self):
+        self.job = create_job(create_spider(), "job-1", items_url="/items/demo/s1/job-1.jl")
+        self.items = [{"n": i, "name": f"item-{i}"} for i in range(10)]
+        lines = [json.dumps(item).encode() for item in self.items]
+        lines.insert(3, b"not json")
+        # 最后一行没有换行
+        self.remote = RemoteFile(b"\n".join(lines))
+        self.enterContext(mock.patch.object(scrapyd_api, "request_job_file", side_effect=self.remote))
+
+    def test_head(self):
+        preview = feeds.preview_items(self.job, limit=4)
+        self.assertEqual(preview["items"], self.items[:4])
+        # 文件小于一个块时已经完整读取
+        self.assertEqual((preview["invalid"], preview["start"], preview["truncated"]), (1, 0, False))
+        self.assertEqual(self.remote.calls, [(None, None)])
+        preview = feeds.preview_items(self.job, limit=100)
+        self.assertEqual(preview["items"], self.items)
+        self.assertEqual((preview["bytes"], preview["total"], preview["truncated"]), (len(self.remote.content),) * 2 + (False,))
+
+    def test_head_stops_at_max_bytes(self):
+        preview = feeds.preview_items(self.job, limit=100, max_bytes=60)
+        self.assertEqual(preview["items"], self.items[:2])
+        self.assertEqual((preview["bytes"], preview["truncated"]), (60, True))
+
+    def test_tail(self):
+        preview = feeds.preview_items(self.job, limit=3, max_bytes=100, tail=True)
+        self.assertEqual(preview["items"], self.items[-3:])
+        self.assertEqual(self.remote.calls, [(None, 100)])
+        self.assertEqual((preview["start"], preview["total"], preview["truncated"]), (len(self.remote.content) - 100, len(self.remote.content), True))
+        # 第一行不完整时丢弃, 不计入无法解析的行数
+        preview = feeds.preview_items(self.job, limit=100, max_bytes=100, tail=True)
+        self.assertEqual(preview["invalid"], 0)
+        self.assertEqual(preview["items"], self.items[-len(preview["items"]):])
+        self.assertEqual(feeds.preview_items(self.job, limit=0, tail=True)["items"], [])
+
+    def test_tail_when_range_is_ignored(self):
+        self.remote.ignore_range = True
+        preview = feeds.preview_items(self.job, limit=3, max_bytes=100, tail=True)
+        self.assertEqual((preview["start"], preview["items"]), (0, self.items[:3]))
+
+    def test_empty_file(self):
+        self.remote.content = b""
+        preview = feeds.preview_items(self.job, tail=True)
+        self.assertEqual((preview["items"], preview["total"], preview["truncated"]), ([], 0, False))
+
+    def test_admin_limit(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        url = reverse("admin:scrapy_job_items", args=[self.job.id])
+        for params, expected in (({"limit": "0", "tail": "1"}, self.items[-1:]), ({"limit": "0"}, self.items[:1]), ({"limit": "2"}, self.items[:2])):
+            response = self.client.get(url, params | {"format": "json"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["items"], expected)
+
+    def test_admin_page(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "admin"))
+        response = self.client.get(reverse("admin:scrapy_job_items", args=[self.job.id]), {"limit": "2", "tail": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "admin/django_scrapyd_manager/job/preview_items.html")
+        self.assertEqual(response.context["items"], [json.dumps(item, indent=2) for item in self.items[-2:]])
+        self.assertContains(response, "1行无法解析")
+        self.assertContains(response, "&quot;item-9&quot;")
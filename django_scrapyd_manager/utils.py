@@ -1,7 +1,36 @@
 import hashlib
+from django.conf import settings
+from django.db import connections, router
 
 
 def get_md5(string: str):
     m = hashlib.md5()
     m.update(string.encode('utf-8'))
     return m.hexdigest()
+
+
+def get_setting(name: str, default=None):
+    """读取 settings.SCRAPYD_MANAGER 中的配置项"""
+    return getattr(settings, "SCRAPYD_MANAGER", {}).get(name, default)
+
+
+def bulk_upsert(model, objs: list, unique_fields: list[str], update_fields: list[str], batch_size: int = 500):
+    """
+    按唯一键批量插入或更新
+    - PostgreSQL/SQLite: INSERT ... ON CONFLICT (unique_fields) DO UPDATE
+    - MySQL: INSERT ... ON DUPLICATE KEY UPDATE, 不能指定冲突字段, 由表上的唯一索引决定
+    - 其他数据库: 先忽略冲突插入, 再逐条更新
+    """
+    if not objs:
+        return
+    features = connections[router.db_for_write(model)].features
+    if features.supports_update_conflicts_with_target:
+        model.objects.bulk_create(objs, batch_size=batch_size, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+    elif features.supports_update_conflicts:
+        model.objects.bulk_create(objs, batch_size=batch_size, update_conflicts=True, update_fields=update_fields)
+    else:
+        model.objects.bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
+        attnames = {field: model._meta.get_field(field).attname for field in [*unique_fields, *update_fields]}
+        for obj in objs:
+            lookup = {attnames[field]: getattr(obj, attnames[field]) for field in unique_fields}
+            model.objects.filter(**lookup).update(**{field: getattr(obj, attnames[field]) for field in update_fields})
@@ -29,7 +29,13 @@ ALLOWED_HOSTS = []
 
 DJANGO_SCHED = {
     "SCHEDULERS": {
-        "django_scrapyd_manager.guardian.GuardianScheduler": {}
+        "django_scrapyd_manager.guardian.GuardianScheduler": {},
+        "django_scrapyd_manager.dispatcher.DispatchScheduler": {},
+        "django_scrapyd_manager.retention.RetentionScheduler": {},
+        "django_scrapyd_manager.eggs.EggScanScheduler": {},
+        "django_scrapyd_manager.samples.JobSampleScheduler": {},
+        "django_scrapyd_manager.rollups.ThroughputRollupScheduler": {},
+        "django_scrapyd_manager.logs.LogArchiveScheduler": {},
     },
     "LOGGING_LEVEL": "ERROR",
 }